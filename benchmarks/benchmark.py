@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""Throughput benchmark for pyTGA.
+
+Generates synthetic images for every supported type (2, 3, 10, 11) and
+depth (8, 16, 24, 32 bit) at several sizes, then measures the main
+operations of the module:
+
+    - Image.check
+    - Image.save
+    - Image.load
+    - Image._encode_row (all the rows of the image)
+    - pixel access (get_pixel over every pixel)
+
+Two kinds of content are generated for each configuration:
+
+    - solid: a single color, best case for the RLE compression
+    - alternating: two colors alternated pixel by pixel, worst case for
+      the RLE compression
+
+Results are reported in megapixels per second (MP/s) together with the
+peak memory allocated during the operation. A run can be stored as
+baseline and later runs can be compared with it to catch regressions.
+
+Usage:
+    python benchmarks/benchmark.py
+    python benchmarks/benchmark.py --sizes 64 256 --save-baseline base.json
+    python benchmarks/benchmark.py --baseline base.json --tolerance 0.2
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import pyTGA  # noqa: E402
+
+timer = time.perf_counter
+
+##
+# Configurations: name -> (image type, pixel depth, save options)
+#
+CONFIGS = [
+    ("type3_8", 3, 8, {}),
+    ("type2_16", 2, 16, {'force_16_bit': True}),
+    ("type2_24", 2, 24, {}),
+    ("type2_32", 2, 32, {}),
+    ("type11_8", 11, 8, {'compress': True}),
+    ("type10_16", 10, 16, {'compress': True, 'force_16_bit': True}),
+    ("type10_24", 10, 24, {'compress': True}),
+    ("type10_32", 10, 32, {'compress': True}),
+]
+
+CONTENTS = ("solid", "alternating")
+
+OPERATIONS = ("check", "save", "load", "encode", "get_pixel")
+
+
+def gen_colors(depth):
+    """Return the two colors used to generate the content.
+
+    Args:
+        depth (int): pixel depth of the image
+
+    Returns:
+        tuple: two pixel values compatible with the given depth
+    """
+    if depth == 8:
+        return (200, 17)
+    elif depth == 16:
+        return ((31, 10, 0), (0, 21, 31))
+    elif depth == 24:
+        return ((255, 128, 0), (0, 64, 255))
+    return ((255, 128, 0, 255), (0, 64, 255, 100))
+
+
+def gen_data(width, height, depth, content):
+    """Generate the synthetic pixel data.
+
+    Args:
+        width (int): width of the image
+        height (int): height of the image
+        depth (int): pixel depth of the image
+        content (string): 'solid' or 'alternating'
+
+    Returns:
+        list of list: pixel data accepted by pyTGA.Image
+    """
+    first, second = gen_colors(depth)
+    if content == "solid":
+        return [[first] * width for _ in range(height)]
+    row_a = [first if col % 2 == 0 else second for col in range(width)]
+    row_b = [second if col % 2 == 0 else first for col in range(width)]
+    return [list(row_a if row % 2 == 0 else row_b) for row in range(height)]
+
+
+def measure(func, repeat):
+    """Measure the best time and the peak memory of a function.
+
+    Args:
+        func (callable): function to measure
+        repeat (int): number of timed runs
+
+    Returns:
+        tuple(float, int): best time in seconds and peak memory in bytes
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = timer()
+        func()
+        elapsed = timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return best, peak
+
+
+def run(sizes, repeat, workdir, configs=None, contents=CONTENTS):
+    """Run the benchmark.
+
+    Args:
+        sizes (list of int): side of the square images to test
+        repeat (int): number of timed runs for each operation
+        workdir (string): directory used for the saved images
+        configs (list of string): restrict the run to these configurations
+        contents (list of string): contents to generate
+
+    Returns:
+        dict: results keyed by 'config/content/size/operation'
+    """
+    results = {}
+    for name, image_type, depth, options in CONFIGS:
+        if configs and name not in configs:
+            continue
+        for content in contents:
+            for size in sizes:
+                data = gen_data(size, size, depth, content)
+                image = pyTGA.Image(data=data)
+                base_name = os.path.join(
+                    workdir, "{0}_{1}_{2}".format(name, content, size))
+                file_name = base_name + ".tga"
+                image.save(base_name, **options)
+                loaded = pyTGA.Image()
+
+                def op_encode():
+                    for row in range(size):
+                        image._encode_row(row, image._header)
+
+                def op_get_pixel():
+                    for row in range(size):
+                        for col in range(size):
+                            image.get_pixel(row, col)
+
+                operations = {
+                    'check': lambda: pyTGA.Image.check(data),
+                    'save': lambda: image.save(base_name, **options),
+                    'load': lambda: loaded.load(file_name),
+                    'encode': op_encode,
+                    'get_pixel': op_get_pixel,
+                }
+
+                for operation in OPERATIONS:
+                    seconds, peak = measure(operations[operation], repeat)
+                    megapixels = size * size / 1e6
+                    key = "/".join((name, content, str(size), operation))
+                    results[key] = {
+                        'seconds': seconds,
+                        'mps': megapixels / seconds if seconds else float('inf'),
+                        'peak_bytes': peak,
+                        'file_size': os.path.getsize(file_name),
+                    }
+                    print("{0:<40s} {1:>10.3f} MP/s {2:>12s}".format(
+                        key, results[key]['mps'],
+                        format_bytes(peak)))
+                    sys.stdout.flush()
+    return results
+
+
+def format_bytes(num):
+    """Format a number of bytes in a human readable way."""
+    for unit in ("B", "KiB", "MiB"):
+        if num < 1024:
+            return "{0:.1f} {1}".format(num, unit)
+        num /= 1024.0
+    return "{0:.1f} GiB".format(num)
+
+
+def compare(results, baseline, tolerance):
+    """Compare the results with a baseline.
+
+    Args:
+        results (dict): results of the current run
+        baseline (dict): results of a previous run
+        tolerance (float): allowed relative slowdown (0.1 -> 10%)
+
+    Returns:
+        list of string: the regressions found
+    """
+    regressions = []
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        old = baseline[key]
+        if result['mps'] < old['mps'] * (1.0 - tolerance):
+            regressions.append(
+                "{0}: {1:.3f} MP/s -> {2:.3f} MP/s ({3:+.1f}%)".format(
+                    key, old['mps'], result['mps'],
+                    (result['mps'] / old['mps'] - 1.0) * 100.0))
+        if old.get('peak_bytes') and \
+                result['peak_bytes'] > old['peak_bytes'] * (1.0 + tolerance):
+            regressions.append(
+                "{0}: peak memory {1} -> {2}".format(
+                    key, format_bytes(old['peak_bytes']),
+                    format_bytes(result['peak_bytes'])))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="pyTGA benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 256],
+                        help="side of the square images (default: 64 256)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="timed runs for each operation (default: 3)")
+    parser.add_argument("--configs", nargs="+", default=None,
+                        choices=[config[0] for config in CONFIGS],
+                        help="restrict the run to these configurations")
+    parser.add_argument("--contents", nargs="+", default=list(CONTENTS),
+                        choices=CONTENTS, help="content to generate")
+    parser.add_argument("--backend", default=None,
+                        choices=["python", "numpy"],
+                        help="pixel codec backend (default: automatic)")
+    parser.add_argument("--output", default=None,
+                        help="write the results as JSON in this file")
+    parser.add_argument("--save-baseline", default=None,
+                        help="store the results as baseline in this file")
+    parser.add_argument("--baseline", default=None,
+                        help="compare the results with this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="allowed relative slowdown (default: 0.1)")
+    args = parser.parse_args(argv)
+
+    if args.backend is not None:
+        pyTGA.set_backend(args.backend)
+    print("Backend: {0}".format(pyTGA.get_backend().name))
+
+    workdir = tempfile.mkdtemp(prefix="pytga_bench_")
+    try:
+        results = run(args.sizes, args.repeat, workdir,
+                      args.configs, args.contents)
+    finally:
+        shutil.rmtree(workdir)
+
+    for file_name in (args.output, args.save_baseline):
+        if file_name is not None:
+            with open(file_name, "w") as output_file:
+                json.dump(results, output_file, indent=2, sort_keys=True)
+
+    if args.baseline is not None:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:")
+            for regression in regressions:
+                print("  " + regression)
+            return 1
+        print("\nNo regressions compared to {0}".format(args.baseline))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1 +1,18 @@
-from . tga import *
\ No newline at end of file
+import importlib
+
+from . tga import *
+from . cache import ImageCache
+from . import rle
+from . analysis import stats
+
+# Submodules that import json, sqlite3, concurrent.futures or
+# multiprocessing are loaded the first time they are used, to keep
+# 'import pyTGA' fast
+_LAZY_MODULES = ('atlas', 'index', 'sequence', 'parallel')
+
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError(
+        "module {0!r} has no attribute {1!r}".format(__name__, name))
@@ -0,0 +1,234 @@
+"""Statistics of the pixels of TGA files computed while decoding.
+
+The pixels are never stored in an Image: uncompressed data and raw packets
+are counted in batches of bounded size, run-length packets are counted once
+with the length of the run as weight. Minimum, maximum and mean come from
+the histograms, so the memory used does not depend on the size of the image.
+
+Example:
+    info = stats("texture.tga")
+    print(info['mean'], info['alpha_bbox'])
+"""
+import mmap
+
+from .backends import get_backend
+from .tga import ImageError, TGAHeader, _matrix_type
+
+__all__ = ["stats"]
+
+CHANNELS = {
+    1: ('L',),
+    3: ('R', 'G', 'B'),
+    4: ('R', 'G', 'B', 'A'),
+}
+
+
+def _matrix_pixel(pixel, pixel_depht):
+    """Convert a pixel from the file format to the channels of the matrix.
+
+    Args:
+        pixel (bytes): the pixel in the file format
+        pixel_depht (int): the pixel depth of the image (8, 16, 24 or 32)
+
+    Returns:
+        tuple: the value of each channel
+    """
+    if pixel_depht == 8:
+        return (pixel[0],)
+    elif pixel_depht == 16:
+        value = pixel[0] | (pixel[1] << 8)
+        return ((value >> 11) & 0b11111, (value >> 6) & 0b11111,
+                (value >> 1) & 0b11111)
+    elif pixel_depht == 24:
+        return (pixel[2], pixel[1], pixel[0])
+    return (pixel[2], pixel[1], pixel[0], pixel[3])
+
+
+class _Collector(object):
+
+    """Accumulate histograms and alpha bounding box of a stream of pixels."""
+
+    def __init__(self, header, batch_size):
+        self.width = header.image_width
+        self.pixel_depht = header.pixel_depht
+        self.pixel_size = header.bytes_per_pixel
+        self.channels = len(_matrix_type(header))
+        self.counts = [[0] * 256 for _ in range(self.channels)]
+        # Columns and rows with alpha > 0: [left, top, right, bottom]
+        self.bbox = None
+        self.batch_size = batch_size
+        self.__pending = bytearray()
+        self.__backend = get_backend()
+
+    def __extend_bbox(self, left, top, right, bottom):
+        if self.bbox is None:
+            self.bbox = [left, top, right, bottom]
+        else:
+            self.bbox = [min(self.bbox[0], left), min(self.bbox[1], top),
+                         max(self.bbox[2], right), max(self.bbox[3], bottom)]
+
+    def flush(self):
+        """Count the pixels waiting in the batch."""
+        if self.__pending:
+            self.__backend.histogram(
+                self.__backend.to_matrix(self.__pending, self.pixel_depht),
+                self.channels, self.counts)
+            del self.__pending[:]
+
+    def add_pixels(self, data, index):
+        """Add uncompressed pixels.
+
+        Args:
+            data (bytes): the pixels in the file format
+            index (int): position in the image of the first pixel
+        """
+        self.__pending += data
+        if len(self.__pending) >= self.batch_size:
+            self.flush()
+
+        if self.channels != 4:
+            return
+        ##
+        # Alpha bounding box, one row at a time
+        #
+        pixels = len(data) // 4
+        done = 0
+        while done < pixels:
+            row, col = divmod(index + done, self.width)
+            count = min(self.width - col, pixels - done)
+            alpha = bytes(data[done * 4 + 3:(done + count) * 4:4])
+            visible = alpha.lstrip(b'\0')
+            if visible:
+                self.__extend_bbox(col + count - len(visible), row,
+                                   col + len(alpha.rstrip(b'\0')) - 1, row)
+            done += count
+
+    def add_run(self, pixel, count, index):
+        """Add the pixels of a run-length packet.
+
+        Args:
+            pixel (bytes): the repeated pixel in the file format
+            count (int): length of the run
+            index (int): position in the image of the first pixel
+        """
+        values = _matrix_pixel(pixel, self.pixel_depht)
+        for channel, value in enumerate(values):
+            self.counts[channel][value] += count
+
+        if self.channels == 4 and values[3]:
+            first_row, first_col = divmod(index, self.width)
+            last_row, last_col = divmod(index + count - 1, self.width)
+            if first_row == last_row:
+                self.__extend_bbox(first_col, first_row, last_col, last_row)
+            else:
+                self.__extend_bbox(0, first_row, self.width - 1, last_row)
+
+
+def stats(file_name, batch_size=1 << 20):
+    """Compute the statistics of the pixels of a TGA image.
+
+    Values are the ones of 'get_pixel': RGB(A) order and 5 bit channels for
+    16 bit images.
+
+    Args:
+        file_name (string): the name of the TGA image
+        batch_size (int): maximum size in bytes of the uncompressed pixels
+            counted together
+
+    Returns:
+        dict: width, height, channels (names of the channels), histograms
+            (256 counts for each channel), min, max and mean (one value for
+            each channel, None for an empty image), alpha_bbox ((x, y,
+            width, height) of the pixels with alpha greater than 0, None if
+            there are none or the image has no alpha), run_packets and
+            raw_packets
+
+    Raises:
+        ImageError
+    """
+    with open(file_name, "rb") as image_file:
+        data = image_file.read(18)
+        if len(data) < 18:
+            raise ImageError("file ends in the header", 'truncated_data')
+        header = TGAHeader().from_bytes(data)
+        collector = _Collector(header, batch_size)
+        pixel_size = header.bytes_per_pixel
+        total = header.image_width * header.image_height
+        start = header.data_offset
+        run_packets = raw_packets = 0
+
+        mapped = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            with memoryview(mapped) as view:
+                end = len(view)
+                if header.image_type in (2, 3):
+                    if start + total * pixel_size > end:
+                        raise ImageError(
+                            "pixel data ends before the last pixel",
+                            'truncated_data')
+                    step = max(batch_size // pixel_size, 1)
+                    for index in range(0, total, step):
+                        count = min(step, total - index)
+                        collector.add_pixels(
+                            view[start + index * pixel_size:
+                                 start + (index + count) * pixel_size],
+                            index)
+                else:
+                    pos = start
+                    index = 0
+                    while index < total:
+                        if pos >= end:
+                            raise ImageError(
+                                "pixel data ends before the last pixel",
+                                'truncated_data')
+                        repetition_count = view[pos]
+                        count = min((repetition_count & 0b01111111) + 1,
+                                    total - index)
+                        pos += 1
+                        if repetition_count & 0b10000000:
+                            size = pixel_size
+                            run_packets += 1
+                        else:
+                            size = pixel_size * count
+                            raw_packets += 1
+                        if pos + size > end:
+                            raise ImageError(
+                                "pixel data ends before the last pixel",
+                                'truncated_data')
+                        if repetition_count & 0b10000000:
+                            collector.add_run(view[pos:pos + size], count,
+                                              index)
+                        else:
+                            collector.add_pixels(view[pos:pos + size], index)
+                        pos += size
+                        index += count
+                collector.flush()
+        finally:
+            mapped.close()
+
+    counts = collector.counts
+    if total:
+        minimum = tuple(next(value for value in range(256) if channel[value])
+                        for channel in counts)
+        maximum = tuple(next(value for value in range(255, -1, -1)
+                             if channel[value])
+                        for channel in counts)
+        mean = tuple(sum(value * count for value, count in enumerate(channel))
+                     / float(total) for channel in counts)
+    else:
+        minimum = maximum = mean = None
+
+    bbox = collector.bbox
+    return {
+        'width': header.image_width,
+        'height': header.image_height,
+        'channels': CHANNELS[collector.channels],
+        'histograms': counts,
+        'min': minimum,
+        'max': maximum,
+        'mean': mean,
+        'alpha_bbox': None if bbox is None else (
+            bbox[0], bbox[1], bbox[2] - bbox[0] + 1, bbox[3] - bbox[1] + 1),
+        'run_packets': run_packets,
+        'raw_packets': raw_packets,
+    }
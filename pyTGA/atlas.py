@@ -0,0 +1,198 @@
+"""Texture atlas builder.
+
+Many small images (sprites) are packed in one or more big images (atlases)
+with a shelf bin packing, copying the sprites with region copies. The
+position of each sprite is stored in a compact JSON index so a single
+sprite can be read back from an uncompressed atlas reading only its rows.
+
+Example:
+    atlases, index = atlas.build({'hero': hero, 'coin': coin})
+    atlas.save("sprites", atlases, index)
+    coin = atlas.read_sprite("sprites.json", 'coin')
+"""
+import json
+import os
+
+from .backends import get_backend
+from .tga import Image, ImageError, TGAHeader, _matrix_type
+
+__all__ = ["build", "save", "load_index", "read_sprite"]
+
+
+def _pack_shelves(sizes, max_width, max_height, padding):
+    """Place rectangles in bins with a shelf packing.
+
+    Rectangles are sorted by height and put on horizontal shelves; a new
+    shelf starts when a rectangle does not fit in the current one and a new
+    bin starts when a shelf does not fit in the current bin.
+
+    Args:
+        sizes (dict): {name: (width, height)}
+        max_width (int): width of a bin
+        max_height (int): height of a bin
+        padding (int): free pixels around each rectangle
+
+    Returns:
+        tuple: {name: (bin, x, y)} and the list of (width, height) used in
+            each bin
+    """
+    positions = {}
+    bins = []
+    shelf_x = shelf_y = shelf_height = 0
+
+    for name in sorted(sizes, key=lambda name: (-sizes[name][1],
+                                                -sizes[name][0], name)):
+        width, height = sizes[name]
+        if width + padding > max_width or height + padding > max_height:
+            raise ImageError(
+                "sprite '{0}' of size {1}x{2} does not fit in the atlas".format(
+                    name, width, height),
+                'bad_pixel_position'
+            )
+        if not bins:
+            bins.append([0, 0])
+        if shelf_x + width + padding > max_width:
+            # New shelf
+            shelf_y += shelf_height
+            shelf_x = shelf_height = 0
+        if shelf_y + height + padding > max_height:
+            # New bin
+            bins.append([0, 0])
+            shelf_x = shelf_y = shelf_height = 0
+        positions[name] = (len(bins) - 1, shelf_x, shelf_y)
+        shelf_x += width + padding
+        shelf_height = max(shelf_height, height + padding)
+        bins[-1][0] = max(bins[-1][0], shelf_x)
+        bins[-1][1] = max(bins[-1][1], shelf_y + shelf_height)
+
+    return positions, [tuple(size) for size in bins]
+
+
+def build(images, max_width=2048, max_height=2048, padding=0):
+    """Pack many images in atlases.
+
+    All the images must have the same kind of pixels (BW, RGB or RGBA).
+
+    Args:
+        images (dict): {name: Image} of the sprites
+        max_width (int): maximum width of an atlas
+        max_height (int): maximum height of an atlas
+        padding (int): free pixels between the sprites
+
+    Returns:
+        tuple: the list of atlas images and the index
+            {name: (atlas, x, y, width, height)}
+
+    Raises:
+        ImageError
+    """
+    sizes = dict((name, image.get_size()) for name, image in images.items())
+    positions, bins = _pack_shelves(sizes, max_width, max_height, padding)
+
+    blank = 0
+    if images:
+        sample = next(iter(images.values())).get_pixel(0, 0)
+        if isinstance(sample, tuple):
+            blank = (0,) * len(sample)
+
+    atlases = [Image.new(width, height, blank) for width, height in bins]
+    index = {}
+    for name, (num, col, row) in positions.items():
+        atlases[num].paste(images[name], row, col)
+        index[name] = (num, col, row) + sizes[name]
+
+    return atlases, index
+
+
+def save(base_name, atlases, index, **kwargs):
+    """Save the atlases and the index.
+
+    Atlases are saved as 'base_name_N.tga' and the index as 'base_name.json'.
+    Keep the atlases uncompressed to use 'read_sprite'.
+
+    Args:
+        base_name (string): the name without extension of the files
+        atlases (list of Image): the atlases returned by 'build'
+        index (dict): the index returned by 'build'
+        **kwargs: options passed to 'Image.save'
+
+    Returns:
+        string: the name of the index file
+    """
+    names = []
+    for num, atlas in enumerate(atlases):
+        name = "{0}_{1}".format(base_name, num)
+        atlas.save(name, **kwargs)
+        names.append(os.path.basename(name) + ".tga")
+
+    index_name = "{0}.json".format(base_name)
+    with open(index_name, "w") as index_file:
+        json.dump({'atlases': names,
+                   'sprites': dict((name, list(rect))
+                                   for name, rect in index.items())},
+                  index_file, separators=(',', ':'), sort_keys=True)
+
+    return index_name
+
+
+def load_index(index_name):
+    """Load an index saved with 'save'.
+
+    Args:
+        index_name (string): the name of the index file
+
+    Returns:
+        tuple: the list of atlas file names (with the path of the index) and
+            the index {name: (atlas, x, y, width, height)}
+    """
+    with open(index_name) as index_file:
+        content = json.load(index_file)
+    path = os.path.dirname(index_name)
+    return ([os.path.join(path, name) for name in content['atlases']],
+            dict((name, tuple(rect))
+                 for name, rect in content['sprites'].items()))
+
+
+def read_sprite(index_name, name):
+    """Read a sprite from an uncompressed atlas.
+
+    Only the rows of the sprite are read from the atlas file.
+
+    Args:
+        index_name (string): the name of the index file
+        name (string): the name of the sprite
+
+    Returns:
+        Image
+
+    Raises:
+        ImageError
+    """
+    atlases, index = load_index(index_name)
+    num, col, row, width, height = index[name]
+
+    with open(atlases[num], "rb") as atlas_file:
+        data = atlas_file.read(18)
+        if len(data) < 18:
+            raise ImageError("file ends in the header", 'truncated_data')
+        header = TGAHeader().from_bytes(data)
+        if header.image_type not in (2, 3):
+            raise ImageError(
+                "type num '{0}'' is not supported".format(header.image_type),
+                'non_supported_type'
+            )
+        pixel_size = header.bytes_per_pixel
+        row_size = width * pixel_size
+        data = bytearray()
+        for index_row in range(row, row + height):
+            atlas_file.seek(header.data_offset + pixel_size *
+                            (index_row * header.image_width + col))
+            data_row = atlas_file.read(row_size)
+            if len(data_row) < row_size:
+                raise ImageError("pixel data ends before the last pixel",
+                                 'truncated_data')
+            data += data_row
+
+    return Image._from_bytes(
+        width, height, _matrix_type(header),
+        get_backend().to_matrix(data, header.pixel_depht))
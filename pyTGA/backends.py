@@ -0,0 +1,501 @@
+"""Pixel codecs of pyTGA.
+
+The conversions between the pixels stored in a TGA file and the pixels of a
+PixelMatrix are implemented by a backend:
+
+    - parse_header: decode the 18 bytes of the header
+    - to_matrix / from_matrix: convert uncompressed pixels (BGR(A) order and
+      16 bit packing in the file, RGB(A) order and 5 bit channels in the
+      matrix)
+    - rle_decode / rle_encode: expand and compress the RLE packets
+    - histogram: count the values of each channel of the matrix pixels
+    - composite: draw RGBA pixels over RGB(A) pixels
+
+The pure Python backend is always available. The NumPy backend gives the same
+bytes with vectorized operations and is chosen automatically, the first time
+a backend is needed, if NumPy can be imported. Set the environment variable
+PYTGA_BACKEND ('python', 'numpy' or 'auto') or call 'set_backend' to choose
+another one.
+"""
+import os
+from collections import Counter
+from struct import Struct, pack
+
+__all__ = ["PythonBackend", "NumpyBackend", "get_backend", "set_backend"]
+
+_HEADER = Struct('<BBBHHBHHHHBB')
+
+_MUL_TABLE = []
+
+
+def _mul_table():
+    """Table of the products of 8 bit values: table[a][b] = a * b / 255."""
+    if not _MUL_TABLE:
+        _MUL_TABLE.extend(
+            [(alpha * value + 127) // 255 for value in range(256)]
+            for alpha in range(256))
+    return _MUL_TABLE
+
+
+def _composite_row(src, dst, dst_alpha, premultiplied):
+    """Draw a row of RGBA pixels over a row of RGB(A) pixels (operator over).
+
+    Args:
+        src (bytearray): the source pixels (RGBA)
+        dst (bytearray): the destination pixels, changed in place
+        dst_alpha (bool): the destination pixels are RGBA
+        premultiplied (bool): colors are premultiplied by alpha
+    """
+    mul = _mul_table()
+    dst_size = 4 if dst_alpha else 3
+    alphas = src[3::4]
+    width = len(alphas)
+    index = 0
+    while index < width:
+        alpha = alphas[index]
+        start = index
+        if alpha == 0:
+            # Transparent span: nothing to do
+            while index < width and alphas[index] == 0:
+                index += 1
+            continue
+        if alpha == 255:
+            # Opaque span: copy the source
+            while index < width and alphas[index] == 255:
+                index += 1
+            if dst_alpha:
+                dst[start * 4:index * 4] = src[start * 4:index * 4]
+            else:
+                for channel in range(3):
+                    dst[start * 3 + channel:index * 3:3] = \
+                        src[start * 4 + channel:index * 4:4]
+            continue
+
+        inv = mul[255 - alpha]
+        pos_src = start * 4
+        pos_dst = start * dst_size
+        if premultiplied:
+            for channel in range(dst_size):
+                dst[pos_dst + channel] = min(
+                    255, src[pos_src + channel] + inv[dst[pos_dst + channel]])
+        elif not dst_alpha:
+            direct = mul[alpha]
+            for channel in range(3):
+                dst[pos_dst + channel] = min(
+                    255, direct[src[pos_src + channel]] +
+                    inv[dst[pos_dst + channel]])
+        else:
+            dst_a = dst[pos_dst + 3]
+            out = alpha * 255 + dst_a * (255 - alpha)
+            for channel in range(3):
+                dst[pos_dst + channel] = (
+                    src[pos_src + channel] * alpha * 255 +
+                    dst[pos_dst + channel] * dst_a * (255 - alpha) +
+                    out // 2) // out
+            dst[pos_dst + 3] = (out + 127) // 255
+        index += 1
+
+
+class PythonBackend(object):
+
+    """Pure Python implementation of the pixel codecs."""
+
+    name = 'python'
+
+    def parse_header(self, data):
+        """Decode a TGA header.
+
+        Args:
+            data (bytes[18]): the header read from a file
+
+        Returns:
+            tuple: the 12 fields of the header (see TGAHeader.FIELDS)
+        """
+        return _HEADER.unpack(bytes(data[:18]))
+
+    def to_matrix(self, data, pixel_depht, out=None):
+        """Convert uncompressed pixels from the file format to the matrix one.
+
+        Args:
+            data (bytes): the pixels in the file format (BGR(A) order)
+            pixel_depht (int): the pixel depth of the image (8, 16, 24 or 32)
+            out (memoryview): writable buffer of the size of the result that
+                receives the pixels (default: a new bytearray)
+
+        Returns:
+            bytearray: the pixels as stored in a PixelMatrix (RGB(A) order),
+                or out
+        """
+        tmp = bytearray(data)
+        if pixel_depht == 24:
+            tmp[0::3], tmp[2::3] = tmp[2::3], tmp[0::3]
+        elif pixel_depht == 32:
+            tmp[0::4], tmp[2::4] = tmp[2::4], tmp[0::4]
+        elif pixel_depht == 16:
+            low = tmp[0::2]
+            high = tmp[1::2]
+            tmp = bytearray(len(low) * 3)
+            tmp[0::3] = bytearray((value >> 3) & 0b11111 for value in high)
+            tmp[1::3] = bytearray(
+                ((high_value & 0b111) << 2) | (low_value >> 6)
+                for high_value, low_value in zip(high, low))
+            tmp[2::3] = bytearray((value >> 1) & 0b11111 for value in low)
+        if out is not None:
+            out[:] = tmp
+            return out
+        return tmp
+
+    def from_matrix(self, data, pixel_depht):
+        """Convert uncompressed pixels from the matrix format to the file one.
+
+        Args:
+            data (bytes): the pixels as stored in a PixelMatrix
+            pixel_depht (int): the pixel depth of the image (8, 16, 24 or 32)
+
+        Returns:
+            bytearray: the pixels in the file format (BGR(A) order)
+        """
+        tmp = bytearray(data)
+        if pixel_depht == 24:
+            tmp[0::3], tmp[2::3] = tmp[2::3], tmp[0::3]
+        elif pixel_depht == 32:
+            tmp[0::4], tmp[2::4] = tmp[2::4], tmp[0::4]
+        elif pixel_depht == 16:
+            values = [((c_r & 0b11111) << 11) | ((c_g & 0b11111) << 6) |
+                      ((c_b & 0b11111) << 1) | 0b1
+                      for c_r, c_g, c_b in zip(tmp[0::3], tmp[1::3],
+                                               tmp[2::3])]
+            tmp = bytearray(len(values) * 2)
+            tmp[0::2] = bytearray(value & 0xFF for value in values)
+            tmp[1::2] = bytearray(value >> 8 for value in values)
+        return tmp
+
+    def rle_decode(self, data, pixel_size, width, height):
+        """Expand the RLE packets of an image.
+
+        Args:
+            data (bytes): the compressed pixel data
+            pixel_size (int): size in bytes of a pixel in the file
+            width (int): number of pixels in a row
+            height (int): number of rows
+
+        Returns:
+            tuple: the pixels in the file format (bytearray), the number of
+                bytes used, the number of run-length and raw packets and, for
+                each row, (end of the row in data, run-length packets, raw
+                packets before the end) if the row ends with a packet or
+                None if a packet continues in the next row
+        """
+        data = bytes(data)
+        tmp = bytearray()
+        total = width * height * pixel_size
+        row_size = width * pixel_size
+        rows = [None] * height
+        run_packets = 0
+        raw_packets = 0
+        pos = 0
+        while len(tmp) < total:
+            repetition_count = bytearray(data[pos:pos + 1])
+            if not repetition_count:
+                raise ValueError("RLE data ends before the last pixel")
+            repetition_count = repetition_count[0]
+            count = (repetition_count & 0b01111111) + 1
+            pos += 1
+            if repetition_count & 0b10000000:
+                tmp += data[pos:pos + pixel_size] * count
+                pos += pixel_size
+                run_packets += 1
+            else:
+                tmp += data[pos:pos + pixel_size * count]
+                pos += pixel_size * count
+                raw_packets += 1
+            if row_size and len(tmp) % row_size == 0:
+                rows[min(len(tmp) // row_size, height) - 1] = (
+                    pos, run_packets, raw_packets)
+        del tmp[total:]
+        return tmp, pos, run_packets, raw_packets, rows
+
+    def _runs(self, data, pixel_size):
+        """Find the runs of equal pixels.
+
+        Args:
+            data (bytes): the pixels in the file format
+            pixel_size (int): size in bytes of a pixel in the file
+
+        Returns:
+            list of tuple(int, int): first pixel and length of each run
+        """
+        data = bytes(data)
+        runs = []
+        last = None
+        for start in range(0, len(data), pixel_size):
+            pixel = data[start:start + pixel_size]
+            if pixel == last:
+                runs[-1][1] += 1
+            else:
+                runs.append([start // pixel_size, 1])
+                last = pixel
+        return runs
+
+    def rle_encode(self, data, pixel_size):
+        """Compress a row of pixels with RLE.
+
+        A run-length packet starts when two neighboring pixels are equal,
+        all the other pixels go in raw packets. Packets contain at most 128
+        pixels.
+
+        Args:
+            data (bytes): the pixels of the row in the file format
+            pixel_size (int): size in bytes of a pixel in the file
+
+        Returns:
+            tuple(bytes, int, int): the row compressed, the number of
+                run-length packets and the number of raw packets
+        """
+        data = bytes(data)
+        tmp = bytearray()
+        run_packets = 0
+        raw_packets = 0
+        raw_start = raw_length = 0
+
+        def flush_raw(start, length):
+            while length > 0:
+                count = min(length, 128)
+                tmp.append(count - 1)
+                tmp.extend(data[start * pixel_size:
+                                (start + count) * pixel_size])
+                start += count
+                length -= count
+
+        for start, length in self._runs(data, pixel_size):
+            if length == 1:
+                if not raw_length:
+                    raw_start = start
+                raw_length += 1
+                continue
+            if raw_length:
+                raw_packets += (raw_length + 127) // 128
+                flush_raw(raw_start, raw_length)
+                raw_length = 0
+            pixel = data[start * pixel_size:(start + 1) * pixel_size]
+            full, remainder = divmod(length, 128)
+            tmp.extend((pack('B', 0b11111111) + pixel) * full)
+            run_packets += full
+            if remainder > 1:
+                tmp.append(0b10000000 | (remainder - 1))
+                tmp.extend(pixel)
+                run_packets += 1
+            elif remainder == 1:
+                raw_start = start + length - 1
+                raw_length = 1
+
+        if raw_length:
+            raw_packets += (raw_length + 127) // 128
+            flush_raw(raw_start, raw_length)
+
+        return bytes(tmp), run_packets, raw_packets
+
+    def histogram(self, data, channels, counts):
+        """Count the values of each channel of some pixels.
+
+        Args:
+            data (bytes): the pixels as stored in a PixelMatrix
+            channels (int): number of channels of a pixel
+            counts (list of list): for each channel the 256 counts, updated
+                with the pixels
+        """
+        data = bytes(data)
+        for channel in range(channels):
+            channel_counts = counts[channel]
+            for value, count in Counter(
+                    bytearray(data[channel::channels])).items():
+                channel_counts[value] += count
+
+    def composite(self, src, dst, rows, width, dst_alpha, premultiplied):
+        """Draw RGBA pixels over RGB(A) pixels (operator over).
+
+        Fully transparent spans of the source are skipped and fully opaque
+        spans are copied.
+
+        Args:
+            src (bytes): the source pixels (RGBA)
+            dst (bytes): the destination pixels (RGB(A))
+            rows (int): number of rows
+            width (int): number of pixels in a row
+            dst_alpha (bool): the destination pixels are RGBA
+            premultiplied (bool): colors are premultiplied by alpha
+
+        Returns:
+            bytes: the destination pixels after the composition
+        """
+        result = bytearray(dst)
+        src = bytearray(src)
+        src_row_size = width * 4
+        dst_row_size = width * (4 if dst_alpha else 3)
+        for row in range(rows):
+            dst_row = result[row * dst_row_size:(row + 1) * dst_row_size]
+            _composite_row(
+                src[row * src_row_size:(row + 1) * src_row_size],
+                dst_row, dst_alpha, premultiplied)
+            result[row * dst_row_size:(row + 1) * dst_row_size] = dst_row
+        return bytes(result)
+
+
+class NumpyBackend(PythonBackend):
+
+    """Implementation of the pixel codecs vectorized with NumPy."""
+
+    name = 'numpy'
+
+    def __init__(self):
+        import numpy
+        self.__numpy = numpy
+
+    def to_matrix(self, data, pixel_depht, out=None):
+        numpy = self.__numpy
+        size = len(data) // 2 * 3 if pixel_depht == 16 else len(data)
+        result = bytearray(size) if out is None else out
+        if not size:
+            return result
+        dest = numpy.frombuffer(result, dtype=numpy.uint8)
+        if pixel_depht == 8:
+            dest[:] = numpy.frombuffer(data, dtype=numpy.uint8)
+        elif pixel_depht == 16:
+            values = numpy.frombuffer(data, dtype='<u2')
+            dest = dest.reshape(-1, 3)
+            dest[:, 0] = (values >> 11) & 0b11111
+            dest[:, 1] = (values >> 6) & 0b11111
+            dest[:, 2] = (values >> 1) & 0b11111
+        else:
+            channels = pixel_depht // 8
+            src = numpy.frombuffer(data, dtype=numpy.uint8).reshape(
+                -1, channels)
+            dest = dest.reshape(-1, channels)
+            dest[:, 0] = src[:, 2]
+            dest[:, 1] = src[:, 1]
+            dest[:, 2] = src[:, 0]
+            if channels == 4:
+                dest[:, 3] = src[:, 3]
+        return result
+
+    def from_matrix(self, data, pixel_depht):
+        numpy = self.__numpy
+        if pixel_depht == 8:
+            return bytearray(data)
+        elif pixel_depht == 16:
+            tmp = numpy.frombuffer(bytes(data), dtype=numpy.uint8).reshape(
+                -1, 3).astype('<u2') & 0b11111
+            values = (tmp[:, 0] << 11) | (tmp[:, 1] << 6) | \
+                (tmp[:, 2] << 1) | 0b1
+            return bytearray(values.astype('<u2').tobytes())
+        channels = pixel_depht // 8
+        tmp = numpy.frombuffer(bytes(data), dtype=numpy.uint8).reshape(
+            -1, channels).copy()
+        tmp[:, [0, 2]] = tmp[:, [2, 0]]
+        return bytearray(tmp.tobytes())
+
+    def _runs(self, data, pixel_size):
+        numpy = self.__numpy
+        pixels = numpy.frombuffer(bytes(data), dtype=numpy.uint8).reshape(
+            -1, pixel_size)
+        if not len(pixels):
+            return []
+        changes = numpy.any(pixels[1:] != pixels[:-1], axis=1)
+        starts = numpy.concatenate(([0], numpy.flatnonzero(changes) + 1))
+        lengths = numpy.diff(numpy.concatenate((starts, [len(pixels)])))
+        return list(zip(starts.tolist(), lengths.tolist()))
+
+    def histogram(self, data, channels, counts):
+        numpy = self.__numpy
+        pixels = numpy.frombuffer(data, dtype=numpy.uint8).reshape(
+            -1, channels)
+        for channel in range(channels):
+            channel_counts = counts[channel]
+            values = numpy.bincount(pixels[:, channel], minlength=256)
+            for value in numpy.flatnonzero(values).tolist():
+                channel_counts[value] += int(values[value])
+
+    def composite(self, src, dst, rows, width, dst_alpha, premultiplied):
+        numpy = self.__numpy
+        dst_size = 4 if dst_alpha else 3
+        src = numpy.frombuffer(src, numpy.uint8).reshape(
+            rows, width, 4).astype(numpy.uint32)
+        dst = numpy.frombuffer(dst, numpy.uint8).reshape(
+            rows, width, dst_size).astype(numpy.uint32)
+        alpha = src[..., 3:4]
+        inv = 255 - alpha
+
+        if premultiplied:
+            result = numpy.minimum(
+                255, src[..., :dst_size] + (dst * inv + 127) // 255)
+        elif not dst_alpha:
+            result = numpy.minimum(
+                255, (src[..., :3] * alpha + 127) // 255 +
+                (dst * inv + 127) // 255)
+        else:
+            dst_a = dst[..., 3:4]
+            out = alpha * 255 + dst_a * inv
+            safe_out = numpy.maximum(out, 1)
+            result = numpy.empty_like(dst)
+            result[..., :3] = (src[..., :3] * alpha * 255 +
+                               dst[..., :3] * dst_a * inv +
+                               out // 2) // safe_out
+            result[..., 3:4] = (out + 127) // 255
+
+        # Transparent source pixels do not change the destination
+        result = numpy.where(alpha == 0, dst, result)
+        return result.astype(numpy.uint8).tobytes()
+
+
+BACKENDS = {
+    'python': PythonBackend,
+    'numpy': NumpyBackend,
+}
+
+_BACKEND = []
+
+
+def _create(name):
+    if name == 'auto':
+        try:
+            return NumpyBackend()
+        except ImportError:
+            return PythonBackend()
+    if name not in BACKENDS:
+        raise ValueError(
+            "'{0}' is not a backend, use one of: {1}".format(
+                name, ", ".join(sorted(BACKENDS) + ['auto'])))
+    return BACKENDS[name]()
+
+
+def get_backend():
+    """Get the backend in use, choosing it the first time.
+
+    Returns:
+        PythonBackend: the backend
+    """
+    if not _BACKEND:
+        _BACKEND.append(_create(
+            os.environ.get('PYTGA_BACKEND', 'auto').lower()))
+    return _BACKEND[0]
+
+
+def set_backend(backend):
+    """Choose the backend.
+
+    Args:
+        backend (string or PythonBackend): 'python', 'numpy', 'auto' or a
+            backend instance
+
+    Returns:
+        PythonBackend: the backend selected
+
+    Raises:
+        ImportError: if NumPy is requested but it is not available
+        ValueError: if the name is not a backend
+    """
+    if not isinstance(backend, PythonBackend):
+        backend = _create(backend)
+    del _BACKEND[:]
+    _BACKEND.append(backend)
+    return backend
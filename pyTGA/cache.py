@@ -0,0 +1,149 @@
+import os
+import threading
+from collections import OrderedDict
+
+from .tga import Image
+
+__all__ = ["ImageCache"]
+
+
+class ImageCache(object):
+
+    """Cache of decoded images with a memory bounded LRU eviction.
+
+    Images are keyed on path, modification time and size of the file, so a
+    changed file is loaded again. The memory used by the cache is the sum of
+    the pixel buffers (or RLE packets) of the images stored and when it
+    exceeds the budget the least recently used images are evicted.
+
+    Images returned are shared between all the callers and are read only,
+    ask for a copy to modify them.
+
+    Example:
+        cache = ImageCache(max_bytes=64 * 1024 * 1024)
+        image = cache.load("texture.tga")
+        editable = cache.load("texture.tga", copy=True)
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, storage='flat'):
+        """Initialize the cache.
+
+        Args:
+            max_bytes (int): memory budget of the cache in bytes
+            storage (string): how the images keep their pixels (see
+                'Image.set_storage'), with 'rle' the budget counts the
+                compressed size
+        """
+        self.max_bytes = max_bytes
+        self.storage = storage
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__size = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def __key(file_name):
+        info = os.stat(file_name)
+        return os.path.abspath(file_name), info.st_mtime, info.st_size
+
+    def load(self, file_name, copy=False):
+        """Load an image, from the cache if possible.
+
+        Args:
+            file_name (string): the name of the TGA image
+            copy (bool): return a modifiable copy of the shared image
+
+        Returns:
+            Image
+
+        Raises:
+            ImageError
+        """
+        path, mtime, size = self.__key(file_name)
+
+        with self.__lock:
+            entry = self.__entries.get(path)
+            if entry is not None and entry[0] == (mtime, size):
+                # Mark as most recently used
+                self.__entries[path] = self.__entries.pop(path)
+                self.hits += 1
+                image = entry[1]
+                return image.copy() if copy else image
+            self.misses += 1
+
+        image = Image().load(file_name, storage=self.storage)
+        image._read_only = True
+        nbytes = image._pixels.nbytes
+
+        with self.__lock:
+            self.__remove(path)
+            if nbytes <= self.max_bytes:
+                self.__entries[path] = ((mtime, size), image, nbytes)
+                self.__size += nbytes
+                self.__evict()
+
+        return image.copy() if copy else image
+
+    def __remove(self, path):
+        entry = self.__entries.pop(path, None)
+        if entry is not None:
+            self.__size -= entry[2]
+
+    def __evict(self):
+        while self.__size > self.max_bytes and self.__entries:
+            _, entry = self.__entries.popitem(last=False)
+            self.__size -= entry[2]
+            self.evictions += 1
+
+    def invalidate(self, file_name):
+        """Remove an image from the cache.
+
+        Args:
+            file_name (string): the name of the TGA image
+        """
+        with self.__lock:
+            self.__remove(os.path.abspath(file_name))
+
+    def clear(self):
+        """Remove all the images from the cache."""
+        with self.__lock:
+            self.__entries.clear()
+            self.__size = 0
+
+    def resize(self, max_bytes):
+        """Change the memory budget, evicting images if necessary.
+
+        Args:
+            max_bytes (int): memory budget of the cache in bytes
+        """
+        with self.__lock:
+            self.max_bytes = max_bytes
+            self.__evict()
+
+    @property
+    def size(self):
+        """int: memory used by the images in the cache."""
+        return self.__size
+
+    def info(self):
+        """Return the statistics of the cache.
+
+        Returns:
+            dict: hits, misses, evictions, entries, size and max_bytes
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.__entries),
+            'size': self.__size,
+            'max_bytes': self.max_bytes,
+        }
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, file_name):
+        return os.path.abspath(file_name) in self.__entries
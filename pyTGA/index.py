@@ -0,0 +1,259 @@
+"""Persistent metadata index for collections of TGA images.
+
+The header, the footer and the extension area of every image under a
+directory are stored in a SQLite database. Updates are incremental (only the
+files with a different modification time or size are read again) and the
+files are read in parallel by a pool of workers.
+
+Example:
+    with MetadataIndex("assets.db") as index:
+        index.update("assets/")
+        big = index.find(pixel_depht=32, min_width=2048)
+"""
+import fnmatch
+import os
+import sqlite3
+from multiprocessing.pool import ThreadPool
+
+from .tga import ImageError, read_info
+
+__all__ = ["MetadataIndex"]
+
+COLUMNS = (
+    ('path', 'TEXT PRIMARY KEY'),
+    ('mtime', 'REAL'),
+    ('size', 'INTEGER'),
+    ('image_type', 'INTEGER'),
+    ('width', 'INTEGER'),
+    ('height', 'INTEGER'),
+    ('pixel_depht', 'INTEGER'),
+    ('x_origin', 'INTEGER'),
+    ('y_origin', 'INTEGER'),
+    ('origin', 'TEXT'),
+    ('attribute_bits', 'INTEGER'),
+    ('id_length', 'INTEGER'),
+    ('color_map_type', 'INTEGER'),
+    ('new_format', 'INTEGER'),
+    ('author_name', 'TEXT'),
+    ('job_name', 'TEXT'),
+    ('software_id', 'TEXT'),
+    ('timestamp', 'TEXT'),
+    ('postage_stamp_offset', 'INTEGER'),
+    ('scan_line_offset', 'INTEGER'),
+    ('attributes_type', 'INTEGER'),
+    ('error', 'TEXT'),
+)
+
+COLUMN_NAMES = tuple(name for name, type_ in COLUMNS)
+
+
+def _scan_file(args):
+    """Read the metadata of a file for the index.
+
+    Args:
+        args (tuple): path, modification time and size of the file
+
+    Returns:
+        tuple: the values of the columns of the index
+    """
+    path, mtime, size = args
+    row = dict.fromkeys(COLUMN_NAMES)
+    row.update(path=path, mtime=mtime, size=size)
+    try:
+        info = read_info(path)
+    except (IOError, OSError, ValueError, ImageError) as err:
+        row['error'] = str(err)
+    else:
+        row.update(
+            image_type=info['image_type'],
+            width=info['image_width'],
+            height=info['image_height'],
+            pixel_depht=info['pixel_depht'],
+            x_origin=info['x_origin'],
+            y_origin=info['y_origin'],
+            origin=info['origin'],
+            attribute_bits=info['attribute_bits'],
+            id_length=info['id_length'],
+            color_map_type=info['color_map_type'],
+            new_format=int(info['new_format']),
+        )
+        extension = info.get('extension')
+        if extension is not None:
+            row.update(
+                author_name=extension['author_name'],
+                job_name=extension['job_name'],
+                software_id=extension['software_id'],
+                timestamp="{2:04d}-{0:02d}-{1:02d} {3:02d}:{4:02d}:{5:02d}".format(
+                    *extension['timestamp']),
+                postage_stamp_offset=extension['postage_stamp_offset'],
+                scan_line_offset=extension['scan_line_offset'],
+                attributes_type=extension['attributes_type'],
+            )
+    return tuple(row[name] for name in COLUMN_NAMES)
+
+
+class MetadataIndex(object):
+
+    """SQLite index of the metadata of TGA images."""
+
+    def __init__(self, db_name):
+        """Open (or create) the index.
+
+        Args:
+            db_name (string): the name of the SQLite database
+        """
+        self.__db = sqlite3.connect(db_name)
+        self.__db.row_factory = sqlite3.Row
+        with self.__db:
+            self.__db.execute("CREATE TABLE IF NOT EXISTS images ({0})".format(
+                ", ".join("{0} {1}".format(name, type_)
+                          for name, type_ in COLUMNS)))
+            for column in ('width', 'height', 'pixel_depht', 'image_type'):
+                self.__db.execute(
+                    "CREATE INDEX IF NOT EXISTS images_{0} "
+                    "ON images ({0})".format(column))
+
+    def close(self):
+        """Close the database."""
+        self.__db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def update(self, root, pattern="*.tga", workers=8):
+        """Update the index with the images under a directory.
+
+        Only new files and files with a different modification time or size
+        are read; files no more present under the directory are removed.
+
+        Args:
+            root (string): the directory to scan
+            pattern (string): shell pattern of the file names (case
+                insensitive)
+            workers (int): number of files read in parallel
+
+        Returns:
+            dict: number of files 'added', 'updated', 'removed' and
+                'unchanged'
+        """
+        root = os.path.abspath(root)
+        pattern = pattern.lower()
+
+        found = {}
+        for path, dirs, files in os.walk(root):
+            for name in files:
+                if fnmatch.fnmatch(name.lower(), pattern):
+                    file_name = os.path.join(path, name)
+                    info = os.stat(file_name)
+                    found[file_name] = (info.st_mtime, info.st_size)
+
+        known = {}
+        prefix = os.path.join(root, "")
+        for row in self.__db.execute(
+                "SELECT path, mtime, size FROM images "
+                "WHERE substr(path, 1, ?) = ?", (len(prefix), prefix)):
+            known[row['path']] = (row['mtime'], row['size'])
+
+        to_scan = [(path, mtime, size)
+                   for path, (mtime, size) in found.items()
+                   if known.get(path) != (mtime, size)]
+        removed = [path for path in known if path not in found]
+
+        if workers > 1 and len(to_scan) > 1:
+            pool = ThreadPool(workers)
+            try:
+                rows = pool.map(_scan_file, to_scan, chunksize=64)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            rows = [_scan_file(args) for args in to_scan]
+
+        with self.__db:
+            self.__db.executemany(
+                "INSERT OR REPLACE INTO images ({0}) VALUES ({1})".format(
+                    ", ".join(COLUMN_NAMES), ", ".join("?" * len(COLUMNS))),
+                rows)
+            self.__db.executemany("DELETE FROM images WHERE path = ?",
+                                  [(path,) for path in removed])
+
+        added = sum(1 for path, mtime, size in to_scan if path not in known)
+        return {
+            'added': added,
+            'updated': len(to_scan) - added,
+            'removed': len(removed),
+            'unchanged': len(found) - len(to_scan),
+        }
+
+    def get(self, file_name):
+        """Retreive the metadata of an image.
+
+        Args:
+            file_name (string): the name of the TGA image
+
+        Returns:
+            dict: the columns of the index, None if the image is not indexed
+        """
+        row = self.__db.execute("SELECT * FROM images WHERE path = ?",
+                                (os.path.abspath(file_name),)).fetchone()
+        return dict(zip(row.keys(), row)) if row is not None else None
+
+    def query(self, where="1", params=()):
+        """Select images with a SQL condition.
+
+        Args:
+            where (string): the condition on the columns of the index
+            params (tuple): the values of the placeholders in the condition
+
+        Returns:
+            list of dict: the images selected, sorted by path
+
+        Example:
+            index.query("pixel_depht = ? AND width > ?", (32, 2048))
+        """
+        return [dict(zip(row.keys(), row)) for row in self.__db.execute(
+            "SELECT * FROM images WHERE {0} ORDER BY path".format(where),
+            params)]
+
+    def find(self, image_type=None, pixel_depht=None, origin=None,
+             new_format=None, min_width=None, max_width=None,
+             min_height=None, max_height=None):
+        """Select images by their properties.
+
+        Args:
+            image_type (int): type of the image (2, 3, 10, 11...)
+            pixel_depht (int): pixel depth (8, 16, 24 or 32)
+            origin (string): destination of the first pixel ('bl', 'br', 'tl',
+                'tr')
+            new_format (bool): new (True) or original (False) TGA format
+            min_width (int): minimum width, included
+            max_width (int): maximum width, included
+            min_height (int): minimum height, included
+            max_height (int): maximum height, included
+
+        Returns:
+            list of dict: the images selected, sorted by path
+        """
+        conditions = []
+        params = []
+        for column, operator, value in (
+                ('image_type', '=', image_type),
+                ('pixel_depht', '=', pixel_depht),
+                ('origin', '=', origin),
+                ('new_format', '=', None if new_format is None
+                 else int(new_format)),
+                ('width', '>=', min_width),
+                ('width', '<=', max_width),
+                ('height', '>=', min_height),
+                ('height', '<=', max_height)):
+            if value is not None:
+                conditions.append("{0} {1} ?".format(column, operator))
+                params.append(value)
+        return self.query(" AND ".join(conditions) or "1", tuple(params))
+
+    def __len__(self):
+        return self.__db.execute("SELECT COUNT(*) FROM images").fetchone()[0]
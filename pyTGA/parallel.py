@@ -0,0 +1,226 @@
+"""Per-pixel work on the tiles of an image in a pool of processes.
+
+The pixels are copied once in a block of shared memory
+(multiprocessing.shared_memory): each worker attaches to it when it starts
+and receives only the position of its tiles, so pixel data are never
+pickled. A tile gives views of the shared pixels and the
+changes made by the workers are copied back in the image at the end.
+
+The function is sent once to each worker, so it must be picklable (a
+function defined at the top level of a module).
+
+Example:
+    def invert(tile):
+        for row in range(tile.height):
+            data = tile.row(row)
+            data[:] = bytes(255 - value for value in data)
+
+    parallel.map_tiles(image, invert, tile=(256, 256), workers=4)
+"""
+import multiprocessing
+
+from .tga import _PIXELS, ImageError, PixelMatrix, _import_numpy
+
+__all__ = ["Tile", "map_tiles"]
+
+# Shared memory, pixel buffer and job of a worker process
+_WORKER = {}
+
+
+class Tile(object):
+
+    """A rectangle of the pixels of an image, without copies.
+
+    Positions are relative to the first pixel of the tile; writes change the
+    pixels of the image.
+    """
+
+    __slots__ = ('x', 'y', 'width', 'height', 'type', '__buffer',
+                 '__row_length', '__struct')
+
+    def __init__(self, buffer, image_width, x, y, width, height, type_):
+        """Initialize the tile.
+
+        Args:
+            buffer (memoryview): the pixels of the whole image
+            image_width (int): number of columns of the image
+            x (int): first column of the tile
+            y (int): first row of the tile
+            width (int): number of columns
+            height (int): number of rows
+            type_ (string): kind of pixels (see MATRIX_TYPE)
+        """
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.type = type_
+        self.__buffer = buffer
+        self.__row_length = image_width * len(type_)
+        self.__struct = _PIXELS[type_]
+
+    def __offset(self, row, col):
+        return (self.y + row) * self.__row_length + \
+            (self.x + col) * len(self.type)
+
+    def row(self, index):
+        """Get the pixels of a row of the tile.
+
+        Args:
+            index (int): the row
+
+        Returns:
+            memoryview: one byte for each channel, RGB(A) order
+        """
+        start = self.__offset(index, 0)
+        return self.__buffer[start:start + self.width * len(self.type)]
+
+    def get_pixel(self, row, col):
+        """Read a pixel.
+
+        Args:
+            row (int): the row
+            col (int): the column
+
+        Returns:
+            int-tuple: the pixel
+        """
+        result = self.__struct.unpack_from(self.__buffer,
+                                           self.__offset(row, col))
+        return result if len(result) > 1 else result[0]
+
+    def set_pixel(self, row, col, value):
+        """Change a pixel.
+
+        Args:
+            row (int): the row
+            col (int): the column
+            value (int-tuple): the pixel
+        """
+        if len(self.type) == 1:
+            value = (value,)
+        self.__struct.pack_into(self.__buffer, self.__offset(row, col), *value)
+
+    def array(self):
+        """Get a NumPy view of the pixels of the tile.
+
+        Returns:
+            numpy.ndarray: shape (height, width, channels) of uint8
+
+        Raises:
+            ImageError
+        """
+        numpy = _import_numpy()
+        if numpy is None:
+            raise ImageError("NumPy is not available", 'non_supported_mode')
+        channels = len(self.type)
+        pixels = numpy.frombuffer(self.__buffer, dtype=numpy.uint8).reshape(
+            -1, self.__row_length // channels, channels)
+        return pixels[self.y:self.y + self.height,
+                      self.x:self.x + self.width]
+
+
+def _tiles(width, height, tile):
+    """Split an image in rectangles.
+
+    Args:
+        width (int): number of columns of the image
+        height (int): number of rows of the image
+        tile (tuple): width and height of a tile
+
+    Returns:
+        list of tuple: x, y, width and height of each tile, row by row
+    """
+    tile_width, tile_height = tile
+    if tile_width < 1 or tile_height < 1:
+        raise ValueError("the tiles must have at least one pixel")
+    return [(x, y, min(tile_width, width - x), min(tile_height, height - y))
+            for y in range(0, height, tile_height)
+            for x in range(0, width, tile_width)]
+
+
+def _attach(name, nbytes, width, type_, func):
+    """Initialize a worker: attach to the shared pixels."""
+    from multiprocessing import shared_memory
+    try:
+        memory = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 has no 'track' argument
+        memory = shared_memory.SharedMemory(name=name)
+    _WORKER['memory'] = memory
+    _WORKER['job'] = (nbytes, width, type_, func)
+
+
+def _run(region):
+    """Call the function of the worker on a tile."""
+    nbytes, width, type_, func = _WORKER['job']
+    with _WORKER['memory'].buf[:nbytes] as buffer:
+        return func(Tile(buffer, width, *(region + (type_,))))
+
+
+def map_tiles(image, func, tile=(256, 256), workers=None):
+    """Call a function on each tile of an image in a pool of processes.
+
+    The function receives a Tile and changes its pixels in place; tiles are
+    processed in any order and at the same time, so the function must not
+    read pixels outside its tile that other tiles change.
+
+    Args:
+        image (Image): the image, changed in place
+        func (callable): the function, picklable
+        tile (tuple): width and height of the tiles (the last ones of each
+            row and column can be smaller)
+        workers (int): number of processes (default: the number of CPUs),
+            0 to process the tiles in this process without shared memory
+
+    Returns:
+        list: the value returned by the function for each tile, row by row
+
+    Raises:
+        ImageError
+        ValueError
+    """
+    if image.is_read_only():
+        raise ImageError(
+            "the image is read only, use 'copy' to modify it",
+            'read_only_image'
+        )
+    width, height = image.get_size()
+    regions = _tiles(width, height, tile)
+    pixels = image._pixels
+    matrix = pixels if isinstance(pixels, PixelMatrix) else \
+        pixels.to_pixel_matrix()
+    type_ = matrix.type
+    nbytes = matrix.nbytes
+    if not regions:
+        return []
+
+    if workers == 0:
+        with matrix.getbuffer() as buffer:
+            results = [func(Tile(buffer, width, *(region + (type_,))))
+                       for region in regions]
+    else:
+        from multiprocessing import shared_memory
+        memory = shared_memory.SharedMemory(create=True, size=nbytes)
+        try:
+            with memory.buf[:nbytes] as shared, \
+                    matrix.getbuffer(readonly=True) as view:
+                shared[:] = view
+            pool = multiprocessing.Pool(
+                workers, _attach, (memory.name, nbytes, width, type_, func))
+            try:
+                results = pool.map(_run, regions)
+            finally:
+                pool.close()
+                pool.join()
+            with memory.buf[:nbytes] as shared, \
+                    matrix.getbuffer() as view:
+                view[:] = shared
+        finally:
+            memory.close()
+            memory.unlink()
+
+    if matrix is not pixels:
+        image._pixels = type(pixels).from_matrix(matrix)
+    image._touch_rows(0, height)
+    return results
@@ -0,0 +1,757 @@
+"""Operations on RLE compressed pixels that do not expand the packets.
+
+Images are handled as a list of rows, each row a string of RLE packets in
+the format of the TGA files (the packets of a row do not continue in the
+next one). A run-length packet is processed once whatever its length, so
+the work depends on the number of packets and on the pixels of the raw
+packets, not on the size of the image.
+
+Pixel values passed to and returned by these functions have the format of
+'Image.get_pixel' (RGB(A) order and 5 bit channels for 16 bit images).
+
+Example:
+    pixel_depht, rows = rle.read_rows("sprite.tga")
+    x, y, width, height = rle.trim_bbox(rows, pixel_depht)
+    rows = rle.replace_color(rows, pixel_depht, (255, 0, 0, 255),
+                             (0, 0, 255, 255))
+
+RLEMatrix keeps the pixels of an Image compressed in memory (see
+'Image.load' with storage='rle').
+"""
+from array import array
+from bisect import bisect_right
+
+from .analysis import _matrix_pixel
+from .backends import get_backend
+from .tga import (_PIXELS, MATRIX_TYPE, ImageError, PixelMatrix, TGAHeader,
+                  _matrix_type, _mirror_row, _pack_pixel)
+
+__all__ = ["iter_packets", "split_rows", "read_rows", "encode_rows",
+           "opaque_count", "trim_bbox", "replace_color", "row_is_uniform",
+           "RLEMatrix"]
+
+
+def iter_packets(data, pixel_size):
+    """Iterate over the RLE packets of some pixel data.
+
+    Args:
+        data (bytes): the packets
+        pixel_size (int): size in bytes of a pixel
+
+    Yields:
+        tuple(int, bool, bytes): the number of pixels of the packet, if it
+            is a run-length packet and the repeated pixel or the raw pixels
+
+    Raises:
+        ImageError
+    """
+    data = bytes(data)
+    pos = 0
+    end = len(data)
+    while pos < end:
+        repetition_count = data[pos]
+        count = (repetition_count & 0b01111111) + 1
+        run = bool(repetition_count & 0b10000000)
+        size = pixel_size if run else pixel_size * count
+        if pos + 1 + size > end:
+            raise ImageError("RLE packet ends after the pixel data",
+                             'truncated_data')
+        yield count, run, data[pos + 1:pos + 1 + size]
+        pos += 1 + size
+
+
+def _packet(count, run, pixels):
+    return bytes(bytearray([(0b10000000 if run else 0) | (count - 1)])) + \
+        bytes(pixels)
+
+
+def split_rows(data, pixel_size, width, height):
+    """Cut a stream of RLE packets in rows.
+
+    Packets that continue in the next row are split in two packets.
+
+    Args:
+        data (bytes): the packets of the image
+        pixel_size (int): size in bytes of a pixel
+        width (int): number of pixels in a row
+        height (int): number of rows
+
+    Returns:
+        list of bytes: the packets of each row
+
+    Raises:
+        ImageError
+    """
+    rows = []
+    row = bytearray()
+    col = 0
+    packets = iter_packets(data, pixel_size)
+    while len(rows) < height:
+        if width == 0:
+            rows.append(b'')
+            continue
+        try:
+            count, run, pixels = next(packets)
+        except StopIteration:
+            raise ImageError("pixel data ends before the last pixel",
+                             'truncated_data')
+        while count and len(rows) < height:
+            used = min(count, width - col)
+            if run:
+                row += _packet(used, True, pixels)
+            else:
+                row += _packet(used, False, pixels[:used * pixel_size])
+                pixels = pixels[used * pixel_size:]
+            count -= used
+            col += used
+            if col == width:
+                rows.append(bytes(row))
+                row = bytearray()
+                col = 0
+    return rows
+
+
+def read_rows(file_name):
+    """Read the rows of packets of a compressed TGA image.
+
+    Args:
+        file_name (string): the name of the TGA image
+
+    Returns:
+        tuple: the pixel depth and the list of rows of packets
+
+    Raises:
+        ImageError
+    """
+    with open(file_name, "rb") as image_file:
+        data = image_file.read(18)
+        if len(data) < 18:
+            raise ImageError("file ends in the header", 'truncated_data')
+        header = TGAHeader().from_bytes(data)
+        _matrix_type(header)
+        if header.image_type not in (10, 11):
+            raise ImageError(
+                "type num '{0}'' is not compressed with RLE".format(
+                    header.image_type),
+                'non_supported_type'
+            )
+        image_file.seek(header.data_offset)
+        data = image_file.read()
+
+    return header.pixel_depht, split_rows(
+        data, header.bytes_per_pixel, header.image_width,
+        header.image_height)
+
+
+def encode_rows(image, force_16_bit=False):
+    """Compress the rows of an image.
+
+    Args:
+        image (Image): the image
+        force_16_bit (bool): use 16 bit pixels for an RGB image
+
+    Returns:
+        tuple: the pixel depth and the list of rows of packets
+    """
+    backend = get_backend()
+    type_ = image._pixels.type
+    if type_ == MATRIX_TYPE['BW']:
+        pixel_depht = 8
+    elif type_ == MATRIX_TYPE['RGB']:
+        pixel_depht = 16 if force_16_bit else 24
+    else:
+        pixel_depht = 32
+    pixel_size = (pixel_depht + 7) // 8
+    width, height = image.get_size()
+
+    return pixel_depht, [
+        backend.rle_encode(
+            backend.from_matrix(image._pixels.get_region(row, 0, 1, width),
+                                pixel_depht),
+            pixel_size)[0]
+        for row in range(height)
+    ]
+
+
+def _transparency(pixel_depht, transparent):
+    """Test of transparency of a pixel in the file format.
+
+    Args:
+        pixel_depht (int): the pixel depth of the image
+        transparent (int-tuple): the transparent value, None for the pixels
+            with alpha 0 (no pixel is transparent without alpha)
+
+    Returns:
+        function: pixel (bytes) -> bool
+    """
+    if transparent is None:
+        if pixel_depht == 32:
+            return lambda pixel: pixel[3] == 0
+        return lambda pixel: False
+    if isinstance(transparent, int):
+        transparent = (transparent,)
+    transparent = tuple(transparent)
+    return lambda pixel: _matrix_pixel(pixel, pixel_depht) == transparent
+
+
+def _opaque_columns(pixels, pixel_depht, transparent, is_transparent):
+    """Find the first and the last opaque pixel of a raw packet.
+
+    Returns:
+        tuple: the two indexes, None if all pixels are transparent
+    """
+    pixel_size = (pixel_depht + 7) // 8
+    if transparent is None and pixel_depht == 32:
+        alpha = pixels[3::4]
+        visible = alpha.lstrip(b'\0')
+        if not visible:
+            return None
+        return len(alpha) - len(visible), len(alpha.rstrip(b'\0')) - 1
+    opaque = [index for index in range(len(pixels) // pixel_size)
+              if not is_transparent(
+                  pixels[index * pixel_size:(index + 1) * pixel_size])]
+    return (opaque[0], opaque[-1]) if opaque else None
+
+
+def opaque_count(rows, pixel_depht, transparent=None):
+    """Count the pixels that are not transparent.
+
+    Args:
+        rows (list of bytes): the packets of each row
+        pixel_depht (int): the pixel depth of the image
+        transparent (int-tuple): the transparent value (default: the pixels
+            with alpha 0, if the image has alpha)
+
+    Returns:
+        int: the number of opaque pixels
+
+    Raises:
+        ImageError
+    """
+    pixel_size = (pixel_depht + 7) // 8
+    is_transparent = _transparency(pixel_depht, transparent)
+    total = 0
+    for row in rows:
+        for count, run, pixels in iter_packets(row, pixel_size):
+            if run:
+                if not is_transparent(pixels):
+                    total += count
+            elif transparent is None and pixel_depht == 32:
+                total += count - pixels[3::4].count(b'\0')
+            else:
+                total += sum(
+                    1 for index in range(count)
+                    if not is_transparent(
+                        pixels[index * pixel_size:(index + 1) * pixel_size]))
+    return total
+
+
+def trim_bbox(rows, pixel_depht, transparent=None):
+    """Find the smallest rectangle with all the opaque pixels.
+
+    Args:
+        rows (list of bytes): the packets of each row
+        pixel_depht (int): the pixel depth of the image
+        transparent (int-tuple): the transparent value (default: the pixels
+            with alpha 0, if the image has alpha)
+
+    Returns:
+        tuple: x, y, width and height of the rectangle, None if all the
+            pixels are transparent
+
+    Raises:
+        ImageError
+    """
+    pixel_size = (pixel_depht + 7) // 8
+    is_transparent = _transparency(pixel_depht, transparent)
+    left = top = right = bottom = None
+    for row_index, row in enumerate(rows):
+        first = last = None
+        col = 0
+        for count, run, pixels in iter_packets(row, pixel_size):
+            if run:
+                if not is_transparent(pixels):
+                    if first is None:
+                        first = col
+                    last = col + count - 1
+            else:
+                columns = _opaque_columns(pixels, pixel_depht, transparent,
+                                          is_transparent)
+                if columns is not None:
+                    if first is None:
+                        first = col + columns[0]
+                    last = col + columns[1]
+            col += count
+        if first is not None:
+            if top is None:
+                top = row_index
+                left, right = first, last
+            left = min(left, first)
+            right = max(right, last)
+            bottom = row_index
+    if top is None:
+        return None
+    return left, top, right - left + 1, bottom - top + 1
+
+
+def replace_color(rows, pixel_depht, old, new):
+    """Replace all the pixels of a color with another one.
+
+    Args:
+        rows (list of bytes): the packets of each row
+        pixel_depht (int): the pixel depth of the image
+        old (int-tuple): the color to replace
+        new (int-tuple): the new color
+
+    Returns:
+        list of bytes: the packets of each row with the new color
+
+    Raises:
+        ImageError
+    """
+    pixel_size = (pixel_depht + 7) // 8
+    if isinstance(old, int):
+        old = (old,)
+    if isinstance(new, int):
+        new = (new,)
+    old = tuple(old)
+    new_pixel = bytes(get_backend().from_matrix(
+        bytes(bytearray(new)), pixel_depht))
+
+    result = []
+    for row in rows:
+        tmp = bytearray()
+        for count, run, pixels in iter_packets(row, pixel_size):
+            if run:
+                if _matrix_pixel(pixels, pixel_depht) == old:
+                    pixels = new_pixel
+            else:
+                pixels = b''.join(
+                    new_pixel if _matrix_pixel(pixel, pixel_depht) == old
+                    else pixel
+                    for pixel in (pixels[index:index + pixel_size]
+                                  for index in range(0, len(pixels),
+                                                     pixel_size)))
+            tmp += _packet(count, run, pixels)
+        result.append(bytes(tmp))
+    return result
+
+
+def row_is_uniform(row, pixel_size):
+    """Check if all the pixels of a row have the same value.
+
+    Args:
+        row (bytes): the packets of the row
+        pixel_size (int): size in bytes of a pixel
+
+    Returns:
+        bool
+
+    Raises:
+        ImageError
+    """
+    first = None
+    for count, run, pixels in iter_packets(row, pixel_size):
+        if first is None:
+            first = pixels[:pixel_size]
+        if run:
+            if pixels != first:
+                return False
+        elif pixels != first * count:
+            return False
+    return True
+
+
+class _RLERow(object):
+
+    """Access to the pixels of a row of a RLEMatrix (see RowBuffer)."""
+
+    __slots__ = ('__matrix', '__row', '__index')
+
+    def __init__(self, matrix, row):
+        self.__matrix = matrix
+        self.__row = row
+        self.__index = -1
+
+    def __getitem__(self, index):
+        return self.__matrix.get_pixel(self.__row, index)
+
+    def set_pixel(self, index, value):
+        self.__matrix.set_pixel(self.__row, index, value)
+
+    def __len__(self):
+        return self.__matrix.width
+
+    def __iter__(self):
+        self.__index = -1
+        return self
+
+    def __next__(self):
+        self.__index += 1
+        if self.__index < self.__matrix.width:
+            return self[self.__index]
+        raise StopIteration
+
+
+class RLEMatrix(object):
+
+    """Pixels of an image stored as RLE packets, with the interface of a
+    PixelMatrix.
+
+    The packets of all the rows are kept in one buffer, with the position of
+    the first packet of each row. Packets contain pixels in the format of the
+    matrix (RGB(A) order), so a pixel is read without conversion: the packet
+    with the pixel is found with a binary search over the first pixel of the
+    packets of the row (computed once for the last row used). Changing a
+    pixel compresses its row again. The flat pixels are decoded on demand.
+    A copy shares the packets until one of the two matrices changes them.
+    """
+
+    __slots__ = ('__width', '__height', '__type', '__data', '__offsets',
+                 '__index_row', '__starts', '__positions', '__index',
+                 '__shared')
+
+    def __init__(self, rows, width, type_=MATRIX_TYPE['BW']):
+        """Initialize the matrix.
+
+        Args:
+            rows (list of bytes): the packets of each row, with pixels in the
+                format of the matrix
+            width (int): number of columns
+            type_ (string): kind of pixels (see MATRIX_TYPE)
+        """
+        self.__width = width
+        self.__height = len(rows)
+        self.__type = type_
+        self.__index = -1
+        self.__store(rows)
+
+    def __store(self, rows):
+        self.__data = bytearray(b''.join(rows))
+        self.__offsets = array('L', [0])
+        for row in rows:
+            self.__offsets.append(self.__offsets[-1] + len(row))
+        self.__shared = False
+        self.__index_row = None
+        self.__starts = self.__positions = None
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """Compress the pixels of a matrix.
+
+        Args:
+            matrix (PixelMatrix): the pixels
+
+        Returns:
+            RLEMatrix
+        """
+        backend = get_backend()
+        elm_size = len(matrix.type)
+        return cls([
+            backend.rle_encode(
+                matrix.get_region(row, 0, 1, matrix.width), elm_size)[0]
+            for row in range(matrix.height)
+        ], matrix.width, matrix.type)
+
+    @classmethod
+    def from_file_rows(cls, rows, pixel_depht, width):
+        """Create a matrix from the rows of packets of a file.
+
+        Only the pixels stored in the packets are converted, runs are not
+        expanded.
+
+        Args:
+            rows (list of bytes): the packets of each row (see 'read_rows')
+            pixel_depht (int): the pixel depth of the image
+            width (int): number of columns
+
+        Returns:
+            RLEMatrix
+
+        Raises:
+            ImageError
+        """
+        header = TGAHeader()
+        header.image_type = 3 if pixel_depht == 8 else 2
+        header.pixel_depht = pixel_depht
+        type_ = _matrix_type(header)
+        if pixel_depht == 8:
+            return cls(rows, width, type_)
+
+        backend = get_backend()
+        pixel_size = header.bytes_per_pixel
+        elm_size = len(type_)
+        matrix_rows = []
+        for row in rows:
+            packets = list(iter_packets(row, pixel_size))
+            pixels = backend.to_matrix(
+                b''.join(pixels for _, _, pixels in packets), pixel_depht)
+            tmp = bytearray()
+            pos = 0
+            for count, run, _ in packets:
+                size = elm_size if run else elm_size * count
+                tmp += _packet(count, run, pixels[pos:pos + size])
+                pos += size
+            matrix_rows.append(bytes(tmp))
+        return cls(matrix_rows, width, type_)
+
+    def row(self, index):
+        """Get the packets of a row.
+
+        Args:
+            index (int): the row
+
+        Returns:
+            bytes: the packets, with pixels in the format of the matrix
+        """
+        return bytes(self.__data[self.__offsets[index]:
+                                 self.__offsets[index + 1]])
+
+    def set_row(self, index, packets):
+        """Replace the packets of a row.
+
+        Args:
+            index (int): the row
+            packets (bytes): the new packets, with pixels in the format of
+                the matrix
+        """
+        if self.__shared:
+            self.__data = bytearray(self.__data)
+            self.__offsets = array('L', self.__offsets)
+            self.__shared = False
+        start = self.__offsets[index]
+        end = self.__offsets[index + 1]
+        self.__data[start:end] = packets
+        delta = len(packets) - (end - start)
+        if delta:
+            for num in range(index + 1, self.__height + 1):
+                self.__offsets[num] += delta
+        # The index has the positions of the packets in the buffer, they
+        # move if a previous row changes size
+        if self.__index_row is not None and (
+                self.__index_row == index or
+                (delta and self.__index_row > index)):
+            self.__index_row = None
+
+    def __decode_rows(self, row, height):
+        start = self.__offsets[row]
+        end = self.__offsets[row + height]
+        try:
+            return get_backend().rle_decode(
+                self.__data[start:end], len(self.__type), self.__width,
+                height)[0]
+        except ValueError as err:
+            raise ImageError(str(err), 'truncated_data')
+
+    def __set_rows(self, row, data):
+        backend = get_backend()
+        elm_size = len(self.__type)
+        row_size = self.__width * elm_size
+        for num in range(len(data) // row_size if row_size else 0):
+            self.set_row(row + num, backend.rle_encode(
+                data[num * row_size:(num + 1) * row_size], elm_size)[0])
+
+    def get_pixel(self, row, col):
+        """Read a pixel.
+
+        Args:
+            row (int): the row
+            col (int): the column
+
+        Returns:
+            int-tuple: the pixel
+        """
+        if not 0 <= col < self.__width:
+            raise IndexError("column {0} is out of the row".format(col))
+        elm_size = len(self.__type)
+        if self.__index_row != row:
+            starts = []
+            positions = []
+            first = 0
+            pos = self.__offsets[row]
+            end = self.__offsets[row + 1]
+            data = self.__data
+            while pos < end:
+                starts.append(first)
+                positions.append(pos)
+                repetition_count = data[pos]
+                count = (repetition_count & 0b01111111) + 1
+                first += count
+                if repetition_count & 0b10000000:
+                    pos += 1 + elm_size
+                else:
+                    pos += 1 + elm_size * count
+            self.__starts = starts
+            self.__positions = positions
+            self.__index_row = row
+
+        packet = bisect_right(self.__starts, col) - 1
+        pos = self.__positions[packet] + 1
+        if not self.__data[pos - 1] & 0b10000000:
+            pos += (col - self.__starts[packet]) * elm_size
+        result = _PIXELS[self.__type].unpack_from(self.__data, pos)
+        return result if len(result) > 1 else result[0]
+
+    def set_pixel(self, row, col, value):
+        """Change a pixel, compressing its row again.
+
+        Args:
+            row (int): the row
+            col (int): the column
+            value (int-tuple): the pixel
+        """
+        if not 0 <= col < self.__width:
+            raise IndexError("column {0} is out of the row".format(col))
+        self.set_region(row, col, 1, _pack_pixel(self.__type, value))
+
+    def __call__(self):
+        return bytes(self.__decode_rows(0, self.__height))
+
+    def getbuffer(self, readonly=True):
+        """Get a read-only view of the decoded pixels.
+
+        The pixels are decoded in a new buffer, so the view does not change
+        with the pixels.
+
+        Args:
+            readonly (bool): ignored, the view is always read-only
+
+        Returns:
+            memoryview
+        """
+        return memoryview(self()).toreadonly()
+
+    def to_pixel_matrix(self):
+        """Decode all the pixels.
+
+        Returns:
+            PixelMatrix
+        """
+        return PixelMatrix.from_bytes(
+            self.__decode_rows(0, self.__height), self.__height,
+            self.__width, self.__type)
+
+    @property
+    def nbytes(self):
+        """int: memory used by the packets and by the index of the rows."""
+        return len(self.__data) + \
+            len(self.__offsets) * self.__offsets.itemsize
+
+    @property
+    def width(self):
+        """int: number of pixels in a row."""
+        return self.__width
+
+    @property
+    def height(self):
+        """int: number of rows."""
+        return self.__height
+
+    @property
+    def type(self):
+        """string: struct format of a pixel (see MATRIX_TYPE)."""
+        return self.__type
+
+    def fill(self, value):
+        """Set all the pixels to the same value.
+
+        Args:
+            value (int-tuple): the pixel value
+        """
+        pixel = _pack_pixel(self.__type, value)
+        packets = bytearray()
+        left = self.__width
+        while left:
+            count = min(left, 128)
+            packets += _packet(count, True, pixel)
+            left -= count
+        self.__store([bytes(packets)] * self.__height)
+
+    def get_region(self, row, col, height, width):
+        """Read the pixels of a rectangle (see PixelMatrix.get_region)."""
+        data = self.__decode_rows(row, height)
+        if col == 0 and width == self.__width:
+            return bytes(data)
+        elm_size = len(self.__type)
+        row_size = self.__width * elm_size
+        return b''.join(
+            bytes(data[num * row_size + col * elm_size:
+                       num * row_size + (col + width) * elm_size])
+            for num in range(height))
+
+    def set_region(self, row, col, width, data):
+        """Write the pixels of a rectangle (see PixelMatrix.set_region)."""
+        elm_size = len(self.__type)
+        span = width * elm_size
+        height = len(data) // span if span else 0
+        if not height:
+            return
+        if col == 0 and width == self.__width:
+            self.__set_rows(row, data)
+            return
+        rows = self.__decode_rows(row, height)
+        row_size = self.__width * elm_size
+        for num in range(height):
+            start = num * row_size + col * elm_size
+            rows[start:start + span] = data[num * span:(num + 1) * span]
+        self.__set_rows(row, rows)
+
+    def view(self, row=0, col=0, height=None, width=None, flip_rows=False,
+             mirror=False):
+        """Create a matrix with the pixels of a rectangle (see
+        PixelMatrix.view).
+
+        Whole rows keep their packets, the other rectangles are compressed
+        again.
+
+        Returns:
+            RLEMatrix
+        """
+        height = self.__height - row if height is None else height
+        width = self.__width - col if width is None else width
+        order = range(row, row + height)
+        if flip_rows:
+            order = reversed(order)
+        if col == 0 and width == self.__width and not mirror:
+            return RLEMatrix([self.row(index) for index in order],
+                             width, self.__type)
+
+        backend = get_backend()
+        elm_size = len(self.__type)
+        rows = []
+        for index in order:
+            data = bytearray(self.get_region(index, col, 1, width))
+            if mirror:
+                data = _mirror_row(data, elm_size)
+            rows.append(backend.rle_encode(data, elm_size)[0])
+        return RLEMatrix(rows, width, self.__type)
+
+    def copy(self):
+        """Create a new matrix with the same packets, shared until one of the
+        two matrices changes them.
+
+        Returns:
+            RLEMatrix
+        """
+        tmp = RLEMatrix([], self.__width, self.__type)
+        tmp.__height = self.__height
+        tmp.__data = self.__data
+        tmp.__offsets = self.__offsets
+        tmp.__shared = self.__shared = True
+        return tmp
+
+    def __len__(self):
+        return self.__height
+
+    def __iter__(self):
+        self.__index = -1
+        return self
+
+    def __next__(self):
+        self.__index += 1
+        if self.__index < self.__height:
+            return self[self.__index]
+        raise StopIteration
+
+    def __getitem__(self, index):
+        return _RLERow(self, index)
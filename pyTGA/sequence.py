@@ -0,0 +1,221 @@
+"""Numbered frame sequences.
+
+A reader loads the frames of a sequence in a pool of workers while the
+caller uses the previous ones, a writer saves the frames in a pool while the
+caller produces the next ones. Both keep a bounded number of frames in flight,
+so the memory used does not depend on the length of the sequence.
+
+Frames are named with a format pattern ("frame_{0:04d}.tga" or
+"frame_%04d.tga") or, for the reader, with a glob pattern ("frame_*.tga",
+sorted by name).
+
+Example:
+    with sequence.SequenceReader("in/frame_{0:04d}.tga", start=1) as frames:
+        with sequence.SequenceWriter("out/frame_{0:04d}.tga",
+                                     start=1, compress=True) as writer:
+            for frame in frames:
+                writer.write(frame.resize(640, 360))
+"""
+import glob
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from .tga import Image
+
+__all__ = ["frame_names", "SequenceReader", "SequenceWriter"]
+
+
+def _format(pattern, number):
+    """Create the name of a frame from a format pattern.
+
+    Args:
+        pattern (string): "{0:04d}" or "%04d" style pattern
+        number (int): the frame number
+
+    Returns:
+        string
+    """
+    if '%' in pattern:
+        return pattern % number
+    return pattern.format(number)
+
+
+def _is_glob(pattern):
+    return any(char in pattern for char in "*?[")
+
+
+def frame_names(pattern, start=0, stop=None):
+    """List the files of a sequence.
+
+    Args:
+        pattern (string): format or glob pattern of the names
+        start (int): first frame number of a format pattern
+        stop (int): frame number after the last one of a format pattern
+            (default: stop at the first missing file)
+
+    Returns:
+        list of string: the names of the frames in order
+    """
+    if _is_glob(pattern):
+        return sorted(glob.glob(pattern))
+
+    names = []
+    number = start
+    while stop is None or number < stop:
+        name = _format(pattern, number)
+        if stop is None and not os.path.exists(name):
+            break
+        names.append(name)
+        number += 1
+    return names
+
+
+def _load(file_name):
+    return Image().load(file_name)
+
+
+def _save(image, file_name, kwargs):
+    image.save(file_name, **kwargs)
+    return file_name
+
+
+class _Pipeline(object):
+
+    """Executor with a bounded queue of pending jobs kept in order."""
+
+    def __init__(self, ahead, workers, executor):
+        if ahead < 1:
+            raise ValueError("at least one frame must be in flight")
+        self._ahead = ahead
+        self._own_executor = executor is None
+        self._executor = executor if executor is not None else \
+            ThreadPoolExecutor(max_workers=workers)
+        self._pending = deque()
+
+    def close(self):
+        """Wait for the pending jobs and release the workers."""
+        try:
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            self._pending.clear()
+            if self._own_executor:
+                self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            for future in self._pending:
+                future.cancel()
+        self.close()
+
+
+class SequenceReader(_Pipeline):
+
+    """Iterate over the frames of a sequence, loading the next ones ahead.
+
+    Up to 'prefetch' frames are loaded while the current one is used. The
+    frames are loaded in a thread pool by default; pass a
+    concurrent.futures.ProcessPoolExecutor to decode them in other processes.
+
+    Example:
+        for frame in SequenceReader("frame_*.tga", prefetch=8):
+            encode(frame.get_buffer())
+    """
+
+    def __init__(self, pattern, prefetch=4, workers=2, start=0, stop=None,
+                 executor=None):
+        """Initialize the reader.
+
+        Args:
+            pattern (string): format or glob pattern of the names (see
+                'frame_names')
+            prefetch (int): maximum number of frames loaded ahead
+            workers (int): number of threads of the default pool
+            start (int): first frame number of a format pattern
+            stop (int): frame number after the last one of a format pattern
+            executor (concurrent.futures.Executor): pool used to load the
+                frames instead of a new thread pool
+        """
+        super(SequenceReader, self).__init__(prefetch, workers, executor)
+        self.names = frame_names(pattern, start, stop)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        names = iter(self.names)
+        try:
+            for name in names:
+                self._pending.append(self._executor.submit(_load, name))
+                if len(self._pending) >= self._ahead:
+                    break
+            while self._pending:
+                image = self._pending.popleft().result()
+                for name in names:
+                    self._pending.append(self._executor.submit(_load, name))
+                    break
+                yield image
+        finally:
+            for future in self._pending:
+                future.cancel()
+            self._pending.clear()
+
+
+class SequenceWriter(_Pipeline):
+
+    """Save the frames of a sequence while the next ones are produced.
+
+    Up to 'queue' frames are saved in background; 'write' waits for the
+    oldest one when the queue is full. A frame must not be changed after it
+    is written: pass a copy if the same image is reused for the next frames.
+    Errors of a save are raised by the next 'write' or by 'close'.
+
+    Example:
+        with SequenceWriter("frame_{0:04d}.tga", compress=True) as writer:
+            for frame in frames:
+                writer.write(frame)
+    """
+
+    def __init__(self, pattern, start=0, queue=4, workers=2, executor=None,
+                 **kwargs):
+        """Initialize the writer.
+
+        Args:
+            pattern (string): format pattern of the names, the '.tga'
+                extension is optional
+            start (int): number of the first frame
+            queue (int): maximum number of frames waiting to be saved
+            workers (int): number of threads of the default pool
+            executor (concurrent.futures.Executor): pool used to save the
+                frames instead of a new thread pool
+            kwargs: arguments of 'Image.save' for all the frames
+        """
+        super(SequenceWriter, self).__init__(queue, workers, executor)
+        self.pattern = pattern
+        self.number = start
+        self.names = []
+        self.__kwargs = kwargs
+
+    def write(self, image):
+        """Queue a frame to be saved with the next number.
+
+        Args:
+            image (Image): the frame
+
+        Returns:
+            string: the name of the file of the frame
+        """
+        while len(self._pending) >= self._ahead:
+            self._pending.popleft().result()
+        file_name = _format(self.pattern, self.number)
+        if file_name.lower().endswith(".tga"):
+            file_name = file_name[:-4]
+        self._pending.append(
+            self._executor.submit(_save, image, file_name, self.__kwargs))
+        self.number += 1
+        self.names.append("{0:s}.tga".format(file_name))
+        return self.names[-1]
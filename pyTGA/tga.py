@@ -1,14 +1,29 @@
-from __future__ import print_function, unicode_literals
-
+import copy
 import io
+import mmap
 import re
-from struct import pack, unpack
-from sys import version_info
+import time
+from collections import deque
+from struct import Struct, pack, unpack
+
+from .backends import _HEADER, get_backend, set_backend
+
+__all__ = ["Image", "ImageError", "TGAStats", "VERSION", "estimate_memory",
+           "get_backend", "hash_file", "iter_rows", "read_info", "set_backend",
+           "set_default_stats", "set_limits"]
+
 
-__all__ = ["Image", "ImageError", "VERSION"]
+VERSION = "2.0.0"
 
+_timer = time.perf_counter
 
-VERSION = "1.1.0"
+# Structs of dec_byte and gen_byte: {(size, littleEndian): Struct}
+_INTEGERS = dict(
+    ((size, little_endian), Struct(('<' if little_endian else '>') +
+                                   format_))
+    for size, format_ in ((1, 'B'), (2, 'H'), (4, 'I'))
+    for little_endian in (True, False)
+)
 
 
 def dec_byte(data, size=1, littleEndian=True):
@@ -22,10 +37,7 @@ def dec_byte(data, size=1, littleEndian=True):
     Returns:
         int: the decoded data
     """
-    order = str('<' if littleEndian else '>')
-    format_ = str((None, 'B', 'H', None, 'I')[size])
-
-    return unpack(order + format_, data)[0]
+    return _INTEGERS[size, bool(littleEndian)].unpack(data)[0]
 
 
 def multiple_dec_byte(stream, num, size=1, littleEndian=True):
@@ -54,10 +66,7 @@ def gen_byte(data, size=1, littleEndian=True):
     Returns:
         bytes[size]: conversion of the data in bytes
     """
-    order = str('<' if littleEndian else '>')
-    format_ = str((None, 'B', 'H', None, 'I')[size])
-
-    return pack(order + format_, data)
+    return _INTEGERS[size, bool(littleEndian)].pack(data)
 
 
 def gen_pixel_rgba(c_r, c_g, c_b, alpha=None):
@@ -75,9 +84,9 @@ def gen_pixel_rgba(c_r, c_g, c_b, alpha=None):
         If alpha is None the result color will be an RGB.
     """
     if alpha is not None:
-        return pack('<I', alpha << 24 | c_r << 16 | c_g << 8 | c_b)
+        return _INTEGERS[4, True].pack(alpha << 24 | c_r << 16 | c_g << 8 | c_b)
     else:
-        return pack('<BBB', c_b, c_g, c_r)
+        return _PIXELS[MATRIX_TYPE['RGB']].pack(c_b, c_g, c_r)
 
 
 def gen_pixel_rgb_16(c_r, c_g, c_b):
@@ -107,7 +116,7 @@ def gen_pixel_rgb_16(c_r, c_g, c_b):
     #
     tmp |= 0b1
 
-    return pack('<H', tmp)
+    return _INTEGERS[2, True].pack(tmp)
 
 
 def get_rgb_from_16(data):
@@ -128,10 +137,154 @@ def get_rgb_from_16(data):
     return (c_r, c_g, c_b)
 
 
+_NUMPY = []
+
+
+def _import_numpy():
+    """Import NumPy only the first time it is needed.
+
+    Returns:
+        module: numpy, None if it is not available
+    """
+    if not _NUMPY:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _NUMPY.append(numpy)
+    return _NUMPY[0]
+
+
+def _half_size(data, width, height, channels):
+    """Reduce a pixel buffer to half size averaging blocks of 2x2 pixels.
+
+    Odd rows and columns are dropped, a dimension of 1 pixel is kept.
+
+    Args:
+        data (bytes): the pixel buffer
+        width (int): number of columns
+        height (int): number of rows
+        channels (int): number of bytes of a pixel
+
+    Returns:
+        tuple(bytearray, int, int): the new buffer, width and height
+    """
+    data = bytearray(data)
+    row_size = width * channels
+    new_width = max(1, width // 2)
+    new_height = max(1, height // 2)
+    # Index of the two bytes to average in a row, for each output byte
+    if width > 1:
+        left = [2 * col * channels + channel for col in range(new_width)
+                for channel in range(channels)]
+        right = [pos + channels for pos in left]
+    else:
+        left = right = list(range(channels))
+
+    tmp = bytearray()
+    for row in range(new_height):
+        top = 2 * row * row_size if height > 1 else 0
+        bottom = top + row_size if height > 1 else top
+        sums = [first + second for first, second in zip(
+            data[top:top + row_size], data[bottom:bottom + row_size])]
+        tmp += bytearray((sums[pos_l] + sums[pos_r] + 2) // 4
+                         for pos_l, pos_r in zip(left, right))
+    return tmp, new_width, new_height
+
+
+def _resize_box(data, width, height, channels, new_width, new_height):
+    """Resize a pixel buffer averaging the pixels covered by each new pixel.
+
+    Args:
+        data (bytes): the pixel buffer
+        width (int): number of columns
+        height (int): number of rows
+        channels (int): number of bytes of a pixel
+        new_width (int): number of columns of the result
+        new_height (int): number of rows of the result
+
+    Returns:
+        bytearray: the new pixel buffer
+    """
+    data = bytearray(data)
+    row_size = width * channels
+
+    def spans(size, new_size):
+        return [(pos * size // new_size,
+                 max(pos * size // new_size + 1, (pos + 1) * size // new_size))
+                for pos in range(new_size)]
+
+    col_spans = spans(width, new_width)
+    tmp = bytearray()
+    for first, last in spans(height, new_height):
+        # Sum of the rows covered, byte by byte
+        sums = list(data[first * row_size:(first + 1) * row_size])
+        for row in range(first + 1, last):
+            sums = [total + value for total, value in zip(
+                sums, data[row * row_size:(row + 1) * row_size])]
+        rows = last - first
+        for start, stop in col_spans:
+            count = rows * (stop - start)
+            for channel in range(channels):
+                total = sum(sums[start * channels + channel:
+                                 stop * channels:channels])
+                tmp.append((total + count // 2) // count)
+    return tmp
+
+
+def _resize_bilinear(data, width, height, channels, new_width, new_height):
+    """Resize a pixel buffer interpolating the 4 nearest pixels.
+
+    Args:
+        data (bytes): the pixel buffer
+        width (int): number of columns
+        height (int): number of rows
+        channels (int): number of bytes of a pixel
+        new_width (int): number of columns of the result
+        new_height (int): number of rows of the result
+
+    Returns:
+        bytearray: the new pixel buffer
+    """
+    data = bytearray(data)
+    row_size = width * channels
+
+    def weights(size, new_size):
+        tmp = []
+        for pos in range(new_size):
+            src = min(max((pos + 0.5) * size / float(new_size) - 0.5, 0.0),
+                      size - 1)
+            first = int(src)
+            tmp.append((first, min(first + 1, size - 1), src - first))
+        return tmp
+
+    col_weights = weights(width, new_width)
+    tmp = bytearray()
+    for top, bottom, weight_y in weights(height, new_height):
+        row_top = data[top * row_size:(top + 1) * row_size]
+        row_bottom = data[bottom * row_size:(bottom + 1) * row_size]
+        # Vertical interpolation first, then horizontal
+        row = [first + (second - first) * weight_y
+               for first, second in zip(row_top, row_bottom)]
+        for left, right, weight_x in col_weights:
+            for channel in range(channels):
+                first = row[left * channels + channel]
+                second = row[right * channels + channel]
+                tmp.append(int(first + (second - first) * weight_x + 0.5))
+    return tmp
+
+
 class TGAHeader(object):
 
     """Header object for TGA files."""
 
+    FIELDS = ('id_length', 'color_map_type', 'image_type',
+              'first_entry_index', 'color_map_length', 'color_map_entry_size',
+              'x_origin', 'y_origin', 'image_width', 'image_height',
+              'pixel_depht', 'image_descriptor')
+
+    __slots__ = FIELDS
+
     def __init__(self):
         """Initialize all fields.
 
@@ -213,36 +366,58 @@ class TGAHeader(object):
 
         Returns:
             bytes: the conversion in bytes"""
-        tmp = bytearray()
+        return _HEADER.pack(
+            self.id_length, self.color_map_type, self.image_type,
+            self.first_entry_index, self.color_map_length,
+            self.color_map_entry_size, self.x_origin, self.y_origin,
+            self.image_width, self.image_height, self.pixel_depht,
+            self.image_descriptor
+        )
 
-        tmp += gen_byte(self.id_length)
-        tmp += gen_byte(self.color_map_type)
-        tmp += gen_byte(self.image_type)
-        tmp += gen_byte(self.first_entry_index, 2)
-        tmp += gen_byte(self.color_map_length, 2)
-        tmp += gen_byte(self.color_map_entry_size)
-        tmp += gen_byte(self.x_origin, 2)
-        tmp += gen_byte(self.y_origin, 2)
-        tmp += gen_byte(self.image_width, 2)
-        tmp += gen_byte(self.image_height, 2)
-        tmp += gen_byte(self.pixel_depht)
-        tmp += gen_byte(self.image_descriptor)
+    def from_bytes(self, data):
+        """Set all fields from the bytes of a header.
 
-        return tmp
+        Args:
+            data (bytes[18]): the header read from a file
+
+        Returns:
+            TGAHeader
+        """
+        for field, value in zip(self.FIELDS,
+                                get_backend().parse_header(data)):
+            setattr(self, field, value)
+
+        return self
+
+    @property
+    def data_offset(self):
+        """int: position of the pixel data in the file.
+
+        The pixel data follow the header, the image id and the color map.
+        """
+        return 18 + self.id_length + self.color_map_length * \
+            ((self.color_map_entry_size + 7) // 8)
+
+    @property
+    def bytes_per_pixel(self):
+        """int: number of bytes of a pixel in the file."""
+        return (self.pixel_depht + 7) // 8
 
 
 class TGAFooter(object):
 
     """Footer object for TGA files."""
 
+    # Offsets (4 bytes each) and signature "TRUEVISION-XFILE.\0" (18 bytes)
+    STRUCT = Struct('<II18s')
+    SIGNATURE = b"TRUEVISION-XFILE.\0"
+
+    __slots__ = ('extension_area_offset', 'developer_directory_offset')
+
     def __init__(self):
         """Initialize all fields."""
         self.extension_area_offset = 0  # 4 bytes
         self.developer_directory_offset = 0  # 4 bytes
-        self.__signature = bytes(
-            bytearray("TRUEVISION-XFILE".encode('ascii')))  # 16 bytes
-        self.__dot = bytes(bytearray('.'.encode('ascii')))  # 1 byte
-        self.__end = bytes(bytearray([0]))  # 1 byte
 
     def to_bytes(self):
         """Convert the object to bytes.
@@ -250,179 +425,1736 @@ class TGAFooter(object):
         Returns:
             bytes: the conversion in bytes
         """
+        return self.STRUCT.pack(self.extension_area_offset,
+                                self.developer_directory_offset,
+                                self.SIGNATURE)
+
+    def from_bytes(self, data):
+        """Set the offsets from the last 26 bytes of a file.
+
+        Args:
+            data (bytes[26]): the footer read from a file
+
+        Returns:
+            bool: if the data contains the signature of the new TGA format
+        """
+        self.extension_area_offset, self.developer_directory_offset, \
+            signature = self.STRUCT.unpack(bytes(data))
+
+        return signature == self.SIGNATURE
+
+
+class TGAExtension(object):
+
+    """Extension area of new TGA files (only the fields used by pyTGA)."""
+
+    SIZE = 495
+
+    FIELDS = ('author_name', 'author_comments', 'timestamp', 'job_name',
+              'job_time', 'software_id', 'software_version', 'key_color',
+              'pixel_aspect_ratio', 'gamma', 'color_correction_offset',
+              'postage_stamp_offset', 'scan_line_offset', 'attributes_type')
+
+    __slots__ = FIELDS
+
+    def __init__(self):
+        """Initialize all fields."""
+        self.author_name = ""  # 41 bytes
+        self.author_comments = ""  # 324 bytes
+        self.timestamp = None  # 12 bytes: month, day, year, h, m, s
+        self.job_name = ""  # 41 bytes
+        self.job_time = None  # 6 bytes: hours, minutes, seconds
+        self.software_id = ""  # 41 bytes
+        self.software_version = None  # 3 bytes: number * 100, letter
+        self.key_color = 0  # 4 bytes
+        self.pixel_aspect_ratio = None  # 4 bytes: numerator, denominator
+        self.gamma = None  # 4 bytes: numerator, denominator
+        self.color_correction_offset = 0  # 4 bytes
+        self.postage_stamp_offset = 0  # 4 bytes
+        self.scan_line_offset = 0  # 4 bytes
+        self.attributes_type = 0  # 1 byte
+
+    @staticmethod
+    def __text(data):
+        return data.split(b'\0', 1)[0].decode('ascii', 'replace').strip()
+
+    def from_bytes(self, data):
+        """Set all fields from the bytes of an extension area.
+
+        Args:
+            data (bytes[495]): the extension area read from a file
+
+        Returns:
+            TGAExtension
+        """
+        self.author_name = self.__text(data[2:43])
+        self.author_comments = self.__text(data[43:367])
+        self.timestamp = unpack('<6H', data[367:379])
+        self.job_name = self.__text(data[379:420])
+        self.job_time = unpack('<3H', data[420:426])
+        self.software_id = self.__text(data[426:467])
+        self.software_version = (dec_byte(data[467:469], 2),
+                                 self.__text(data[469:470]))
+        self.key_color = dec_byte(data[470:474], 4)
+        self.pixel_aspect_ratio = unpack('<2H', data[474:478])
+        self.gamma = unpack('<2H', data[478:482])
+        self.color_correction_offset = dec_byte(data[482:486], 4)
+        self.postage_stamp_offset = dec_byte(data[486:490], 4)
+        self.scan_line_offset = dec_byte(data[490:494], 4)
+        self.attributes_type = dec_byte(data[494:495])
+
+        return self
+
+
+ORIGINS = {
+    0b00: 'bl',
+    0b01: 'br',
+    0b10: 'tl',
+    0b11: 'tr',
+}
+
+
+def read_info(file_name):
+    """Read the metadata of a TGA image without decoding the pixels.
+
+    Only the header, the footer and the extension area are read.
+
+    Args:
+        file_name (string): the name of the TGA image
+
+    Returns:
+        dict: the fields of the header ('image_type', 'image_width',
+            'image_height', 'pixel_depht', ...), 'origin' (the destination
+            of the first pixel, see 'set_first_pixel_destination'),
+            'new_format', 'file_size' and, if present, 'extension' with the
+            fields of the extension area
+
+    Raises:
+        ImageError
+    """
+    with open(file_name, "rb") as image_file:
+        image_file.seek(0, 2)
+        file_size = image_file.tell()
+        image_file.seek(0)
+        data = image_file.read(18)
+        if len(data) < 18:
+            raise ImageError("file ends in the header", 'truncated_data')
+        header = TGAHeader().from_bytes(data)
+
+        footer = TGAFooter()
+        new_format = False
+        if file_size >= 18 + 26:
+            image_file.seek(-26, 2)
+            new_format = footer.from_bytes(image_file.read(26))
+
+        extension = None
+        if new_format and footer.extension_area_offset and \
+                footer.extension_area_offset + TGAExtension.SIZE <= file_size:
+            image_file.seek(footer.extension_area_offset)
+            extension = TGAExtension().from_bytes(
+                image_file.read(TGAExtension.SIZE))
+
+    info = dict((field, getattr(header, field)) for field in header.FIELDS)
+    info['origin'] = ORIGINS[(header.image_descriptor >> 4) & 0b11]
+    info['attribute_bits'] = header.image_descriptor & 0b1111
+    info['new_format'] = new_format
+    info['file_size'] = file_size
+    if extension is not None:
+        info['extension'] = dict((field, getattr(extension, field))
+                                 for field in extension.FIELDS)
+    return info
+
+
+def iter_rows(file_name):
+    """Decode a TGA image one row at a time.
+
+    Only one row is kept in memory, so this is useful to process images
+    bigger than the memory available.
+
+    Args:
+        file_name (string): the name of the TGA image
+
+    Yields:
+        bytes: the pixels of a row, in the same format of 'get_pixels'
+
+    Raises:
+        ImageError
+    """
+    with open(file_name, "rb") as image_file:
+        data = image_file.read(18)
+        if len(data) < 18:
+            raise ImageError("file ends in the header", 'truncated_data')
+        header = TGAHeader().from_bytes(data)
+        if header.image_type not in (2, 3, 10, 11):
+            raise ImageError(
+                "type num '{0}'' is not supported".format(header.image_type),
+                'non_supported_type'
+            )
+        image_file = io.BufferedReader(image_file)
+        image_file.seek(header.data_offset)
+        backend = get_backend()
+        pixel_size = header.bytes_per_pixel
+        row_size = header.image_width * pixel_size
+        depht = header.pixel_depht
+
+        if header.image_type in (2, 3):
+            for row in range(header.image_height):
+                data = image_file.read(row_size)
+                if len(data) < row_size:
+                    raise ImageError("pixel data ends before the last pixel",
+                                     'truncated_data')
+                yield bytes(backend.to_matrix(data, depht))
+            return
+
         tmp = bytearray()
+        rows = 0
+        while rows < header.image_height:
+            repetition_count = bytearray(image_file.read(1))
+            if not repetition_count:
+                raise ImageError("pixel data ends before the last pixel",
+                                 'truncated_data')
+            count = (repetition_count[0] & 0b01111111) + 1
+            if repetition_count[0] & 0b10000000:
+                size, repeat = pixel_size, count
+            else:
+                size, repeat = pixel_size * count, 1
+            data = image_file.read(size)
+            if len(data) < size:
+                raise ImageError("pixel data ends before the last pixel",
+                                 'truncated_data')
+            tmp += data * repeat
+            while len(tmp) >= row_size and rows < header.image_height:
+                yield bytes(backend.to_matrix(tmp[:row_size], depht))
+                del tmp[:row_size]
+                rows += 1
+
+
+def _matrix_type(header):
+    """Kind of pixels of a PixelMatrix for an image.
+
+    Args:
+        header (TGAHeader): the header of the image
+
+    Returns:
+        string: the kind of pixels (see MATRIX_TYPE)
+
+    Raises:
+        ImageError
+    """
+    if header.image_type in (3, 11) and header.pixel_depht == 8:
+        return MATRIX_TYPE['BW']
+    elif header.image_type in (2, 10):
+        if header.pixel_depht in (16, 24):
+            return MATRIX_TYPE['RGB']
+        elif header.pixel_depht == 32:
+            return MATRIX_TYPE['RGBA']
+    raise ImageError(
+        "type num '{0}'' with {1} bit pixels is not supported".format(
+            header.image_type, header.pixel_depht),
+        'non_supported_type'
+    )
+
+
+# Limits of Image.load when none is passed
+_LIMITS = {'max_pixels': None, 'max_bytes': None}
+
+
+def set_limits(max_pixels=None, max_bytes=None):
+    """Set the limits used when none is passed to load.
+
+    Args:
+        max_pixels (int): maximum number of pixels of an image, None for no
+            limit
+        max_bytes (int): maximum memory needed to load an image (see
+            'estimate_memory'), None for no limit
+
+    Returns:
+        tuple: the previous limits (max_pixels, max_bytes)
+    """
+    previous = (_LIMITS['max_pixels'], _LIMITS['max_bytes'])
+    _LIMITS['max_pixels'] = max_pixels
+    _LIMITS['max_bytes'] = max_bytes
+    return previous
+
+
+def _estimate_memory(header, payload_size=None):
+    """Memory needed to load an image: payload, RLE expansion and pixels.
+
+    Args:
+        header (TGAHeader): the header of the image
+        payload_size (int): bytes after the header in the file (default:
+            the largest payload of the image)
+
+    Returns:
+        int: number of bytes
+
+    Raises:
+        ImageError
+    """
+    type_ = _matrix_type(header)
+    pixels = header.image_width * header.image_height
+    file_pixels = pixels * header.bytes_per_pixel
+    compressed = header.image_type in (10, 11)
+    if payload_size is None:
+        # Raw packets of 128 pixels in the worst case
+        payload_size = file_pixels + (-(-pixels // 128) if compressed else 0)
+    return payload_size + pixels * len(type_) + (
+        file_pixels if compressed else 0)
+
+
+def estimate_memory(header_or_path):
+    """Estimate the peak memory used by Image.load for an image.
+
+    The estimate is the sum of the data read from the file, of the expanded
+    pixels of compressed images and of the pixel buffer; only the header is
+    read from the file.
+
+    Args:
+        header_or_path (TGAHeader or string): the header or the name of the
+            image
+
+    Returns:
+        int: number of bytes
+
+    Raises:
+        ImageError
+    """
+    if isinstance(header_or_path, TGAHeader):
+        return _estimate_memory(header_or_path)
+
+    with open(header_or_path, "rb") as image_file:
+        data = image_file.read(18)
+        if len(data) < 18:
+            raise ImageError("file ends in the header", 'truncated_data')
+        header = TGAHeader().from_bytes(data)
+        image_file.seek(0, 2)
+        file_size = image_file.tell()
+    return _estimate_memory(header, max(file_size - header.data_offset, 0))
+
+
+def _check_limits(header, payload_size, max_pixels=None, max_bytes=None):
+    """Check an image before allocating memory for its pixels.
+
+    Args:
+        header (TGAHeader): the header of the image
+        payload_size (int): bytes of pixel data in the file, None to skip the
+            check of the payload length
+        max_pixels (int): maximum number of pixels (default: the global one)
+        max_bytes (int): maximum memory needed (default: the global one)
+
+    Raises:
+        ImageError
+    """
+    if max_pixels is None:
+        max_pixels = _LIMITS['max_pixels']
+    if max_bytes is None:
+        max_bytes = _LIMITS['max_bytes']
+
+    pixels = header.image_width * header.image_height
+    if max_pixels is not None and pixels > max_pixels:
+        raise ImageError(
+            "image of {0}x{1} pixels exceeds the limit of {2} pixels".format(
+                header.image_width, header.image_height, max_pixels),
+            'image_too_large'
+        )
+    if max_bytes is not None:
+        needed = _estimate_memory(header, payload_size)
+        if needed > max_bytes:
+            raise ImageError(
+                "loading the image needs {0} bytes, the limit is {1}".format(
+                    needed, max_bytes),
+                'image_too_large'
+            )
+
+    if payload_size is None:
+        return
+    if header.image_type in (10, 11):
+        # A packet has at most 128 pixels
+        needed = -(-pixels // 128) * (1 + header.bytes_per_pixel)
+    else:
+        needed = pixels * header.bytes_per_pixel
+    if payload_size < needed:
+        raise ImageError(
+            "the image needs at least {0} bytes of pixel data, "
+            "the file has {1}".format(needed, payload_size),
+            'truncated_data'
+        )
+
+
+def _check_region(region, width, height):
+    """Check that a rectangle is inside an image.
+
+    Args:
+        region (tuple): x (first column), y (first row), width and height
+        width (int): number of columns of the image
+        height (int): number of rows of the image
+
+    Returns:
+        tuple: the region
+
+    Raises:
+        ImageError
+    """
+    x, y, region_width, region_height = region
+    if x < 0 or y < 0 or region_width <= 0 or region_height <= 0 or \
+            x + region_width > width or y + region_height > height:
+        raise ImageError(
+            "region {0} is not inside the image of {1}x{2} pixels".format(
+                tuple(region), width, height),
+            'bad_pixel_position'
+        )
+    return x, y, region_width, region_height
+
+
+def _scan_line_start(image_file, extension_offset, row, data_start,
+                     data_end):
+    """Position of a row of a compressed image from the scan-line table.
+
+    Args:
+        image_file (file): the TGA image
+        extension_offset (int): position of the extension area, 0 if none
+        row (int): the row
+        data_start (int): position of the pixel data
+        data_end (int): end of the pixel data
+
+    Returns:
+        int: the position of the first packet of the row, None if the
+            image has no valid scan-line table
+    """
+    if not extension_offset:
+        return None
+    image_file.seek(extension_offset)
+    data = image_file.read(TGAExtension.SIZE)
+    if len(data) < TGAExtension.SIZE:
+        return None
+    table = TGAExtension().from_bytes(data).scan_line_offset
+    if not table:
+        return None
+    image_file.seek(table + 4 * row)
+    data = image_file.read(4)
+    if len(data) < 4:
+        return None
+    start = dec_byte(data, 4)
+    return start if data_start <= start < data_end else None
+
+
+def _rle_skip(data, pos, end, pixel_size, pixels):
+    """Skip the packets of the first pixels of RLE data.
+
+    Args:
+        data (memoryview): the data of the file
+        pos (int): position of the first packet
+        end (int): end of the pixel data
+        pixel_size (int): size in bytes of a pixel in the file
+        pixels (int): number of pixels to skip
+
+    Returns:
+        tuple: position of the packet with the next pixel and number of
+            pixels of that packet to skip
+
+    Raises:
+        ImageError
+    """
+    while pos < end:
+        repetition_count = data[pos]
+        count = (repetition_count & 0b01111111) + 1
+        if count > pixels:
+            return pos, pixels
+        pixels -= count
+        if repetition_count & 0b10000000:
+            pos += 1 + pixel_size
+        else:
+            pos += 1 + pixel_size * count
+    raise ImageError("pixel data ends before the region", 'truncated_data')
+
+
+def _rle_decode_at(data, pos, skip, end, pixel_size, pixels):
+    """Decode RLE pixels starting in the middle of a packet.
+
+    Args:
+        data (memoryview): the data of the file
+        pos (int): position of the packet with the first pixel
+        skip (int): number of pixels of that packet to skip
+        end (int): end of the pixel data
+        pixel_size (int): size in bytes of a pixel in the file
+        pixels (int): number of pixels to decode
+
+    Returns:
+        tuple: the pixels in the file format (bytearray), the number of
+            bytes of data used and the number of run-length and raw packets
+
+    Raises:
+        ImageError
+    """
+    start = pos
+    prefix = bytearray()
+    if skip:
+        repetition_count = data[pos]
+        count = (repetition_count & 0b01111111) + 1
+        if repetition_count & 0b10000000:
+            prefix.append(0b10000000 | (count - skip - 1))
+            prefix += data[pos + 1:pos + 1 + pixel_size]
+            pos += 1 + pixel_size
+        else:
+            prefix.append(count - skip - 1)
+            prefix += data[pos + 1 + skip * pixel_size:
+                           pos + 1 + count * pixel_size]
+            pos += 1 + count * pixel_size
+    # Enough data for the pixels even with packets of one pixel
+    payload = bytes(prefix) + data[
+        pos:min(pos + pixels * (1 + pixel_size), end)].tobytes()
+
+    try:
+        tmp, used, run_packets, raw_packets, _ = get_backend().rle_decode(
+            payload, pixel_size, pixels, 1)
+    except ValueError:
+        raise ImageError("pixel data ends before the region",
+                         'truncated_data')
+    return tmp, used - len(prefix) + (pos - start), run_packets, raw_packets
+
+
+def _pick_columns(data, rows, row_size, first, count, step, pixel_size):
+    """Select every step-th pixel of a span of each row.
+
+    Args:
+        data (bytes): the rows, one after the other
+        rows (int): number of rows
+        row_size (int): size in bytes of a row
+        first (int): first column
+        count (int): number of columns of the span
+        step (int): distance between the columns selected
+        pixel_size (int): size in bytes of a pixel
+
+    Returns:
+        bytes: the selected pixels of each row, one row after the other
+    """
+    if first == 0 and count * pixel_size == row_size and step == 1:
+        return bytes(data)
+    span = count * pixel_size
+    selected = (count + step - 1) // step
+    tmp = bytearray(rows * selected * pixel_size)
+    view = memoryview(data)
+    for row in range(rows):
+        start = row * row_size + first * pixel_size
+        line = view[start:start + span]
+        dest = row * selected * pixel_size
+        for channel in range(pixel_size):
+            tmp[dest + channel:dest + selected * pixel_size:pixel_size] = \
+                line[channel::pixel_size * step]
+    return bytes(tmp)
+
+
+def _read_region(image_file, header, width, region, data_start, data_end,
+                 extension_offset=0, step=1):
+    """Read the pixels of a rectangle of an image.
+
+    Rows of uncompressed images are read with a seek for each row; the
+    packets of compressed images before the first row of the rectangle are
+    skipped (or found with the scan-line table) and the decoding stops after
+    its last row. With a step greater than one only every step-th pixel of
+    every step-th row is kept, and the packets of the other rows are skipped.
+
+    Args:
+        image_file (file): the TGA image
+        header (TGAHeader): the header of the image
+        width (int): number of columns of the image
+        region (tuple): x, y, width and height of the rectangle
+        data_start (int): position of the pixel data
+        data_end (int): end of the pixel data
+        extension_offset (int): position of the extension area, 0 if none
+        step (int): distance between the rows and the columns kept
+
+    Returns:
+        tuple: the pixels in the file format (bytes), the number of bytes
+            of pixel data used and the number of run-length and raw packets
+            decoded
+
+    Raises:
+        ImageError
+    """
+    x, y, region_width, region_height = region
+    pixel_size = header.bytes_per_pixel
+    row_size = width * pixel_size
+    span = region_width * pixel_size
+    rows = range(y, y + region_height, step)
+
+    if header.image_type in (2, 3):
+        if data_start + (y + region_height) * row_size > data_end:
+            raise ImageError("pixel data ends before the region",
+                             'truncated_data')
+        if region_width == width and step == 1:
+            image_file.seek(data_start + y * row_size)
+            data = image_file.read(region_height * row_size)
+            return data, len(data), 0, 0
+        data = bytearray()
+        for row in rows:
+            image_file.seek(data_start + row * row_size + x * pixel_size)
+            data += image_file.read(span)
+        return _pick_columns(data, len(rows), span, 0, region_width, step,
+                             pixel_size), len(data), 0, 0
+
+    pos = _scan_line_start(image_file, extension_offset, y, data_start,
+                           data_end)
+    skip = 0
+    if pos is None:
+        pos = data_start
+        skip = y * width
+
+    run_packets = raw_packets = used = 0
+    mapped = mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        with memoryview(mapped) as view:
+            pos, skip = _rle_skip(view, pos, data_end, pixel_size, skip)
+            if step == 1:
+                data, used, run_packets, raw_packets = _rle_decode_at(
+                    view, pos, skip, data_end, pixel_size,
+                    width * region_height)
+            else:
+                data = bytearray()
+                for row in rows:
+                    if row != y:
+                        pos, skip = _rle_skip(view, pos, data_end, pixel_size,
+                                              skip + step * width)
+                    tmp, row_used, row_run, row_raw = _rle_decode_at(
+                        view, pos, skip, data_end, pixel_size, width)
+                    data += tmp
+                    used += row_used
+                    run_packets += row_run
+                    raw_packets += row_raw
+    finally:
+        mapped.close()
+
+    return _pick_columns(data, len(rows), row_size, x, region_width, step,
+                         pixel_size), used, run_packets, raw_packets
+
+
+def _content_hasher(width, height, type_, algorithm):
+    # hashlib loads OpenSSL, it is imported only when an image is hashed
+    import hashlib
+    hasher = hashlib.new(algorithm)
+    hasher.update("{0}x{1}:{2}:".format(width, height, type_).encode('ascii'))
+    return hasher
+
+
+def hash_file(file_name, algorithm='sha256'):
+    """Compute the content hash of a TGA image, decoding a row at a time.
+
+    The result is the same of 'Image.content_hash' for the image loaded, so
+    compressed and uncompressed files of the same pixels have the same hash.
+
+    Args:
+        file_name (string): the name of the TGA image
+        algorithm (string): a hashlib algorithm
+
+    Returns:
+        string: the hex digest of the hash
+
+    Raises:
+        ImageError
+    """
+    with open(file_name, "rb") as image_file:
+        data = image_file.read(18)
+        if len(data) < 18:
+            raise ImageError("file ends in the header", 'truncated_data')
+        header = TGAHeader().from_bytes(data)
+    hasher = _content_hasher(header.image_width, header.image_height,
+                             _matrix_type(header), algorithm)
+    for row in iter_rows(file_name):
+        hasher.update(row)
+    return hasher.hexdigest()
+
+
+class TGAStats(object):
+
+    """Statistics collected during load and save operations.
+
+    Pass an instance to 'Image.load' or 'Image.save' (or set it globally
+    with 'set_default_stats') to know where the time goes. Values are
+    accumulated, so the same object can be used for many operations; call
+    'reset' to start again.
+
+    Timings are stored in seconds for each phase:
+        - footer: footer parsing (load)
+        - header: header parsing (load) or generation (save)
+        - read: payload read from the file (load)
+        - decode: payload decoding (load)
+        - buffer: PixelMatrix construction (load)
+        - encode: payload encoding (save)
+        - write: file write (save)
+
+    To receive a callback for each phase override 'add_time'.
+    """
+
+    def __init__(self):
+        """Initialize all counters."""
+        self.reset()
+
+    def reset(self):
+        """Reset all counters.
+
+        Returns:
+            TGAStats
+        """
+        self.timings = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.run_packets = 0
+        self.raw_packets = 0
+        # Size of the pixel data, compressed and uncompressed
+        self.payload_bytes = 0
+        self.raw_bytes = 0
+        # Compression used by the last save (see compress='auto')
+        self.compressed = None
+        return self
+
+    def add_time(self, phase, seconds):
+        """Add the time spent in a phase.
+
+        Args:
+            phase (string): name of the phase
+            seconds (float): time spent
+        """
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+
+    @property
+    def compression_ratio(self):
+        """float: uncompressed size / stored size of the pixel data."""
+        if not self.payload_bytes:
+            return 1.0
+        return float(self.raw_bytes) / self.payload_bytes
+
+    def __repr__(self):
+        return "TGAStats(timings={0!r}, bytes_read={1}, bytes_written={2}, "\
+            "run_packets={3}, raw_packets={4}, compression_ratio={5:.3f})".format(
+                self.timings, self.bytes_read, self.bytes_written,
+                self.run_packets, self.raw_packets, self.compression_ratio)
+
+
+class _Phase(object):
+
+    """Context manager that measures a phase for a TGAStats object."""
+
+    def __init__(self, stats, name):
+        self.__stats = stats
+        self.__name = name
+        self.__start = None
+
+    def __enter__(self):
+        self.__start = _timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.__stats.add_time(self.__name, _timer() - self.__start)
+        return False
+
+
+class _NoPhase(object):
+
+    """Do nothing context manager used when statistics are disabled."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+_DEFAULT_STATS = None
+
+
+def set_default_stats(stats):
+    """Set the statistics object used when none is passed to load or save.
+
+    Args:
+        stats (TGAStats): the object that collects statistics, None to
+            disable the collection
+
+    Returns:
+        TGAStats: the previous default object
+    """
+    global _DEFAULT_STATS
+    previous = _DEFAULT_STATS
+    _DEFAULT_STATS = stats
+    return previous
+
+
+def _get_stats(stats):
+    return stats if stats is not None else _DEFAULT_STATS
+
+
+def _phase(stats, name):
+    return _Phase(stats, name) if stats is not None else _NO_PHASE
+
+
+class ImageError(Exception):
+
+    """Error of the Image class."""
+
+    def __init__(self, msg, errname):
+        super(ImageError, self).__init__(msg)
+        error_map = {
+            'pixel_dest_position': -10,
+            'bad_row_length': -21,
+            'bad_pixel_length': -22,
+            'bad_pixel_value': -23,
+            'bad_pixel_position': -24,
+            'non_compatible_image': -25,
+            'bad_buffer': -26,
+            'non_supported_type': -31,
+            'non_supported_mode': -32,
+            'truncated_data': -33,
+            'image_too_large': -34,
+            'read_only_image': -40,
+        }
+        self.errno = error_map.get(errname, None)
+
+
+MATRIX_TYPE = {
+    'BW': "B",
+    'RGB': "BBB",
+    'RGBA': "BBBB"
+}
+
+# Compiled formats of the pixels of each kind of matrix
+_PIXELS = dict((type_, Struct('<' + type_))
+               for type_ in MATRIX_TYPE.values())
+
+
+def _pack_pixel(type_, value):
+    """Convert a pixel to bytes in the format of a matrix.
+
+    Args:
+        type_ (string): kind of pixels (see MATRIX_TYPE)
+        value (int-tuple): the pixel
+
+    Returns:
+        bytes
+    """
+    if len(type_) == 1:
+        return _PIXELS[type_].pack(value)
+    return _PIXELS[type_].pack(*value)
+
+
+class RowBuffer(object):
+
+    __slots__ = ('__data', '__start_pos', '__elm_size', '__row_size',
+                 '__struct', '__index')
+
+    def __init__(self, data, start, row_size, type_=MATRIX_TYPE['BW']):
+        self.__data = data
+        self.__start_pos = start
+        self.__elm_size = len(type_)
+        self.__row_size = row_size
+        self.__struct = _PIXELS[type_]
+        self.__index = -1
+
+    def __getitem__(self, index):
+        result = self.__struct.unpack_from(
+            self.__data, self.__start_pos + index * self.__elm_size)
+        return result if len(result) > 1 else result[0]
+
+    def set_pixel(self, index, value):
+        offset = self.__start_pos + index * self.__elm_size
+        if self.__elm_size == 1:
+            self.__struct.pack_into(self.__data, offset, value)
+        else:
+            self.__struct.pack_into(self.__data, offset, *value)
+
+    def __len__(self):
+        return self.__row_size
+
+    def __iter__(self):
+        self.__index = -1
+        return self
+
+    def __next__(self):
+        self.__index += 1
+        if self.__index < self.__row_size:
+            return self[self.__index]
+        raise StopIteration
+
+
+def _mirror_row(data, elm_size):
+    """Reverse the order of the pixels of a row.
+
+    Args:
+        data (bytearray): the pixels of the row
+        elm_size (int): number of bytes of a pixel
+
+    Returns:
+        bytearray
+    """
+    tmp = bytearray(len(data))
+    for channel in range(elm_size):
+        tmp[channel::elm_size] = data[channel::elm_size][::-1]
+    return tmp
+
+
+class PixelMatrix(object):
+
+    """Pixels of an image in a flat buffer, rows one after the other.
+
+    A matrix created with 'copy' or 'view' shares the buffer of its source
+    (copy on write): the rows are read from the shared buffer, where a view
+    can start at any pixel, go up the rows or read them right to left, and
+    a row is copied in the matrix the first time it is changed. When all the
+    rows are copied, or the other matrices that use the buffer are gone, the
+    matrix has a flat buffer again. A buffer that can be changed from outside
+    (a writable view from 'getbuffer' or a memoryview of the caller) is
+    never shared: 'copy' and 'view' copy its pixels.
+    """
+
+    __slots__ = ('__height', '__width', '__row_length', '__type', '__buffer',
+                 '__index', '__share', '__base', '__origin', '__stride',
+                 '__mirror', '__rows', '__exported')
+
+    def __init__(self, data=None, height=640, width=480, type_=MATRIX_TYPE['BW']):
+        # Shared buffer: number of matrices that use it (a list, shared
+        # with them), position and distance of the rows, rows read from
+        # right to left and rows already copied {row: bytearray}
+        self.__share = None
+        self.__base = None
+        self.__origin = 0
+        self.__stride = 0
+        self.__mirror = False
+        self.__rows = {}
+        # The flat buffer was exported with a writable view
+        self.__exported = False
+        self.__height = len(data) if data is not None else height
+        self.__width = len(data[0]) if data is not None else width
+        self.__row_length = self.__width * len(type_)
+        self.__type = type_
+        self.__buffer = bytearray()
+        self.__index = -1
+        if data is None:
+            self.__buffer = bytearray(self.nbytes)
+        else:
+            if isinstance(data, list):
+                if isinstance(data[0][0], int):
+                    elm_size = 1
+                else:
+                    elm_size = len(data[0][0])
+
+                if elm_size == 1:
+                    self.__type = MATRIX_TYPE['BW']
+                elif elm_size == 3:
+                    self.__type = MATRIX_TYPE['RGB']
+                elif elm_size == 4:
+                    self.__type = MATRIX_TYPE['RGBA']
+                else:
+                    raise Exception(
+                        "Data not compatible with BW, RGB or RGBA format, tuple has lenght {}".format(elm_size))
+                self.__row_length = self.__width * len(self.__type)
+                self.__buffer_from_data(data)
+
+    def __del__(self):
+        if self.__share is not None:
+            self.__share[0] -= 1
+
+    @classmethod
+    def from_bytes(cls, data, height, width, type_=MATRIX_TYPE['BW']):
+        """Create a matrix that uses a pixel buffer.
+
+        A bytearray or a writable memoryview is used as it is, anything else
+        is copied.
+
+        Args:
+            data (bytes): the pixels, in the same format of 'get_pixels'
+            height (int): number of rows
+            width (int): number of columns
+            type_ (string): kind of pixels (see MATRIX_TYPE)
+
+        Returns:
+            PixelMatrix
+        """
+        tmp = cls(height=0, width=width, type_=type_)
+        tmp.__height = height
+        if isinstance(data, bytearray) or \
+                (isinstance(data, memoryview) and not data.readonly):
+            tmp.__buffer = data
+        else:
+            tmp.__buffer = bytearray(data)
+        return tmp
+
+    def __buffer_from_data(self, data):
+        if self.__type == MATRIX_TYPE['BW']:
+            self.__buffer = bytearray(
+                pack('<' + self.__type*self.__width*self.__height, *[
+                    value for row in data for value in row
+                ])
+            )
+        else:
+            self.__buffer = bytearray(
+                pack('<' + self.__type*self.__width*self.__height, *[
+                    value for row in data for column in row for value in column
+                ])
+            )
+
+    def __row_data(self, index):
+        """Read a row of a matrix that shares its buffer.
+
+        Args:
+            index (int): the row
+
+        Returns:
+            bytearray: the pixels of the row
+        """
+        if index in self.__rows:
+            return self.__rows[index]
+        start = self.__origin + index * self.__stride
+        data = self.__base[start:start + self.__row_length]
+        if self.__mirror:
+            data = _mirror_row(data, len(self.__type))
+        return data
+
+    def __detach(self, buffer):
+        """Stop sharing the buffer.
+
+        Args:
+            buffer (bytearray): the new flat buffer of the matrix
+        """
+        self.__share[0] -= 1
+        self.__share = self.__base = None
+        self.__origin = self.__stride = 0
+        self.__mirror = False
+        self.__rows = {}
+        self.__buffer = buffer
+
+    def __whole_buffer(self):
+        """Control if the shared buffer can be taken by the matrix.
+
+        Returns:
+            bool: no other matrix uses the buffer and it has exactly the
+                rows of the matrix
+        """
+        return self.__share[0] == 1 and not self.__mirror and \
+            self.__origin == 0 and self.__stride == self.__row_length and \
+            len(self.__base) == self.nbytes
+
+    def __own_buffer(self, copy=False):
+        """Get a flat buffer again, copying the rows not copied yet.
+
+        Args:
+            copy (bool): copy the rows even if the shared buffer could be
+                taken as it is
+        """
+        if not copy and self.__whole_buffer():
+            buffer = self.__base
+            for index, data in self.__rows.items():
+                start = index * self.__row_length
+                buffer[start:start + self.__row_length] = data
+        else:
+            buffer = bytearray()
+            for index in range(self.__height):
+                buffer += self.__row_data(index)
+        self.__detach(buffer)
+
+    def __private_row(self, index):
+        """Get a row that can be changed.
+
+        Args:
+            index (int): the row
+
+        Returns:
+            tuple: the buffer with the row and the position of the row
+        """
+        if self.__base is not None:
+            if self.__whole_buffer():
+                self.__own_buffer()
+            else:
+                self.__rows[index] = self.__row_data(index)
+                if len(self.__rows) == self.__height:
+                    self.__own_buffer()
+        if self.__base is None:
+            return self.__buffer, index * self.__row_length
+        return self.__rows[index], 0
+
+    def __call__(self):
+        if self.__base is not None:
+            return self.get_region(0, 0, self.__height, self.__width)
+        return bytes(self.__buffer)
+
+    def getbuffer(self, readonly=False):
+        """Get a view of the pixel buffer without copying it.
+
+        The view stays valid while the pixels change, writes through it
+        change the pixels. A writable view of a matrix that shares its
+        buffer needs a buffer of its own (see 'copy').
+
+        Args:
+            readonly (bool): the view is only read, the pixels of a shared
+                buffer are not copied if they are contiguous
+
+        Returns:
+            memoryview
+        """
+        if self.__base is not None:
+            if readonly and not self.__rows and not self.__mirror and \
+                    self.__stride == self.__row_length:
+                return memoryview(self.__base)[
+                    self.__origin:self.__origin + self.nbytes].toreadonly()
+            if readonly:
+                return memoryview(self()).toreadonly()
+            self.__own_buffer()
+        view = memoryview(self.__buffer)
+        if readonly:
+            return view.toreadonly()
+        self.__exported = True
+        return view
+
+    @property
+    def nbytes(self):
+        """int: size in bytes of the pixel buffer."""
+        return self.__height * self.__row_length
+
+    @property
+    def shared(self):
+        """bool: the pixels are read from a buffer shared with other
+        matrices."""
+        return self.__base is not None
+
+    @property
+    def width(self):
+        """int: number of pixels in a row."""
+        return self.__width
+
+    @property
+    def height(self):
+        """int: number of rows."""
+        return self.__height
+
+    @property
+    def type(self):
+        """string: struct format of a pixel (see MATRIX_TYPE)."""
+        return self.__type
+
+    def get_pixel(self, row, col):
+        """Read a pixel.
+
+        Args:
+            row (int): the row
+            col (int): the column
+
+        Returns:
+            int-tuple: the pixel
+        """
+        elm_size = len(self.__type)
+        if self.__base is None:
+            data = self.__buffer
+            offset = row * self.__row_length + col * elm_size
+        elif row in self.__rows:
+            data = self.__rows[row]
+            offset = col * elm_size
+        else:
+            data = self.__base
+            if self.__mirror:
+                col = self.__width - 1 - col
+            offset = self.__origin + row * self.__stride + col * elm_size
+        result = _PIXELS[self.__type].unpack_from(data, offset)
+        return result if len(result) > 1 else result[0]
+
+    def set_pixel(self, row, col, value):
+        """Change a pixel.
+
+        Args:
+            row (int): the row
+            col (int): the column
+            value (int-tuple): the pixel
+        """
+        self[row].set_pixel(col, value)
+
+    def fill(self, value):
+        """Set all the pixels to the same value.
+
+        Args:
+            value (int-tuple): the pixel value
+        """
+        pixel = _pack_pixel(self.__type, value)
+        if self.__base is not None:
+            self.__detach(bytearray())
+        self.__buffer[:] = pixel * (self.__width * self.__height)
+
+    def get_region(self, row, col, height, width):
+        """Read the pixels of a rectangle.
+
+        Args:
+            row (int): first row of the rectangle
+            col (int): first column of the rectangle
+            height (int): number of rows
+            width (int): number of columns
+
+        Returns:
+            bytes: the rows of the rectangle, one after the other
+        """
+        elm_size = len(self.__type)
+        if self.__base is None:
+            buffer = self.__buffer
+            start = row * self.__row_length
+        elif not self.__rows and not self.__mirror and \
+                self.__stride == self.__row_length:
+            buffer = self.__base
+            start = self.__origin + row * self.__stride
+        else:
+            tmp = bytearray()
+            for index in range(row, row + height):
+                tmp += self.__row_data(index)[col * elm_size:
+                                              (col + width) * elm_size]
+            return bytes(tmp)
+
+        if col == 0 and width == self.__width:
+            return bytes(buffer[start:start + height * self.__row_length])
+        tmp = bytearray()
+        for index in range(height):
+            first = start + index * self.__row_length + col * elm_size
+            tmp += buffer[first:first + width * elm_size]
+        return bytes(tmp)
+
+    def set_region(self, row, col, width, data):
+        """Write the pixels of a rectangle.
+
+        Args:
+            row (int): first row of the rectangle
+            col (int): first column of the rectangle
+            width (int): number of columns
+            data (bytes): the rows of the rectangle, one after the other
+        """
+        span = width * len(self.__type)
+        for index in range(len(data) // span if span else 0):
+            buffer, start = self.__private_row(row + index)
+            start += col * len(self.__type)
+            buffer[start:start + span] = \
+                data[index * span:(index + 1) * span]
+
+    def view(self, row=0, col=0, height=None, width=None, flip_rows=False,
+             mirror=False):
+        """Create a matrix with the pixels of a rectangle, sharing the
+        buffer (copy on write).
+
+        Args:
+            row (int): first row of the rectangle
+            col (int): first column of the rectangle
+            height (int): number of rows (default: up to the last one)
+            width (int): number of columns (default: up to the last one)
+            flip_rows (bool): the rows are in reverse order
+            mirror (bool): the pixels of each row are in reverse order
+
+        Returns:
+            PixelMatrix
+        """
+        height = self.__height - row if height is None else height
+        width = self.__width - col if width is None else width
+        elm_size = len(self.__type)
+        if self.__base is None and isinstance(self.__buffer, bytearray) and \
+                not self.__exported:
+            self.__base, self.__buffer = self.__buffer, None
+            self.__origin = 0
+            self.__stride = self.__row_length
+            self.__mirror = False
+            self.__share = [1]
+
+        tmp = PixelMatrix(height=0, width=width, type_=self.__type)
+        tmp.__height = height
+        tmp.__buffer = None
+        private = self.__base is None
+        if private:
+            # The buffer can change from outside: the view reads it only
+            # to copy its own rows
+            tmp.__base = self.__buffer
+            tmp.__share = [1]
+            origin, stride, rows = 0, self.__row_length, {}
+        else:
+            tmp.__base = self.__base
+            tmp.__share = self.__share
+            tmp.__share[0] += 1
+            origin, stride, rows = self.__origin, self.__stride, self.__rows
+        first = row + height - 1 if flip_rows else row
+        tmp.__mirror = self.__mirror != mirror
+        tmp.__stride = -stride if flip_rows else stride
+        tmp.__origin = origin + first * stride + elm_size * (
+            self.__width - col - width if self.__mirror else col)
+        for index in range(height):
+            source = first - index if flip_rows else first + index
+            if source in rows:
+                data = rows[source][col * elm_size:(col + width) * elm_size]
+                tmp.__rows[index] = _mirror_row(data, elm_size) \
+                    if mirror else data
+        if private:
+            tmp.__own_buffer(copy=True)
+        elif len(tmp.__rows) == height:
+            tmp.__own_buffer()
+        return tmp
+
+    def copy(self):
+        """Create a new matrix with the same pixels, sharing the buffer
+        until one of the two changes them (see 'view').
+
+        Returns:
+            PixelMatrix
+        """
+        return self.view()
+
+    def __len__(self):
+        return self.__height
+
+    def __iter__(self):
+        self.__index = -1
+        return self
+
+    def __next__(self):
+        self.__index += 1
+        if self.__index < self.__height:
+            return self[self.__index]
+        raise StopIteration
+
+    def __getitem__(self, index):
+        buffer, start = self.__private_row(index)
+        return RowBuffer(buffer, start, self.__width, self.__type)
+
+
+class Image(object):
+
+    """Main object to manage TGA images."""
+
+    __slots__ = ('_pixels', '_first_pixel', '_header', '_footer',
+                 '__new_TGA_format', '_read_only', '_dirty_rows',
+                 '_row_cache', '_row_cache_key', '_external_writes')
+
+    # Screen destination of first pixel
+    __bottom_left = 0b0
+    __bottom_right = 0b1 << 4
+    __top_left = 0b1 << 5
+    __top_right = 0b1 << 4 | 0b1 << 5
+
+    def __init__(self, data=None):
+        """Initialize the image.
+
+        Args:
+            data (list of list): data is an array of array that contains pixels.
+                For more details on data go to 'check' function.
+
+        Returns:
+            Image
+
+        """
+        self._pixels = None
+
+        if data is not None:
+            self.check(data)
+            self._pixels = PixelMatrix(data)
+
+        # Default values
+        self._first_pixel = self.__top_left
+        self._header = TGAHeader()
+        self._footer = TGAFooter()
+        self.__new_TGA_format = True
+        self._read_only = False
+        # Rows changed since the last load or save
+        self._dirty_rows = set()
+        # Rows compressed with RLE: {row: (bytes, run packets, raw packets)}
+        self._row_cache = {}
+        self._row_cache_key = None
+        # The pixels can be changed through a buffer outside the image
+        # (a view from 'get_buffer' or the buffer of 'load'): every row is
+        # dirty and the cache of encoded rows is not used
+        self._external_writes = False
+
+    def __check_writable(self):
+        if self._read_only:
+            raise ImageError(
+                "the image is read only, use 'copy' to modify it",
+                'read_only_image'
+            )
+
+    @classmethod
+    def new(cls, width, height, pixel=0):
+        """Create an image filled with a color.
+
+        Args:
+            width (int): number of columns
+            height (int): number of rows
+            pixel (int-tuple): the value of all the pixels. See 'check'
+                function for more details on pixels.
+
+        Returns:
+            Image
+        """
+        cls.check([[pixel]])
+        if isinstance(pixel, tuple):
+            type_ = MATRIX_TYPE['RGB'] if len(pixel) == 3 \
+                else MATRIX_TYPE['RGBA']
+        else:
+            type_ = MATRIX_TYPE['BW']
+        tmp = cls()
+        tmp._pixels = PixelMatrix(height=height, width=width, type_=type_)
+        if pixel:
+            tmp._pixels.fill(pixel)
+        return tmp
+
+    def get_size(self):
+        """Retreive the size of the image.
+
+        Returns:
+            tuple(int, int): width and height of the image
+        """
+        return self._pixels.width, self._pixels.height
+
+    def paste(self, image, row, col):
+        """Copy all the pixels of an image in a position of this one.
+
+        Args:
+            image (Image): the image to copy, with the same kind of pixels
+            row (int): row of the first pixel of the image
+            col (int): column of the first pixel of the image
+
+        Returns:
+            Image
+
+        Raises:
+            ImageError
+        """
+        self.__check_writable()
+        width, height = image.get_size()
+        if image._pixels.type != self._pixels.type:
+            raise ImageError(
+                "the image has different kind of pixels",
+                'non_compatible_image'
+            )
+        if row < 0 or col < 0 or row + height > self._pixels.height or \
+                col + width > self._pixels.width:
+            raise ImageError(
+                "image of size {0}x{1} at ({2}, {3}) is out of the image".format(
+                    width, height, row, col),
+                'bad_pixel_position'
+            )
+        self._pixels.set_region(row, col, width, image._pixels())
+        self._touch_rows(row, row + height)
+        return self
+
+    @classmethod
+    def _from_bytes(cls, width, height, type_, data):
+        """Create an image from the bytes of a pixel buffer.
+
+        Args:
+            width (int): number of columns
+            height (int): number of rows
+            type_ (string): kind of pixels (see MATRIX_TYPE)
+            data (bytes): the pixels, in the same format of 'get_pixels'
+
+        Returns:
+            Image
+        """
+        tmp = cls()
+        tmp._pixels = PixelMatrix.from_bytes(data, height, width, type_)
+        return tmp
+
+    def resize(self, width, height, filter='box'):
+        """Create a resized copy of the image.
+
+        Filters:
+        * 'box' (string): average of the source pixels covered by each
+            pixel, the best choice to reduce an image
+        * 'bilinear' (string): interpolation of the 4 nearest source pixels
+
+        Args:
+            width (int): number of columns of the new image
+            height (int): number of rows of the new image
+            filter (string): the filter used
+
+        Returns:
+            Image
+
+        Raises:
+            ImageError
+        """
+        if filter == 'box':
+            resample = _resize_box
+        elif filter == 'bilinear':
+            resample = _resize_bilinear
+        else:
+            raise ImageError(
+                "'{0}' is not a supported filter".format(filter),
+                'non_supported_mode'
+            )
+        src_width, src_height = self.get_size()
+        type_ = self._pixels.type
+        data = resample(self._pixels(), src_width, src_height, len(type_),
+                        max(1, width), max(1, height))
+        tmp = self._from_bytes(max(1, width), max(1, height), type_, data)
+        tmp._first_pixel = self._first_pixel
+        return tmp
+
+    def mipmaps(self, file_name=None, **kwargs):
+        """Generate the mipmap chain of the image.
+
+        Each level is half the size of the previous one (rounded down, at
+        least 1 pixel) and is computed from it averaging each 2x2 block of
+        pixels, two rows at a time.
+
+        Args:
+            file_name (string): if given each level is saved with the name
+                'file_name_N' (N is the level, 0 is this image)
+            **kwargs: options passed to 'save'
+
+        Returns:
+            list of Image: all the levels, the first one is this image
+        """
+        levels = [self]
+        width, height = self.get_size()
+        channels = len(self._pixels.type)
+        data = self._pixels()
+        while width > 1 or height > 1:
+            data, width, height = _half_size(data, width, height, channels)
+            level = self._from_bytes(width, height, self._pixels.type, data)
+            level._first_pixel = self._first_pixel
+            levels.append(level)
+
+        if file_name is not None:
+            for num, level in enumerate(levels):
+                level.save("{0}_{1}".format(file_name, num), **kwargs)
+
+        return levels
+
+    def _touch_rows(self, start, stop):
+        """Mark some rows as changed.
+
+        Args:
+            start (int): first row changed
+            stop (int): last row changed + 1
+        """
+        for index in range(start, stop):
+            self._dirty_rows.add(index)
+            self._row_cache.pop(index, None)
+
+    def composite(self, src, x, y, mode='over', premultiplied=False):
+        """Draw an RGBA image over this one using its alpha channel.
+
+        The rows are processed in bulk by the backend (see 'get_backend'):
+        vectorized with NumPy or, in pure Python, skipping fully transparent
+        spans of the source and copying fully opaque spans.
+
+        Args:
+            src (Image): the RGBA image to draw
+            x (int): column of the first pixel of src (can be negative)
+            y (int): row of the first pixel of src (can be negative)
+            mode (string): compositing operator, only 'over' is supported
+            premultiplied (bool): the colors of both images are premultiplied
+                by their alpha
+
+        Returns:
+            Image
+
+        Raises:
+            ImageError
+        """
+        self.__check_writable()
+        if mode != 'over':
+            raise ImageError(
+                "'{0}' is not a supported composite mode".format(mode),
+                'non_supported_mode'
+            )
+        if src._pixels.type != MATRIX_TYPE['RGBA'] or \
+                self._pixels.type == MATRIX_TYPE['BW']:
+            raise ImageError(
+                "composite needs an RGBA source and an RGB(A) destination",
+                'non_compatible_image'
+            )
 
-        tmp += gen_byte(self.extension_area_offset, 4)
-        tmp += gen_byte(self.developer_directory_offset, 4)
-        tmp += self.__signature
-        tmp += self.__dot
-        tmp += self.__end
+        src_width, src_height = src.get_size()
+        width, height = self.get_size()
+        # Clip the source to the destination
+        left = max(0, -x)
+        top = max(0, -y)
+        right = min(src_width, width - x)
+        bottom = min(src_height, height - y)
+        if left >= right or top >= bottom:
+            return self
 
-        return tmp
+        span = right - left
+        rows = bottom - top
+        src_data = src._pixels.get_region(top, left, rows, span)
+        dst_data = self._pixels.get_region(y + top, x + left, rows, span)
+        dst_alpha = self._pixels.type == MATRIX_TYPE['RGBA']
 
+        result = get_backend().composite(src_data, dst_data, rows, span,
+                                         dst_alpha, premultiplied)
+        self._pixels.set_region(y + top, x + left, span, result)
+        self._touch_rows(y + top, y + bottom)
+        return self
 
-class ImageError(Exception):
+    def content_hash(self, algorithm='sha256'):
+        """Compute a hash of the size, the kind and the value of the pixels.
 
-    """Error of the Image class."""
+        The pixel buffer is hashed without copying it. The result is the same
+        of 'hash_file' on a file with the same pixels.
 
-    def __init__(self, msg, errname):
-        super(ImageError, self).__init__(msg)
-        error_map = {
-            'pixel_dest_position': -10,
-            'bad_row_length': -21,
-            'bad_pixel_length': -22,
-            'bad_pixel_value': -23,
-            'non_supported_type': -31,
-        }
-        self.errno = error_map.get(errname, None)
+        Args:
+            algorithm (string): a hashlib algorithm
 
+        Returns:
+            string: the hex digest of the hash
+        """
+        hasher = _content_hasher(self._pixels.width, self._pixels.height,
+                                 self._pixels.type, algorithm)
+        with self._pixels.getbuffer(readonly=True) as view:
+            hasher.update(view)
+        return hasher.hexdigest()
 
-MATRIX_TYPE = {
-    'BW': "B",
-    'RGB': "BBB",
-    'RGBA': "BBBB"
-}
+    def __eq__(self, other):
+        """Compare the pixels of two images.
 
+        Size and kind of pixels are checked before comparing the buffers.
+        """
+        if not isinstance(other, Image):
+            return NotImplemented
+        if self._pixels is None or other._pixels is None:
+            return self._pixels is other._pixels
+        if self.get_size() != other.get_size() or \
+                self._pixels.type != other._pixels.type:
+            return False
+        with self._pixels.getbuffer(readonly=True) as view, \
+                other._pixels.getbuffer(readonly=True) as other_view:
+            return view == other_view
 
-class RowBuffer(object):
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
 
-    def __init__(self, data, row_size, type_=MATRIX_TYPE['BW']):
-        self.__data = data
-        self.__start_pos = self.__data.tell()
-        self.__elm_size = len(type_)
-        self.__row_size = row_size
-        self.__type = type_
-        self.__index = -1
+    __hash__ = None
 
-    def __getitem__(self, index):
-        self.__data.seek(self.__start_pos + index * self.__elm_size)
-        data = self.__data.read(self.__elm_size)
-        result = unpack(str("<") + self.__type, data)
-        return result if len(result) > 1 else result[0]
+    def is_read_only(self):
+        """Control if the image can be modified.
 
-    def set_pixel(self, index, value):
-        self.__data.seek(self.__start_pos + index * self.__elm_size)
-        if self.__elm_size == 1:
-            self.__data.write(pack(str('<') + str(self.__type), value))
-        else:
-            self.__data.write(pack(str('<') + str(self.__type), *value))
+        Images shared by an ImageCache are read only.
 
-    def __len__(self):
-        return self.__row_size
+        Returns:
+            bool: if the image is read only
+        """
+        return self._read_only
 
-    def __iter__(self):
-        self.__index = -1
-        return self
+    def get_storage(self):
+        """Retreive how the pixels are kept in memory.
 
-    def __next__(self):
-        self.__index += 1
-        if self.__index < self.__row_size:
-            return self[self.__index]
-        raise StopIteration
+        Returns:
+            string: 'flat' or 'rle'
+        """
+        if self._pixels is None or isinstance(self._pixels, PixelMatrix):
+            return 'flat'
+        return 'rle'
 
+    def set_storage(self, storage):
+        """Change how the pixels are kept in memory.
 
-class PixelMatrix(object):
+        Storages:
+        * 'flat' (string): a buffer with all the pixels, the fastest access
+        * 'rle' (string): RLE packets for each row, for images with large
+            areas of the same color; reading a pixel needs a binary search
+            in its row, changing it compresses the row again and
+            'get_buffer' returns a read-only copy of the pixels
 
-    def __init__(self, data=None, height=640, width=480, type_=MATRIX_TYPE['BW']):
-        self.__height = len(data) if data is not None else height
-        self.__width = len(data[0]) if data is not None else width
-        self.__row_length = self.__width * len(type_)
-        self.__type = type_
-        self.__buffer = io.BytesIO()
-        self.__index = -1
-        if data is not None:
-            if isinstance(data, list):
-                if isinstance(data[0][0], int):
-                    elm_size = 1
-                else:
-                    elm_size = len(data[0][0])
+        Args:
+            storage (string): the new storage
 
-                if elm_size == 1:
-                    self.__type = MATRIX_TYPE['BW']
-                elif elm_size == 3:
-                    self.__type = MATRIX_TYPE['RGB']
-                elif elm_size == 4:
-                    self.__type = MATRIX_TYPE['RGBA']
-                else:
-                    raise Exception(
-                        "Data not compatible with BW, RGB or RGBA format, tuple has lenght {}".format(elm_size))
-                self.__row_length = self.__width * len(self.__type)
-                self.__buffer_from_data(data)
+        Returns:
+            Image
 
-    def __buffer_from_data(self, data):
-        if self.__type == MATRIX_TYPE['BW']:
-            self.__buffer.write(
-                pack(str('<') + str(self.__type)*self.__width*self.__height, *[
-                    value for row in data for value in row
-                ])
-            )
+        Raises:
+            ImageError
+        """
+        self.__check_writable()
+        if storage == 'flat':
+            if self.get_storage() == 'rle':
+                self._pixels = self._pixels.to_pixel_matrix()
+        elif storage == 'rle':
+            from .rle import RLEMatrix
+            if self._pixels is not None and self.get_storage() == 'flat':
+                self._pixels = RLEMatrix.from_matrix(self._pixels)
         else:
-            self.__buffer.write(
-                pack(str('<') + str(self.__type)*self.__width*self.__height, *[
-                    value for row in data for column in row for value in column
-                ])
+            raise ImageError(
+                "'{0}' is not a supported storage".format(storage),
+                'non_supported_mode'
             )
-        self.__buffer.seek(0)
-
-    def __call__(self):
-        self.__buffer.seek(0)
-        return self.__buffer.read()
-
-    def __len__(self):
-        return self.__height
-
-    def __iter__(self):
-        self.__index = -1
         return self
 
-    def __next__(self):
-        self.__index += 1
-        if self.__index < self.__height:
-            return self[self.__index]
-        raise StopIteration
+    def copy(self):
+        """Create a modifiable copy of the image.
 
-    def __getitem__(self, index):
-        self.__buffer.seek(0)
-        self.__buffer.seek(index * self.__row_length)
-        return RowBuffer(
-            self.__buffer,
-            self.__width,
-            self.__type,
-        )
+        The copy shares the pixels with this image: a row is copied the
+        first time one of the two images changes it. If the pixels can be
+        changed through a buffer (a writable view from 'get_buffer' or the
+        buffer of 'load') the copy has its own pixels.
 
+        Returns:
+            Image
+        """
+        tmp = Image()
+        if self._pixels is not None:
+            tmp._pixels = self._pixels.copy()
+        tmp._first_pixel = self._first_pixel
+        tmp._header = copy.copy(self._header)
+        tmp._footer = copy.copy(self._footer)
+        tmp.__new_TGA_format = self.__new_TGA_format
+        tmp._dirty_rows = set(self._dirty_rows)
+        tmp._row_cache = dict(self._row_cache)
+        tmp._row_cache_key = self._row_cache_key
+        tmp._external_writes = self._external_writes
+        return tmp
 
-class Image(object):
+    def __derived(self, pixels):
+        tmp = Image()
+        tmp._pixels = pixels
+        tmp._first_pixel = self._first_pixel
+        return tmp
 
-    """Main object to manage TGA images."""
+    def crop(self, x, y, width, height):
+        """Create an image with the pixels of a rectangle.
 
-    def __init__(self, data=None):
-        """Initialize the image.
+        The pixels are shared with this image like in 'copy'.
 
         Args:
-            data (list of list): data is an array of array that contains pixels.
-                For more details on data go to 'check' function.
+            x (int): first column of the rectangle
+            y (int): first row of the rectangle
+            width (int): number of columns
+            height (int): number of rows
 
         Returns:
             Image
 
+        Raises:
+            ImageError
         """
-        self._pixels = None
+        src_width, src_height = self.get_size()
+        x, y, width, height = _check_region((x, y, width, height),
+                                            src_width, src_height)
+        return self.__derived(self._pixels.view(y, x, height, width))
 
-        if data is not None:
-            self.check(data)
-            self._pixels = PixelMatrix(data)
+    def flip(self, direction='vertical'):
+        """Create a flipped image.
 
-        # Screen destination of first pixel
-        self.__bottom_left = 0b0
-        self.__bottom_right = 0b1 << 4
-        self.__top_left = 0b1 << 5
-        self.__top_right = 0b1 << 4 | 0b1 << 5
+        The pixels are shared with this image like in 'copy'.
 
-        # Default values
-        self._first_pixel = self.__top_left
-        self._header = TGAHeader()
-        self._footer = TGAFooter()
-        self.__new_TGA_format = True
+        Directions:
+        * 'vertical' (string): the first row becomes the last one
+        * 'horizontal' (string): the first column becomes the last one
+
+        Args:
+            direction (string): the direction of the flip
+
+        Returns:
+            Image
+
+        Raises:
+            ImageError
+        """
+        if direction not in ('vertical', 'horizontal'):
+            raise ImageError(
+                "'{0}' is not a supported direction".format(direction),
+                'non_supported_mode'
+            )
+        return self.__derived(self._pixels.view(
+            flip_rows=direction == 'vertical',
+            mirror=direction == 'horizontal'))
 
     @staticmethod
     def check(data):
@@ -534,10 +2266,37 @@ class Image(object):
 
         Returns:
             Image
+
+        Raises:
+            ImageError
         """
-        self._pixels[row].set_pixel(col, value)
+        self.__check_writable()
+        self._pixels.set_pixel(row, col, value)
+        self._dirty_rows.add(row)
+        self._row_cache.pop(row, None)
         return self
 
+    def get_dirty_rows(self):
+        """Retreive the rows changed since the last load or save.
+
+        All the rows are dirty if the pixels can be changed through a buffer
+        (a writable view from 'get_buffer' or the buffer of 'load').
+
+        Returns:
+            list of int: the numbers of the rows changed, sorted
+        """
+        if self._external_writes:
+            return list(range(self._pixels.height))
+        return sorted(self._dirty_rows)
+
+    def __allow_external_writes(self):
+        """Stop tracking the changes of the rows, the pixels can be changed
+        through a buffer."""
+        self._external_writes = True
+        self._dirty_rows = set()
+        self._row_cache = {}
+        self._row_cache_key = None
+
     def get_pixel(self, row, col):
         """Retreive a pixel.
 
@@ -549,7 +2308,7 @@ class Image(object):
             int-tuple: the pixel selected. See 'check' function for more
                 details on pixels.
         """
-        return self._pixels[row][col]
+        return self._pixels.get_pixel(row, col)
 
     def get_pixels(self):
         """Extract data.
@@ -559,255 +2318,558 @@ class Image(object):
         """
         return self._pixels()
 
-    def load(self, file_name):
+    def get_buffer(self):
+        """Get a view of the pixels without copying them.
+
+        The view has shape (height, width) for BW images and
+        (height, width, channels) for RGB and RGBA images, with one unsigned
+        byte for each channel. Writes through the view change the pixels;
+        after a writable view all the rows are dirty (see 'get_dirty_rows')
+        and a compressed save encodes all of them. The view of a read-only
+        image is read-only. An image that shares its pixels (see 'copy')
+        needs a buffer of its own for a writable view.
+
+        Returns:
+            memoryview
+        """
+        view = self._pixels.getbuffer(readonly=self._read_only)
+        if not view.readonly:
+            self.__allow_external_writes()
+        channels = len(self._pixels.type)
+        shape = (self._pixels.height, self._pixels.width)
+        if channels > 1:
+            shape += (channels,)
+        if 0 in shape:
+            return view.toreadonly() if self._read_only else view
+        view = view.cast('B', shape)
+        return view.toreadonly() if self._read_only else view
+
+    def __buffer__(self, flags):
+        """Export the pixels with the buffer protocol (Python >= 3.12)."""
+        return self.get_buffer()
+
+    @property
+    def __array_interface__(self):
+        """dict: the NumPy array interface of the pixels (see 'get_buffer')."""
+        view = self.get_buffer()
+        return {
+            'version': 3,
+            'shape': view.shape,
+            'typestr': '|u1',
+            'data': view,
+        }
+
+    def load(self, file_name, stats=None, out=None, max_pixels=None,
+             max_bytes=None, region=None, subsample=1, storage='flat'):
         """Open a TGA image.
 
+        With 'out' the pixels are decoded in a buffer of the caller, that
+        becomes the pixel storage of the image. To decode a sequence of
+        frames without allocating new pixel buffers load every frame in the
+        buffer of the previous one:
+
+            image.load(frame, out=image.get_buffer())
+
         Args:
             file_name (string): the name of the TGA image
+            stats (TGAStats): object that collects the statistics of the
+                operation (default: the one set with 'set_default_stats')
+            out (buffer): writable, contiguous buffer with the size of the
+                pixels of the image (see 'get_buffer'), like a bytearray or a
+                NumPy array
+            max_pixels (int): maximum number of pixels of the image (default:
+                the limit set with 'set_limits')
+            max_bytes (int): maximum memory needed to load the image, see
+                'estimate_memory' (default: the limit set with 'set_limits')
+            region (tuple): load only the rectangle (x, y, width, height),
+                where x is the first column and y the first row
+            subsample (int): keep only every N-th pixel of every N-th row, for
+                an image with 1/N^2 of the pixels (of the region, if any)
+            storage (string): 'flat' to keep the pixels in a buffer, 'rle' to
+                keep them compressed (see 'set_storage')
 
         Returns:
             Image
 
         Raises:
             ImageError
+            ValueError: subsample is not a positive integer
         """
+        self.__check_writable()
+        stats = _get_stats(stats)
+        if subsample < 1 or int(subsample) != subsample:
+            raise ValueError(
+                "subsample must be a positive integer, not {0!r}".format(
+                    subsample))
+        subsample = int(subsample)
+        if storage not in ('flat', 'rle'):
+            raise ImageError(
+                "'{0}' is not a supported storage".format(storage),
+                'non_supported_mode'
+            )
+        if storage == 'rle':
+            from .rle import RLEMatrix, split_rows
+            if out is not None:
+                raise ImageError("a buffer can not be used with RLE storage",
+                                 'bad_buffer')
+
         with open(file_name, "rb") as image_file:
             # Check footer
-            image_file.seek(-26, 2)
-            self._footer.extension_area_offset = dec_byte(
-                image_file.read(4), 4)
-            self._footer.developer_directory_offset = dec_byte(
-                image_file.read(4), 4)
-            signature = image_file.read(16)
-            dot = image_file.read(1)
-            zero = dec_byte(image_file.read(1))
-
-            if signature == "TRUEVISION-XFILE".encode('ascii') and\
-                    dot == ".".encode('ascii') and zero == 0:
-                self.__new_TGA_format = True
-            else:
+            with _phase(stats, 'footer'):
+                image_file.seek(0, 2)
+                data_end = image_file.tell()
                 self.__new_TGA_format = False
+                if data_end >= 18 + 26:
+                    image_file.seek(-26, 2)
+                    self.__new_TGA_format = self._footer.from_bytes(
+                        image_file.read(26))
+                if self.__new_TGA_format:
+                    data_end -= 26
 
             # Read Header
-            image_file.seek(0)
-            # ID LENGTH
-            self._header.id_length = dec_byte(image_file.read(1))
-            # COLOR MAP TYPE
-            self._header.color_map_type = dec_byte(image_file.read(1))
-            # IMAGE TYPE
-            self._header.image_type = dec_byte(image_file.read(1))
-            # COLOR MAP SPECIFICATION
-            self._header.first_entry_index = dec_byte(image_file.read(2), 2)
-            self._header.color_map_length = dec_byte(image_file.read(2), 2)
-            self._header.color_map_entry_size = dec_byte(image_file.read(1))
-            # IMAGE SPECIFICATION
-            self._header.x_origin = dec_byte(image_file.read(2), 2)
-            self._header.y_origin = dec_byte(image_file.read(2), 2)
-            self._header.image_width = dec_byte(image_file.read(2), 2)
-            self._header.image_height = dec_byte(image_file.read(2), 2)
-            self._header.pixel_depht = dec_byte(image_file.read(1))
-            self._header.image_descriptor = dec_byte(image_file.read(1))
-            self._first_pixel = self._header.image_descriptor
-
-            tmp = []
-            if self._header.image_type == 2 or self._header.image_type == 3:
-                for row in range(self._header.image_height):
-                    tmp.append([])
-                    for col in range(self._header.image_width):
-                        if self._header.image_type == 3:
-                            tmp[row].append(
-                                dec_byte(image_file.read(1)))
-                        elif self._header.image_type == 2:
-                            if self._header.pixel_depht == 16:
-                                tmp[row].append(
-                                    get_rgb_from_16(dec_byte(image_file.read(2), 2)))
-                            elif self._header.pixel_depht == 24:
-                                c_b, c_g, c_r = multiple_dec_byte(
-                                    image_file, 3)
-                                tmp[row].append((c_r, c_g, c_b))
-                            elif self._header.pixel_depht == 32:
-                                c_b, c_g, c_r, alpha = multiple_dec_byte(
-                                    image_file, 4)
-                                tmp[row].append(
-                                    (c_r, c_g, c_b, alpha))
-                        else:
-                            raise ImageError(
-                                "type num '{0}'' is not supported".format(
-                                    self._header.image_type),
-                                'non_supported_type'
-                            )
-
-            ##
-            # Decode
-            #
-            elif self._header.image_type == 10 or self._header.image_type == 11:
-                tmp.append([])
-                tot_pixels = self._header.image_height * self._header.image_width
-                pixel_count = 0
-                while pixel_count != tot_pixels:
-                    if len(tmp[-1]) == self._header.image_width:
-                        tmp.append([])
-                    repetition_count = dec_byte(image_file.read(1))
-                    RLE = (repetition_count & 0b10000000) >> 7 == 1
-                    count = (repetition_count & 0b01111111) + 1
-                    pixel_count += count
-                    if RLE:
-                        pixel = None
-                        if self._header.image_type == 11:
-                            pixel = dec_byte(image_file.read(1))
-                        elif self._header.image_type == 10:
-                            if self._header.pixel_depht == 16:
-                                pixel = get_rgb_from_16(
-                                    dec_byte(image_file.read(2), 2))
-                            elif self._header.pixel_depht == 24:
-                                c_b, c_g, c_r = multiple_dec_byte(
-                                    image_file, 3)
-                                pixel = (c_r, c_g, c_b)
-                            elif self._header.pixel_depht == 32:
-                                c_b, c_g, c_r, alpha = multiple_dec_byte(
-                                    image_file, 4)
-                                pixel = (c_r, c_g, c_b, alpha)
-                        else:
-                            raise ImageError(
-                                "type num '{0}'' is not supported".format(
-                                    self._header.image_type),
-                                'non_supported_type'
-                            )
-                        for num in range(count):
-                            tmp[-1].append(pixel)
-                    else:
-                        for num in range(count):
-                            if self._header.image_type == 11:
-                                tmp[-1].append(
-                                    dec_byte(image_file.read(1)))
-                            elif self._header.image_type == 10:
-                                if self._header.pixel_depht == 16:
-                                    tmp[-1].append(
-                                        get_rgb_from_16(dec_byte(image_file.read(2), 2)))
-                                elif self._header.pixel_depht == 24:
-                                    c_b, c_g, c_r = multiple_dec_byte(
-                                        image_file, 3, 1)
-                                    tmp[-1].append((c_r, c_g, c_b))
-                                elif self._header.pixel_depht == 32:
-                                    c_b, c_g, c_r, alpha = multiple_dec_byte(
-                                        image_file, 4, 1)
-                                    tmp[-1].append(
-                                        (c_r, c_g, c_b, alpha))
-                            else:
-                                raise ImageError(
-                                    "type num '{0}'' is not supported".format(
-                                        self._header.image_type),
-                                    'non_supported_type'
-                                )
-        
-        self._pixels = PixelMatrix(tmp)
+            with _phase(stats, 'header'):
+                image_file.seek(0)
+                data = image_file.read(18)
+                if len(data) < 18:
+                    raise ImageError("file ends in the header",
+                                     'truncated_data')
+                self._header.from_bytes(data)
+                self._first_pixel = self._header.image_descriptor
+                type_ = _matrix_type(self._header)
+                data_start = self._header.data_offset
+                full_width = self._header.image_width
+                if region is None and subsample > 1:
+                    region = (0, 0, full_width, self._header.image_height)
+                if region is None:
+                    _check_limits(self._header, data_end - data_start,
+                                  max_pixels, max_bytes)
+                else:
+                    region = _check_region(region, full_width,
+                                           self._header.image_height)
+                    self._header.image_width = \
+                        (region[2] + subsample - 1) // subsample
+                    self._header.image_height = \
+                        (region[3] + subsample - 1) // subsample
+                    _check_limits(self._header, None, max_pixels, max_bytes)
+                if out is not None:
+                    out = self.__check_buffer(out, type_)
+
+            # Read the pixel data, skipping image id and color map
+            with _phase(stats, 'read'):
+                if region is None:
+                    image_file.seek(data_start)
+                    payload = image_file.read(max(data_end - data_start, 0))
+                    read = len(payload)
+                else:
+                    data, used, run_packets, raw_packets = _read_region(
+                        image_file, self._header, full_width, region,
+                        data_start, data_end,
+                        self._footer.extension_area_offset
+                        if self.__new_TGA_format else 0,
+                        subsample
+                    )
+                    read = used
+
+        if stats is not None:
+            stats.bytes_read += data_start + read + (
+                26 if self.__new_TGA_format else 0)
+
+        backend = get_backend()
+        width = self._header.image_width
+        height = self._header.image_height
+        pixel_size = self._header.bytes_per_pixel
+        row_cache = {}
+
+        matrix = None
+        with _phase(stats, 'decode'):
+            # The pixels of a region are already read by _read_region
+            if region is None and self._header.image_type in (2, 3):
+                used = width * height * pixel_size
+                data = memoryview(payload)[:used]
+                run_packets = raw_packets = 0
+            elif region is None and storage == 'rle':
+                ##
+                # Keep the packets, only the pixels stored in them are
+                # converted
+                #
+                matrix = RLEMatrix.from_file_rows(
+                    split_rows(payload, pixel_size, width, height),
+                    self._header.pixel_depht, width)
+                used = len(payload)
+                run_packets = raw_packets = 0
+            elif region is None:
+                ##
+                # Decode
+                #
+                try:
+                    data, used, run_packets, raw_packets, rows = \
+                        backend.rle_decode(payload, pixel_size, width, height)
+                except ValueError as err:
+                    raise ImageError(str(err), 'truncated_data')
+                ##
+                # Keep the packets of the rows that are not shared with
+                # other rows, a save without changes can reuse them
+                #
+                previous = (0, 0, 0)
+                for row, end in enumerate(rows):
+                    if end is not None and previous is not None:
+                        row_cache[row] = (payload[previous[0]:end[0]],
+                                          end[1] - previous[1],
+                                          end[2] - previous[2])
+                    previous = end
+            if matrix is None:
+                if len(data) < width * height * pixel_size:
+                    raise ImageError(
+                        "pixel data ends before the last pixel",
+                        'truncated_data'
+                    )
+                data = backend.to_matrix(data, self._header.pixel_depht, out)
+
+        if stats is not None:
+            stats.run_packets += run_packets
+            stats.raw_packets += raw_packets
+            stats.payload_bytes += used
+            stats.raw_bytes += width * height * pixel_size
+
+        with _phase(stats, 'buffer'):
+            if matrix is None:
+                matrix = PixelMatrix.from_bytes(data, height, width, type_)
+                if storage == 'rle':
+                    matrix = RLEMatrix.from_matrix(matrix)
+            self._pixels = matrix
+
+        self._dirty_rows = set()
+        self._row_cache = row_cache
+        self._row_cache_key = (self._header.image_type,
+                               self._header.pixel_depht, False)
+        self._external_writes = False
+        if out is not None:
+            # The caller can change the pixels in its buffer
+            self.__allow_external_writes()
 
         return self
 
+    def __check_buffer(self, out, type_):
+        """Check that a buffer can receive the pixels described by the header.
+
+        Args:
+            out (buffer): the buffer of the caller
+            type_ (string): kind of pixels (see MATRIX_TYPE)
+
+        Returns:
+            memoryview: a flat view of the buffer
+
+        Raises:
+            ImageError
+        """
+        try:
+            view = memoryview(out).cast('B')
+        except TypeError as err:
+            raise ImageError(str(err), 'bad_buffer')
+        if view.readonly:
+            raise ImageError("the buffer is read-only", 'bad_buffer')
+        nbytes = self._header.image_width * self._header.image_height * \
+            len(type_)
+        if view.nbytes != nbytes:
+            raise ImageError(
+                "the buffer has {0} bytes, the image needs {1}".format(
+                    view.nbytes, nbytes),
+                'bad_buffer'
+            )
+        return view
+
     def save(self, file_name, original_format=False, force_16_bit=False,
-             compress=False):
+             compress=False, stats=None, optimize=False):
         """Save the image as a TGA file.
 
+        A read-only image is not changed, so it can be saved by many threads
+        at the same time.
+
         Args:
             file_name (string): the name with which you want to save
             original_format (bool): save or not in olt TGA format (< 2.0)
             force_16_bit (bool): save the image with 16 bit depth
-            compress (bool): compress the image with RLE or not
+            compress (bool or string): compress the image with RLE or not,
+                with 'auto' the compression is used only if a sample of the
+                rows says that the result is smaller than the raw data
+            stats (TGAStats): object that collects the statistics of the
+                operation (default: the one set with 'set_default_stats')
+            optimize (bool): choose the RLE packets that give the smallest
+                file (slower than the default encoder)
 
         Returns:
             Image
 
         """
-        # ID LENGTH
-        self._header.id_length = 0
-        # COLOR MAP TYPE
-        self._header.color_map_type = 0
-        # COLOR MAP SPECIFICATION
-        self._header.first_entry_index = 0
-        self._header.color_map_length = 0
-        self._header.color_map_entry_size = 0
-        # IMAGE SPECIFICATION
-        self._header.x_origin = 0
-        self._header.y_origin = 0
-        self._header.image_width = len(self._pixels[0])
-        self._header.image_height = len(self._pixels)
-        self._header.image_descriptor = 0b0 | self._first_pixel
+        stats = _get_stats(stats)
 
-        ##
-        # IMAGE TYPE
-        # IMAGE SPECIFICATION (pixel_depht)
-        tmp_pixel = self._pixels[0][0]
-        if type(tmp_pixel) == int:
-            self._header.image_type = 3
-            self._header.pixel_depht = 8
-        elif type(tmp_pixel) == tuple:
-            self._header.image_type = 2
-            if len(tmp_pixel) == 3:
-                if not force_16_bit:
-                    self._header.pixel_depht = 24
-                else:
-                    self._header.pixel_depht = 16
-            elif len(tmp_pixel) == 4:
-                self._header.pixel_depht = 32
+        with _phase(stats, 'header'):
+            # A read-only image can be shared: the header and the cache of
+            # encoded rows are changed only at the end, if it is writable
+            header = copy.copy(self._header)
+            # ID LENGTH
+            header.id_length = 0
+            # COLOR MAP TYPE
+            header.color_map_type = 0
+            # COLOR MAP SPECIFICATION
+            header.first_entry_index = 0
+            header.color_map_length = 0
+            header.color_map_entry_size = 0
+            # IMAGE SPECIFICATION
+            header.x_origin = 0
+            header.y_origin = 0
+            header.image_width = self._pixels.width
+            header.image_height = self._pixels.height
+            header.image_descriptor = 0b0 | self._first_pixel
+
+            ##
+            # IMAGE TYPE
+            # IMAGE SPECIFICATION (pixel_depht)
+            tmp_pixel = self._pixels.get_pixel(0, 0)
+            if type(tmp_pixel) == int:
+                header.image_type = 3
+                header.pixel_depht = 8
+            elif type(tmp_pixel) == tuple:
+                header.image_type = 2
+                if len(tmp_pixel) == 3:
+                    if not force_16_bit:
+                        header.pixel_depht = 24
+                    else:
+                        header.pixel_depht = 16
+                elif len(tmp_pixel) == 4:
+                    header.pixel_depht = 32
 
-        if compress:
-            if self._header.image_type == 3:
-                self._header.image_type = 11
-            elif self._header.image_type == 2:
-                self._header.image_type = 10
+            if compress == 'auto':
+                compress = self._rle_is_smaller(header)
 
-        with open("{0:s}.tga".format(file_name), "wb") as image_file:
-            image_file.write(self._header.to_bytes())
+            if compress:
+                if header.image_type == 3:
+                    header.image_type = 11
+                elif header.image_type == 2:
+                    header.image_type = 10
+
+            header_data = header.to_bytes()
+
+        run_packets = 0
+        raw_packets = 0
+        new_cache = {}
+
+        with _phase(stats, 'encode'):
+            payload = bytearray()
 
             if not compress:
-                for row in self._pixels:
-                    for pixel in row:
-                        if self._header.image_type == 3:
-                            image_file.write(gen_byte(pixel))
-                        elif self._header.image_type == 2:
-                            if self._header.pixel_depht == 16:
-                                image_file.write(gen_pixel_rgb_16(*pixel))
-                            elif self._header.pixel_depht == 24:
-                                image_file.write(gen_pixel_rgba(*pixel))
-                            elif self._header.pixel_depht == 32:
-                                image_file.write(gen_pixel_rgba(*pixel))
+                payload += get_backend().from_matrix(
+                    self._pixels(), header.pixel_depht)
             else:
-                for row in self._pixels:
-                    for repetition_count, pixel_value in self._encode(row):
-                        image_file.write(gen_byte(repetition_count))
-                        if repetition_count > 127:
-                            if self._header.image_type == 11:
-                                image_file.write(gen_byte(pixel_value))
-                            elif self._header.image_type == 10:
-                                if self._header.pixel_depht == 16:
-                                    image_file.write(
-                                        gen_pixel_rgb_16(*pixel_value))
-                                elif self._header.pixel_depht == 24:
-                                    image_file.write(
-                                        gen_pixel_rgba(*pixel_value))
-                                elif self._header.pixel_depht == 32:
-                                    image_file.write(
-                                        gen_pixel_rgba(*pixel_value))
-                        else:
-                            for pixel in pixel_value:
-                                if self._header.image_type == 11:
-                                    image_file.write(gen_byte(pixel))
-                                elif self._header.image_type == 10:
-                                    if self._header.pixel_depht == 16:
-                                        image_file.write(
-                                            gen_pixel_rgb_16(*pixel))
-                                    elif self._header.pixel_depht == 24:
-                                        image_file.write(
-                                            gen_pixel_rgba(*pixel))
-                                    elif self._header.pixel_depht == 32:
-                                        image_file.write(
-                                            gen_pixel_rgba(*pixel))
-
-            if self.__new_TGA_format and not original_format:
-                image_file.write(self._footer.to_bytes())
+                ##
+                # Rows not changed since the last load or save are
+                # taken from the cache of encoded rows
+                #
+                cache_key = (header.image_type,
+                             header.pixel_depht, optimize)
+                row_cache = self._row_cache \
+                    if self._row_cache_key == cache_key else {}
+                for index in range(len(self._pixels)):
+                    encoded = row_cache.get(index)
+                    if encoded is None:
+                        encoded = self._encode_row(index, header, optimize)
+                    new_cache[index] = encoded
+                    payload += encoded[0]
+                    run_packets += encoded[1]
+                    raw_packets += encoded[2]
+
+        if not self._read_only:
+            self._header = header
+            self._dirty_rows = set()
+            if compress and not self._external_writes:
+                self._row_cache = new_cache
+                self._row_cache_key = cache_key
+
+        with _phase(stats, 'write'):
+            with open("{0:s}.tga".format(file_name), "wb") as image_file:
+                image_file.write(header_data)
+                image_file.write(payload)
+                written = len(header_data) + len(payload)
+
+                if self.__new_TGA_format and not original_format:
+                    footer = self._footer.to_bytes()
+                    image_file.write(footer)
+                    written += len(footer)
+
+        if stats is not None:
+            stats.compressed = bool(compress)
+            stats.bytes_written += written
+            stats.run_packets += run_packets
+            stats.raw_packets += raw_packets
+            stats.payload_bytes += len(payload)
+            stats.raw_bytes += header.image_width * header.image_height * \
+                header.bytes_per_pixel
 
         return self
 
+    @staticmethod
+    def patch_file(file_name, edits):
+        """Change some pixels directly in an uncompressed TGA file.
+
+        Only the bytes of the changed pixels are written, so the cost does not
+        depend on the size of the image. Rows and columns are the same used
+        by 'get_pixel' after a load (the order of the pixels in the file).
+
+        Args:
+            file_name (string): the name of the TGA image (type 2 or 3)
+            edits (dict or list): the pixels to change as a dict
+                {(row, col): value} or a list of (row, col, value)
+
+        Returns:
+            int: the number of write operations done
+
+        Raises:
+            ImageError
+        """
+        if isinstance(edits, dict):
+            edits = [(row, col, value) for (row, col), value in edits.items()]
+
+        with open(file_name, "r+b") as image_file:
+            data = image_file.read(18)
+            if len(data) < 18:
+                raise ImageError("file ends in the header", 'truncated_data')
+            header = TGAHeader().from_bytes(data)
+
+            if header.image_type == 3:
+                encode = gen_byte
+            elif header.image_type == 2 and header.pixel_depht == 16:
+                def encode(pixel):
+                    return gen_pixel_rgb_16(*pixel)
+            elif header.image_type == 2 and header.pixel_depht in (24, 32):
+                def encode(pixel):
+                    if len(pixel) != header.pixel_depht // 8:
+                        raise ImageError(
+                            "'{0}' is not a valid pixel tuple".format(pixel),
+                            'bad_pixel_length'
+                        )
+                    return gen_pixel_rgba(*pixel)
+            else:
+                raise ImageError(
+                    "type num '{0}'' is not supported".format(
+                        header.image_type),
+                    'non_supported_type'
+                )
+
+            pixel_size = header.bytes_per_pixel
+            changes = {}
+            for row, col, value in edits:
+                if not (0 <= row < header.image_height and
+                        0 <= col < header.image_width):
+                    raise ImageError(
+                        "pixel ({0}, {1}) is out of the image".format(
+                            row, col),
+                        'bad_pixel_position'
+                    )
+                changes[row * header.image_width + col] = encode(value)
+
+            ##
+            # Contiguous pixels are written with a single operation
+            #
+            writes = 0
+            positions = sorted(changes)
+            index = 0
+            while index < len(positions):
+                start = positions[index]
+                chunk = bytearray(changes[start])
+                index += 1
+                while index < len(positions) and \
+                        positions[index] == positions[index - 1] + 1:
+                    chunk += changes[positions[index]]
+                    index += 1
+                image_file.seek(header.data_offset + start * pixel_size)
+                image_file.write(chunk)
+                writes += 1
+
+        return writes
+
+    def _rle_is_smaller(self, header, sample_rows=32):
+        """Estimate if the RLE compression reduces the size of the image.
+
+        The size of some rows, taken at regular intervals, is computed from
+        their runs of equal pixels with the packets of the default encoder
+        and the settings of a header, without compressing them. The optimal
+        encoder can only give smaller rows.
+
+        Args:
+            header (TGAHeader): the header of the file to write
+            sample_rows (int): maximum number of rows to check
+
+        Returns:
+            bool: if the compressed image is estimated smaller than the raw one
+        """
+        backend = get_backend()
+        pixel_size = header.bytes_per_pixel
+        width = self._pixels.width
+        height = len(self._pixels)
+        step = max(1, -(-height // sample_rows))
+
+        compressed = 0
+        raw = 0
+        for index in range(0, height, step):
+            raw += width * pixel_size
+            data = backend.from_matrix(
+                self._pixels.get_region(index, 0, 1, width),
+                header.pixel_depht)
+            ##
+            # Same packets of 'rle_encode': pixels alone go in raw packets,
+            # a run leaves its last pixel to them after full packets
+            #
+            alone = 0
+            for start, length in backend._runs(data, pixel_size):
+                if length == 1:
+                    alone += 1
+                    continue
+                compressed += alone * pixel_size + (alone + 127) // 128
+                full, remainder = divmod(length, 128)
+                compressed += (full + (remainder > 1)) * (1 + pixel_size)
+                alone = 1 if remainder == 1 else 0
+            compressed += alone * pixel_size + (alone + 127) // 128
+
+        return compressed < raw
+
+    def _encode_row(self, index, header, optimize=False):
+        """Compress a row of pixels with the settings of a header.
+
+        Args:
+            index (int): the number of the row to compress
+            header (TGAHeader): the header of the file to write
+            optimize (bool): use the encoder that minimizes the size
+
+        Returns:
+            tuple(bytes, int, int): the row compressed with RLE, the number
+                of run-length packets and the number of raw packets
+        """
+        backend = get_backend()
+        pixel_size = header.bytes_per_pixel
+        data = bytes(backend.from_matrix(
+            self._pixels.get_region(index, 0, 1, self._pixels.width),
+            header.pixel_depht))
+
+        if not optimize:
+            return backend.rle_encode(data, pixel_size)
+
+        tmp = bytearray()
+        run_packets = 0
+        raw_packets = 0
+        pixels = [data[pos:pos + pixel_size]
+                  for pos in range(0, len(data), pixel_size)]
+        for repetition_count, pixel_value in self._encode_optimal(
+                pixels, pixel_size):
+            tmp += gen_byte(repetition_count)
+            if repetition_count > 127:
+                run_packets += 1
+                tmp += pixel_value
+            else:
+                raw_packets += 1
+                tmp += b''.join(pixel_value)
+
+        return bytes(tmp), run_packets, raw_packets
+
     @staticmethod
     def _encode(row):
         """Econde a row of pixels.
@@ -919,23 +2981,100 @@ class Image(object):
                 index += 1
             elif state == 1 and row[index] == pixel_value:
                 if repetition_count & 0b1111111 == 127:
+                    # Packet full, the pixel starts a new packet
                     yield (repetition_count, pixel_value)
-                    repetition_count = 0b10000000
+                    state = 0
                 else:
                     repetition_count += 1
-                index += 1
-            elif state == 2 and row[index] != pixel_value:
+                    index += 1
+            elif state == 2 and (index == len(row) - 1 or
+                                 row[index] != row[index + 1]):
                 if repetition_count & 0b1111111 == 127:
+                    # Packet full, the pixel starts a new packet
                     yield (repetition_count, pixel_value)
-                    repetition_count = 0
-                    pixel_value = [row[index]]
+                    state = 0
                 else:
                     repetition_count += 1
                     pixel_value.append(row[index])
-                index += 1
+                    index += 1
             else:
                 yield (repetition_count, pixel_value)
                 state = 0
 
         if state != 0:
             yield (repetition_count, pixel_value)
+
+    @staticmethod
+    def _encode_optimal(row, pixel_size):
+        """Encode a row of pixels with the smallest number of bytes.
+
+        The default encoder starts a run-length packet every time two
+        neighboring pixels are equal, so mixed content is split in many
+        short packets. Here a dynamic programming search over the pixel
+        positions chooses the last packet of each prefix of the row: a raw
+        packet of 1 to 128 pixels or a run-length packet of 2 to 128 equal
+        pixels (so a long run can leave pixels to the neighboring raw
+        packets). Packets never leave the row.
+
+        Args:
+            row (list): a list of pixels. See 'check' function for more details
+            pixel_size (int): size in bytes of a pixel in the file
+
+        Returns:
+            list of tuple: repetition_count and pixel_value of the packets,
+                in the same format of '_encode'
+        """
+        num_pixels = len(row)
+        ##
+        # best[i]: minimum size to encode the first i pixels
+        # choice[i]: first pixel of the last packet and if it is a run
+        #
+        best = [0] + [None] * num_pixels
+        choice = [None] * (num_pixels + 1)
+        # Candidate starts of the last packet, with increasing cost:
+        # raw packets minimize best[j] - j * pixel_size, run-length
+        # packets minimize best[j] over the pixels equal to the last one
+        raw_starts = deque()
+        run_starts = deque()
+        equal_from = 0
+
+        for end in range(1, num_pixels + 1):
+            start = end - 1
+            while raw_starts and best[raw_starts[-1]] - \
+                    raw_starts[-1] * pixel_size >= \
+                    best[start] - start * pixel_size:
+                raw_starts.pop()
+            raw_starts.append(start)
+            if raw_starts[0] < end - 128:
+                raw_starts.popleft()
+            first = raw_starts[0]
+            best[end] = best[first] + 1 + (end - first) * pixel_size
+            choice[end] = (first, False)
+
+            if start > 0 and row[start] != row[start - 1]:
+                equal_from = start
+                run_starts.clear()
+            if end - 2 >= equal_from:
+                start = end - 2
+                while run_starts and best[run_starts[-1]] >= best[start]:
+                    run_starts.pop()
+                run_starts.append(start)
+                if run_starts[0] < end - 128:
+                    run_starts.popleft()
+                first = run_starts[0]
+                if best[first] + 1 + pixel_size < best[end]:
+                    best[end] = best[first] + 1 + pixel_size
+                    choice[end] = (first, True)
+
+        packets = []
+        end = num_pixels
+        while end > 0:
+            start, run = choice[end]
+            if run:
+                packets.append((0b10000000 | (end - start - 1), row[start]))
+            else:
+                packets.append((end - start - 1, row[start:end]))
+            end = start
+        packets.reverse()
+
+        return packets
@@ -29,15 +29,16 @@ if __name__ == "__main__":
 
             'License :: OSI Approved :: MIT License',
 
-            'Programming Language :: Python :: 2.7',
             'Programming Language :: Python :: 3',
-            'Programming Language :: Python :: 3.5',
+            'Programming Language :: Python :: 3 :: Only',
+            'Programming Language :: Python :: 3.8',
         ],
 
         keywords='tga image development',
 
         packages=find_packages(exclude=['contrib', 'docs', 'tests']),
 
+        python_requires='>=3.8',
         install_requires=[],
         extras_require={},
         package_data={},
@@ -0,0 +1,155 @@
+import unittest
+import os
+import random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def gen_rows(pixel_size, num=50, seed=42):
+    """Rows of pixels in file format with runs of many lengths."""
+    rand = random.Random(seed)
+    rows = []
+    for row in range(num):
+        pixels = []
+        width = rand.randint(1, 400)
+        while len(pixels) < width:
+            pixel = bytes(bytearray(rand.randint(0, 3)
+                                    for elm in range(pixel_size)))
+            pixels += [pixel] * rand.choice([1, 1, 1, 2, 3, 127, 128, 129])
+        rows.append(b''.join(pixels[:width]))
+    return rows
+
+
+class TestBackends(unittest.TestCase):
+
+    def setUp(self):
+        import pyTGA
+        self.previous = pyTGA.get_backend()
+
+    def tearDown(self):
+        import pyTGA
+        pyTGA.set_backend(self.previous)
+
+    def test_python_matches_pixel_helpers(self):
+        from pyTGA import tga
+        from pyTGA.backends import PythonBackend
+
+        backend = PythonBackend()
+        pixels_16 = [(c_r, c_g, c_b) for c_r in (0, 1, 31)
+                     for c_g in (0, 17, 31) for c_b in (0, 30, 31)]
+        matrix = bytes(bytearray(value for pixel in pixels_16
+                                 for value in pixel))
+        data = b''.join(tga.gen_pixel_rgb_16(*pixel) for pixel in pixels_16)
+        self.assertEqual(bytes(backend.from_matrix(matrix, 16)), data)
+        self.assertEqual(bytes(backend.to_matrix(data, 16)), matrix)
+
+        pixels_32 = [(1, 2, 3, 4), (255, 0, 128, 7)]
+        matrix = bytes(bytearray(value for pixel in pixels_32
+                                 for value in pixel))
+        data = b''.join(tga.gen_pixel_rgba(*pixel) for pixel in pixels_32)
+        self.assertEqual(bytes(backend.from_matrix(matrix, 32)), data)
+        self.assertEqual(bytes(backend.to_matrix(data, 32)), matrix)
+
+        matrix = bytes(bytearray([1, 2, 3, 4, 5, 6]))
+        data = tga.gen_pixel_rgba(1, 2, 3) + tga.gen_pixel_rgba(4, 5, 6)
+        self.assertEqual(bytes(backend.from_matrix(matrix, 24)), data)
+        self.assertEqual(bytes(backend.to_matrix(data, 24)), matrix)
+
+    def test_python_matches_encode(self):
+        import pyTGA
+        from pyTGA.backends import PythonBackend
+
+        backend = PythonBackend()
+        for row in gen_rows(1):
+            expected = bytearray()
+            for repetition_count, pixel_value in pyTGA.Image._encode(
+                    bytearray(row)):
+                expected.append(repetition_count)
+                if repetition_count > 127:
+                    expected.append(pixel_value)
+                else:
+                    expected += bytearray(pixel_value)
+            encoded = backend.rle_encode(row, 1)[0]
+            self.assertEqual(encoded, bytes(expected))
+            decoded = backend.rle_decode(encoded, 1, len(row), 1)
+            self.assertEqual(bytes(decoded[0]), row)
+            self.assertEqual(decoded[1], len(encoded))
+
+    @unittest.skipIf(numpy is None, "NumPy is not available")
+    def test_numpy_matches_python(self):
+        from pyTGA.backends import NumpyBackend, PythonBackend
+
+        python = PythonBackend()
+        vectorized = NumpyBackend()
+        for pixel_depht in (8, 16, 24, 32):
+            pixel_size = pixel_depht // 8
+            for row in gen_rows(pixel_size, num=20):
+                self.assertEqual(
+                    bytes(vectorized.to_matrix(row, pixel_depht)),
+                    bytes(python.to_matrix(row, pixel_depht)))
+                self.assertEqual(vectorized.rle_encode(row, pixel_size),
+                                 python.rle_encode(row, pixel_size))
+                matrix = bytes(python.to_matrix(row, pixel_depht))
+                self.assertEqual(
+                    bytes(vectorized.from_matrix(matrix, pixel_depht)),
+                    bytes(python.from_matrix(matrix, pixel_depht)))
+                counts = [[[0] * 256 for _ in range(pixel_size)]
+                          for _ in range(2)]
+                python.histogram(row, pixel_size, counts[0])
+                vectorized.histogram(row, pixel_size, counts[1])
+                self.assertEqual(counts[0], counts[1])
+
+        rand = random.Random(5)
+        for dst_size in (3, 4):
+            for premultiplied in (False, True):
+                src = bytes(bytearray(rand.choice((0, 1, 128, 254, 255))
+                                      for elm in range(3 * 40 * 4)))
+                dst = bytes(bytearray(rand.randint(0, 255)
+                                      for elm in range(3 * 40 * dst_size)))
+                self.assertEqual(
+                    vectorized.composite(src, dst, 3, 40, dst_size == 4,
+                                         premultiplied),
+                    python.composite(src, dst, 3, 40, dst_size == 4,
+                                     premultiplied))
+
+    @unittest.skipIf(numpy is None, "NumPy is not available")
+    def test_numpy_files_match_python(self):
+        import pyTGA
+
+        data = [
+            [((col // 3) % 5, row, col % 2, 255) for col in range(300)]
+            for row in range(7)
+        ]
+        image = pyTGA.Image(data=data)
+        outputs = []
+        for backend in ('python', 'numpy'):
+            pyTGA.set_backend(backend)
+            image.copy().save("test_backend_" + backend, compress=True)
+            with open("test_backend_" + backend + ".tga", "rb") as tga_file:
+                outputs.append(tga_file.read())
+            loaded = pyTGA.Image().load("test_backend_" + backend + ".tga")
+            self.assertEqual(loaded, image)
+            os.remove("test_backend_" + backend + ".tga")
+        self.assertEqual(outputs[0], outputs[1])
+
+    def test_set_backend(self):
+        import pyTGA
+        from pyTGA.backends import PythonBackend
+
+        self.assertEqual(pyTGA.set_backend('python').name, 'python')
+        self.assertEqual(pyTGA.get_backend().name, 'python')
+        self.assertIn(pyTGA.set_backend('auto').name, ('python', 'numpy'))
+        backend = PythonBackend()
+        self.assertIs(pyTGA.set_backend(backend), backend)
+        if numpy is None:
+            with self.assertRaises(ImportError):
+                pyTGA.set_backend('numpy')
+        with self.assertRaises(ValueError) as context:
+            pyTGA.set_backend('fortran')
+        self.assertIn("numpy, python, auto", str(context.exception))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,15 @@
 import unittest
 import os
+import random
+
+
+def _invert_tile(tile):
+    # Used by test_map_tiles, a top level function can be sent to workers
+    for row in range(tile.height):
+        data = tile.row(row)
+        data[:] = bytes(bytearray(255 - value for value in data))
+    tile.set_pixel(0, 0, tile.get_pixel(0, 0)[:3] + (tile.x,))
+    return tile.x, tile.y, tile.width, tile.height
 
 
 class TestStringMethods(unittest.TestCase):
@@ -146,14 +156,13 @@ class TestStringMethods(unittest.TestCase):
 
         image = pyTGA.Image(data=data_rgb)
         image.save("test_16", force_16_bit=True)
+        self.addCleanup(os.remove, "test_16.tga")
 
         image2 = pyTGA.Image()
         image2.load("test_16.tga")
 
         self.assertEqual(image2.get_pixels(), data_rgb_16)
 
-        os.remove("test_16.tga")
-
     def test_data_exceptions(self):
         import pyTGA
 
@@ -474,5 +483,1065 @@ class TestStringMethods(unittest.TestCase):
         the_exception = img_e.exception
         self.assertEqual(the_exception.errno, -10)
 
+    def test_stats(self):
+        import pyTGA
+
+        data = [
+            [(0, 0, 0) for elm in range(100)],
+            [(elm % 255, 0, 0) for elm in range(100)],
+        ]
+
+        stats = pyTGA.TGAStats()
+        image = pyTGA.Image(data=data)
+        image.save("test_stats", compress=True, stats=stats)
+
+        self.assertEqual(stats.bytes_written,
+                         os.path.getsize("test_stats.tga"))
+        self.assertEqual(stats.run_packets, 1)
+        self.assertEqual(stats.raw_packets, 1)
+        self.assertEqual(stats.raw_bytes, 600)
+        self.assertEqual(stats.payload_bytes, (1 + 3) + (1 + 300))
+        for phase in ('header', 'encode', 'write'):
+            self.assertIn(phase, stats.timings)
+
+        stats.reset()
+        previous = pyTGA.set_default_stats(stats)
+        try:
+            image2 = pyTGA.Image()
+            image2.load("test_stats.tga")
+        finally:
+            pyTGA.set_default_stats(previous)
+
+        self.assertEqual(stats.bytes_read, os.path.getsize("test_stats.tga"))
+        self.assertEqual(stats.run_packets, 1)
+        self.assertEqual(stats.raw_packets, 1)
+        self.assertAlmostEqual(stats.compression_ratio, 600 / 305.0)
+        for phase in ('footer', 'header', 'read', 'decode', 'buffer'):
+            self.assertIn(phase, stats.timings)
+        self.assertEqual(image.get_pixels(), image2.get_pixels())
+
+        os.remove("test_stats.tga")
+
+    def test_image_cache(self):
+        import pyTGA
+
+        data = [
+            [(elm % 255, 0, 0) for elm in range(10)] for row in range(10)
+        ]
+
+        pyTGA.Image(data=data).save("test_cache_1")
+        pyTGA.Image(data=data).save("test_cache_2")
+
+        cache = pyTGA.ImageCache(max_bytes=400)
+
+        image = cache.load("test_cache_1.tga")
+        self.assertIs(cache.load("test_cache_1.tga"), image)
+        self.assertEqual(cache.info()['hits'], 1)
+        self.assertEqual(cache.info()['misses'], 1)
+        self.assertEqual(cache.size, 300)
+
+        with self.assertRaises(pyTGA.ImageError) as img_e:
+            image.set_pixel(0, 0, (1, 2, 3))
+        self.assertEqual(img_e.exception.errno, -40)
+        with self.assertRaises(pyTGA.ImageError) as img_e:
+            image.set_storage('rle')
+        self.assertEqual(img_e.exception.errno, -40)
+        self.assertEqual(image.get_storage(), 'flat')
+
+        # Saving a shared image does not change its header or row cache
+        header = image._header.to_bytes()
+        row_cache = dict(image._row_cache)
+        image.save("test_cache_3", compress=True, force_16_bit=True)
+        self.addCleanup(os.remove, "test_cache_3.tga")
+        self.assertEqual(image._header.to_bytes(), header)
+        self.assertEqual(image._row_cache, row_cache)
+        self.assertEqual(pyTGA.read_info("test_cache_3.tga")['pixel_depht'],
+                         16)
+
+        editable = cache.load("test_cache_1.tga", copy=True)
+        editable.set_pixel(0, 0, (1, 2, 3))
+        self.assertEqual(image.get_pixel(0, 0), (0, 0, 0))
+
+        # Budget is for one image only
+        cache.load("test_cache_2.tga")
+        self.assertNotIn("test_cache_1.tga", cache)
+        self.assertIn("test_cache_2.tga", cache)
+        self.assertEqual(cache.info()['evictions'], 1)
+
+        # A modified file is loaded again
+        pyTGA.Image(data=data).set_pixel(0, 0, (9, 9, 9)).save(
+            "test_cache_2", compress=True)
+        self.assertEqual(
+            cache.load("test_cache_2.tga").get_pixel(0, 0), (9, 9, 9))
+        self.assertEqual(len(cache), 1)
+
+        os.remove("test_cache_1.tga")
+        os.remove("test_cache_2.tga")
+
+    def test_dirty_rows(self):
+        import pyTGA
+
+        data = [
+            [(row, 0, 0, 255) for elm in range(50)] +
+            [(elm, row, 0, 255) for elm in range(50)] for row in range(20)
+        ]
+
+        pyTGA.Image(data=data).save("test_dirty_rows", compress=True)
+
+        image = pyTGA.Image()
+        image.load("test_dirty_rows.tga")
+        self.assertEqual(image.get_dirty_rows(), [])
+
+        image.set_pixel(3, 10, (1, 2, 3, 4))
+        image.set_pixel(7, 60, (1, 2, 3, 4))
+        self.assertEqual(image.get_dirty_rows(), [3, 7])
+
+        encoded_rows = []
+        encode_row = pyTGA.Image._encode_row
+
+        def spy(self, row, *args):
+            encoded_rows.append(row)
+            return encode_row(self, row, *args)
+
+        pyTGA.Image._encode_row = spy
+        try:
+            image.save("test_dirty_rows_2", compress=True)
+            self.assertEqual(len(encoded_rows), 2)
+            self.assertEqual(image.get_dirty_rows(), [])
+
+            image.save("test_dirty_rows_2", compress=True)
+            self.assertEqual(len(encoded_rows), 2)
+        finally:
+            pyTGA.Image._encode_row = encode_row
+
+        data[3][10] = (1, 2, 3, 4)
+        data[7][60] = (1, 2, 3, 4)
+        image2 = pyTGA.Image()
+        image2.load("test_dirty_rows_2.tga")
+        self.assertEqual(image2.get_pixels(),
+                         pyTGA.Image(data=data).get_pixels())
+
+        os.remove("test_dirty_rows.tga")
+        os.remove("test_dirty_rows_2.tga")
+
+    def test_patch_file(self):
+        import pyTGA
+
+        data = [
+            [(elm, row, 0, 255) for elm in range(10)] for row in range(5)
+        ]
+
+        pyTGA.Image(data=data).save("test_patch_file")
+        size = os.path.getsize("test_patch_file.tga")
+
+        writes = pyTGA.Image.patch_file("test_patch_file.tga", [
+            (1, 2, (9, 9, 9, 9)),
+            (1, 3, (8, 8, 8, 8)),
+            (4, 9, (7, 7, 7, 7)),
+        ])
+        self.assertEqual(writes, 2)
+        self.assertEqual(os.path.getsize("test_patch_file.tga"), size)
+
+        data[1][2] = (9, 9, 9, 9)
+        data[1][3] = (8, 8, 8, 8)
+        data[4][9] = (7, 7, 7, 7)
+        image = pyTGA.Image()
+        image.load("test_patch_file.tga")
+        self.assertEqual(image.get_pixels(),
+                         pyTGA.Image(data=data).get_pixels())
+
+        with self.assertRaises(pyTGA.ImageError) as img_e:
+            pyTGA.Image.patch_file("test_patch_file.tga",
+                                   {(5, 0): (0, 0, 0, 0)})
+        self.assertEqual(img_e.exception.errno, -24)
+
+        pyTGA.Image(data=data).save("test_patch_file", compress=True)
+        with self.assertRaises(pyTGA.ImageError) as img_e:
+            pyTGA.Image.patch_file("test_patch_file.tga",
+                                   {(0, 0): (0, 0, 0, 0)})
+        self.assertEqual(img_e.exception.errno, -31)
+
+        os.remove("test_patch_file.tga")
+
+    def test_compression_auto(self):
+        import pyTGA
+
+        data_flat = [
+            [(0, 0, 0) for elm in range(100)] for row in range(10)
+        ]
+        data_noise = [
+            [((elm * 7 + row * 13) % 255, elm % 3, row % 5)
+             for elm in range(100)] for row in range(10)
+        ]
+
+        stats = pyTGA.TGAStats()
+        image = pyTGA.Image(data=data_flat)
+        image.save("test_compression_auto", compress='auto', stats=stats)
+        self.assertTrue(stats.compressed)
+
+        image2 = pyTGA.Image()
+        image2.load("test_compression_auto.tga")
+        self.assertEqual(image2._header.image_type, 10)
+        self.assertEqual(image.get_pixels(), image2.get_pixels())
+
+        image = pyTGA.Image(data=data_noise)
+        image.save("test_compression_auto", compress='auto', stats=stats)
+        self.assertFalse(stats.compressed)
+
+        image2 = pyTGA.Image()
+        image2.load("test_compression_auto.tga")
+        self.assertEqual(image2._header.image_type, 2)
+        self.assertEqual(image.get_pixels(), image2.get_pixels())
+
+        # At most 32 rows are sampled, only their runs are computed
+        backend = pyTGA.get_backend()
+        sampled = []
+
+        def runs(data, pixel_size):
+            sampled.append(data)
+            return type(backend)._runs(backend, data, pixel_size)
+
+        backend._runs = runs
+        try:
+            pyTGA.Image(data=data_noise * 4).save(
+                "test_compression_auto", compress='auto', stats=stats)
+        finally:
+            del backend._runs
+        self.assertFalse(stats.compressed)
+        self.assertEqual(len(sampled), 20)
+
+        os.remove("test_compression_auto.tga")
+
+    def test_compression_optimal(self):
+        import pyTGA
+
+        # Pairs of equal pixels between different ones: the default encoder
+        # makes many short packets
+        data = [
+            [((elm // 4) * 3 + (0, 1, 2, 2)[elm % 4]) % 256
+             for elm in range(300)],
+            [(elm // 2 % 7) for elm in range(300)],
+            [0 for elm in range(300)],
+        ]
+
+        image = pyTGA.Image(data=data)
+        image.save("test_compression_greedy", compress=True)
+        image.save("test_compression_optimal", compress=True, optimize=True)
+
+        self.assertLess(os.path.getsize("test_compression_optimal.tga"),
+                        os.path.getsize("test_compression_greedy.tga"))
+
+        image2 = pyTGA.Image()
+        image2.load("test_compression_optimal.tga")
+        self.assertEqual(image.get_pixels(), image2.get_pixels())
+
+        # Never larger than the default encoder, also when a run is longer
+        # than a packet
+        backend = pyTGA.get_backend()
+        rng = random.Random(7)
+        rows = [[b'a'] * 129 + [b'b']]
+        for num in range(300):
+            row = []
+            while len(row) < 200:
+                row += [bytearray([rng.randrange(3)]) * 3] * \
+                    rng.choice((1, 1, 2, 3, 129, 130))
+            rows.append([bytes(pixel) for pixel in row[:200]])
+        for row in rows:
+            pixel_size = len(row[0])
+            packets = pyTGA.Image._encode_optimal(row, pixel_size)
+            size = sum(1 + pixel_size * (1 if count > 127 else len(value))
+                       for count, value in packets)
+            self.assertLessEqual(
+                size, len(backend.rle_encode(b''.join(row), pixel_size)[0]))
+        self.assertEqual(len(pyTGA.Image._encode_optimal(rows[0], 1)), 2)
+
+        os.remove("test_compression_greedy.tga")
+        os.remove("test_compression_optimal.tga")
+
+    def test_atlas(self):
+        import pyTGA
+        from pyTGA import atlas
+
+        sprites = {}
+        for num in range(12):
+            width = 5 + num % 4
+            height = 3 + num % 3
+            sprites["sprite_{0}".format(num)] = pyTGA.Image(data=[
+                [(num, row, col, 255) for col in range(width)]
+                for row in range(height)
+            ])
+
+        atlases, index = atlas.build(sprites, max_width=20, max_height=12)
+        self.assertGreater(len(atlases), 1)
+
+        for name, image in sprites.items():
+            num, col, row, width, height = index[name]
+            self.assertEqual((width, height), image.get_size())
+            self.assertEqual(atlases[num].get_pixel(row, col),
+                             image.get_pixel(0, 0))
+
+        index_name = atlas.save("test_atlas", atlases, index)
+        for name, image in sprites.items():
+            sprite = atlas.read_sprite(index_name, name)
+            self.assertEqual(sprite.get_pixels(), image.get_pixels())
+
+        # Atlases that end in the header or in the pixel data
+        name = [name for name in sprites if index[name][0] == 0][0]
+        with open("test_atlas_0.tga", "rb") as atlas_file:
+            data = atlas_file.read()
+        for size in (10, 18 + 4):
+            with open("test_atlas_0.tga", "wb") as atlas_file:
+                atlas_file.write(data[:size])
+            with self.assertRaises(pyTGA.ImageError) as context:
+                atlas.read_sprite(index_name, name)
+            self.assertEqual(context.exception.errno, -33)
+
+        with self.assertRaises(pyTGA.ImageError):
+            atlas.build(sprites, max_width=6, max_height=6)
+
+        os.remove(index_name)
+        for num in range(len(atlases)):
+            os.remove("test_atlas_{0}.tga".format(num))
+
+    def test_metadata_index(self):
+        import shutil
+        import tempfile
+        import pyTGA
+
+        MetadataIndex = pyTGA.index.MetadataIndex
+
+        root = tempfile.mkdtemp()
+        try:
+            os.mkdir(os.path.join(root, "sub"))
+            pyTGA.Image(data=[[(0, 0, 0, 0)] * 30] * 2).save(
+                os.path.join(root, "wide"))
+            pyTGA.Image(data=[[0] * 2] * 3).save(
+                os.path.join(root, "sub", "bw"), original_format=True)
+            pyTGA.Image(data=[[(0, 0, 0)] * 4] * 4).save(
+                os.path.join(root, "sub", "rgb"), compress=True)
+            open(os.path.join(root, "empty.tga"), "wb").close()
+
+            db_name = os.path.join(root, "index.db")
+            with MetadataIndex(db_name) as index:
+                self.assertEqual(index.update(root, workers=2),
+                                 {'added': 4, 'updated': 0, 'removed': 0,
+                                  'unchanged': 0})
+                self.assertEqual(len(index), 4)
+                empty = index.get(os.path.join(root, "empty.tga"))
+                self.assertEqual(empty['error'], "file ends in the header")
+                self.assertIsNone(empty['width'])
+                os.remove(os.path.join(root, "empty.tga"))
+
+                wide = index.find(pixel_depht=32, min_width=20)
+                self.assertEqual(len(wide), 1)
+                self.assertEqual(wide[0]['path'],
+                                 os.path.join(root, "wide.tga"))
+                self.assertEqual(wide[0]['origin'], 'tl')
+                # The limits are included
+                self.assertEqual(index.find(min_width=30, max_width=30), wide)
+                self.assertEqual(
+                    len(index.find(min_height=3, max_height=4)), 2)
+                self.assertEqual(index.find(min_width=31), [])
+
+                info = index.get(os.path.join(root, "sub", "bw.tga"))
+                self.assertEqual(info['new_format'], 0)
+                self.assertEqual((info['width'], info['height']), (2, 3))
+                self.assertEqual(len(index.find(image_type=10)), 1)
+
+                os.remove(os.path.join(root, "sub", "rgb.tga"))
+                pyTGA.Image(data=[[0] * 5] * 3).save(
+                    os.path.join(root, "sub", "bw"))
+                os.utime(os.path.join(root, "sub", "bw.tga"), (1, 1))
+
+            with MetadataIndex(db_name) as index:
+                self.assertEqual(index.update(root),
+                                 {'added': 0, 'updated': 1, 'removed': 2,
+                                  'unchanged': 1})
+                self.assertEqual(
+                    len(index.query("width = ? AND new_format = 1", (5,))), 1)
+        finally:
+            shutil.rmtree(root)
+
+    def test_image_equality(self):
+        import pyTGA
+
+        image = pyTGA.Image(data=[[(1, 2, 3)] * 2])
+        same = pyTGA.Image(data=[[(1, 2, 3)] * 2])
+        self.assertIsNot(image, same)
+        self.assertEqual(image, same)
+        self.assertFalse(image != same)
+        self.assertNotEqual(image, pyTGA.Image(data=[[(1, 2, 4)] * 2]))
+        self.assertNotEqual(image, pyTGA.Image(data=[[(1, 2, 3, 255)] * 2]))
+        self.assertNotEqual(image, pyTGA.Image(data=[[(1, 2, 3)]] * 2))
+        self.assertNotEqual(image, "not an image")
+
+        # Images are mutable, so they are not hashable
+        with self.assertRaises(TypeError):
+            hash(image)
+        with self.assertRaises(TypeError):
+            set([image])
+        with self.assertRaises(TypeError):
+            {image: 1}
+        self.assertIn(image.content_hash(), {same.content_hash(): same})
+
+    def test_content_hash(self):
+        import pyTGA
+
+        data = [
+            [(elm % 7, row, 0, 255) for elm in range(200)] for row in range(5)
+        ]
+
+        image = pyTGA.Image(data=data)
+        image.save("test_hash_raw")
+        image.save("test_hash_rle", compress=True)
+        pyTGA.Image(data=[[(elm % 32, row, 5) for elm in range(200)]
+                          for row in range(5)]).save(
+            "test_hash_16", compress=True, force_16_bit=True)
+
+        image2 = pyTGA.Image()
+        image2.load("test_hash_rle.tga")
+        self.assertEqual(image, image2)
+        self.assertEqual(image.content_hash(), image2.content_hash())
+
+        self.assertEqual(pyTGA.hash_file("test_hash_raw.tga"),
+                         image.content_hash())
+        self.assertEqual(pyTGA.hash_file("test_hash_rle.tga"),
+                         image.content_hash())
+
+        image3 = pyTGA.Image()
+        image3.load("test_hash_16.tga")
+        self.assertEqual(pyTGA.hash_file("test_hash_16.tga"),
+                         image3.content_hash())
+        self.assertEqual(list(pyTGA.iter_rows("test_hash_16.tga")),
+                         [image3.get_pixels()[row * 600:(row + 1) * 600]
+                          for row in range(5)])
+
+        image2.set_pixel(4, 199, (1, 1, 1, 1))
+        self.assertNotEqual(image, image2)
+        self.assertNotEqual(image.content_hash(), image2.content_hash())
+        self.assertNotEqual(image, pyTGA.Image(data=[[0] * 200] * 5))
+
+        # Files that end in the header or in the pixel data
+        for name, size in (("test_hash_raw.tga", 10),
+                           ("test_hash_raw.tga", 18 + 800 * 3 + 5),
+                           ("test_hash_rle.tga", 10),
+                           ("test_hash_rle.tga", 40)):
+            with open(name, "rb") as image_file:
+                data = image_file.read(size)
+            with open("test_hash_cut.tga", "wb") as image_file:
+                image_file.write(data)
+            with self.assertRaises(pyTGA.ImageError) as context:
+                list(pyTGA.iter_rows("test_hash_cut.tga"))
+            self.assertEqual(context.exception.errno, -33)
+            with self.assertRaises(pyTGA.ImageError) as context:
+                pyTGA.hash_file("test_hash_cut.tga")
+            self.assertEqual(context.exception.errno, -33)
+        os.remove("test_hash_cut.tga")
+
+        os.remove("test_hash_raw.tga")
+        os.remove("test_hash_rle.tga")
+        os.remove("test_hash_16.tga")
+
+    def test_composite(self):
+        import pyTGA
+
+        src = pyTGA.Image(data=[
+            [(200, 100, 50, (col * 40) % 256 if col % 3 else 255 * (row % 2))
+             for col in range(8)] for row in range(4)
+        ])
+        dst_rgb = pyTGA.Image(data=[[(10, 20, 30)] * 6 for row in range(5)])
+        dst_rgba = pyTGA.Image(data=[[(10, 20, 30, 128)] * 6
+                                     for row in range(5)])
+
+        dst_rgb.composite(src, -2, 2)
+        dst_rgba.composite(src, -2, 2)
+
+        for row in range(5):
+            for col in range(6):
+                src_row, src_col = row - 2, col + 2
+                if 0 <= src_row < 4:
+                    c_r, c_g, c_b, alpha = src.get_pixel(src_row, src_col)
+                else:
+                    alpha = 0
+                if alpha == 0:
+                    self.assertEqual(dst_rgb.get_pixel(row, col), (10, 20, 30))
+                    self.assertEqual(dst_rgba.get_pixel(row, col),
+                                     (10, 20, 30, 128))
+                    continue
+                expected = tuple(
+                    min(255, (value * alpha + 127) // 255 +
+                        (old * (255 - alpha) + 127) // 255)
+                    for value, old in zip((c_r, c_g, c_b), (10, 20, 30)))
+                self.assertEqual(dst_rgb.get_pixel(row, col), expected)
+                out = alpha * 255 + 128 * (255 - alpha)
+                expected = tuple(
+                    (value * alpha * 255 + old * 128 * (255 - alpha) +
+                     out // 2) // out
+                    for value, old in zip((c_r, c_g, c_b), (10, 20, 30))
+                ) + ((out + 127) // 255,)
+                self.assertEqual(dst_rgba.get_pixel(row, col), expected)
+
+        premultiplied = pyTGA.Image(data=[[(100, 100, 100, 255)] * 2])
+        premultiplied.composite(
+            pyTGA.Image(data=[[(50, 0, 0, 128), (0, 0, 0, 0)]]), 0, 0,
+            premultiplied=True)
+        self.assertEqual(premultiplied.get_pixel(0, 0), (100, 50, 50, 255))
+        self.assertEqual(premultiplied.get_pixel(0, 1), (100, 100, 100, 255))
+
+        with self.assertRaises(pyTGA.ImageError) as img_e:
+            dst_rgb.composite(src, 0, 0, mode='multiply')
+        self.assertEqual(img_e.exception.errno, -32)
+
+        with self.assertRaises(pyTGA.ImageError) as img_e:
+            src.composite(dst_rgb, 0, 0)
+        self.assertEqual(img_e.exception.errno, -25)
+
+    def test_resize(self):
+        import pyTGA
+
+        image = pyTGA.Image(data=[
+            [0, 10, 20, 30],
+            [40, 50, 60, 70],
+            [80, 90, 100, 110],
+        ])
+
+        small = image.resize(2, 1)
+        self.assertEqual(small.get_size(), (2, 1))
+        self.assertEqual(small.get_pixel(0, 0), 45)
+        self.assertEqual(small.get_pixel(0, 1), 65)
+
+        same = image.resize(4, 3, filter='bilinear')
+        self.assertEqual(same, image)
+
+        big = image.resize(8, 3, filter='bilinear')
+        self.assertEqual([big.get_pixel(0, col) for col in range(8)],
+                         [0, 3, 8, 13, 18, 23, 28, 30])
+
+        with self.assertRaises(pyTGA.ImageError) as img_e:
+            image.resize(2, 2, filter='lanczos')
+        self.assertEqual(img_e.exception.errno, -32)
+
+    def test_mipmaps(self):
+        import pyTGA
+
+        image = pyTGA.Image(data=[
+            [(row * 8 + col, 0, 255, 255) for col in range(8)]
+            for row in range(5)
+        ])
+
+        levels = image.mipmaps("test_mipmaps")
+        self.assertIs(levels[0], image)
+        self.assertEqual([level.get_size() for level in levels],
+                         [(8, 5), (4, 2), (2, 1), (1, 1)])
+        # (0 + 1 + 8 + 9) / 4
+        self.assertEqual(levels[1].get_pixel(0, 0), (5, 0, 255, 255))
+
+        for num, level in enumerate(levels):
+            loaded = pyTGA.Image()
+            loaded.load("test_mipmaps_{0}.tga".format(num))
+            self.assertEqual(loaded, level)
+            os.remove("test_mipmaps_{0}.tga".format(num))
+
+    def test_buffer_export(self):
+        import pyTGA
+
+        image = pyTGA.Image(data=[
+            [(row, col, 0) for col in range(4)] for row in range(3)
+        ])
+
+        view = image.get_buffer()
+        self.assertEqual(view.shape, (3, 4, 3))
+        self.assertEqual(view.format, 'B')
+        self.assertEqual(view.tobytes(), image.get_pixels())
+        self.assertEqual(image.__array_interface__['shape'], (3, 4, 3))
+
+        # The view shares the pixels in both directions
+        view[1, 2, 2] = 200
+        self.assertEqual(image.get_pixel(1, 2), (1, 2, 200))
+        image.set_pixel(2, 3, (9, 9, 9))
+        self.assertEqual(view[2, 3, 0], 9)
+
+        image = pyTGA.Image(data=[[1, 2], [3, 4]])
+        self.assertEqual(image.get_buffer().shape, (2, 2))
+        self.assertEqual(image.get_buffer().tolist(), [[1, 2], [3, 4]])
+
+    def test_buffer_writes_saved(self):
+        import pyTGA
+
+        data = [[(1, 2, 3)] * 4 for row in range(3)]
+        pyTGA.Image(data=data).save("test_buffer_writes", compress=True)
+
+        image = pyTGA.Image().load("test_buffer_writes.tga")
+        image.get_buffer()[1, 1, 0] = 99
+        self.assertEqual(image.get_dirty_rows(), [0, 1, 2])
+        image.save("test_buffer_writes_2", compress=True)
+        image.get_buffer()[2, 3, 2] = 77
+        image.save("test_buffer_writes_2", compress=True)
+        image2 = pyTGA.Image().load("test_buffer_writes_2.tga")
+        self.assertEqual(image2.get_pixel(1, 1), (99, 2, 3))
+        self.assertEqual(image2.get_pixel(2, 3), (1, 2, 77))
+
+        out = bytearray(4 * 3 * 3)
+        image = pyTGA.Image().load("test_buffer_writes.tga", out=out)
+        out[0] = 50
+        image.save("test_buffer_writes_2", compress=True)
+        image2 = pyTGA.Image().load("test_buffer_writes_2.tga")
+        self.assertEqual(image2.get_pixel(0, 0), (50, 2, 3))
+
+        os.remove("test_buffer_writes.tga")
+        os.remove("test_buffer_writes_2.tga")
+
+    def test_load_into_buffer(self):
+        import pyTGA
+
+        frames = []
+        for num in range(3):
+            image = pyTGA.Image(data=[
+                [(num, row, col, 255) for col in range(5)] for row in range(4)
+            ])
+            image.save("test_frame_{0}".format(num), compress=num == 1)
+            frames.append(image)
+
+        out = bytearray(4 * 5 * 4)
+        image = pyTGA.Image()
+        image.load("test_frame_0.tga", out=out)
+        self.assertEqual(image, frames[0])
+        self.assertEqual(bytes(out), frames[0].get_pixels())
+
+        # Every frame reuses the buffer of the previous one
+        for num in range(1, 3):
+            image.load("test_frame_{0}.tga".format(num),
+                       out=image.get_buffer())
+            self.assertEqual(image, frames[num])
+            self.assertEqual(bytes(out), frames[num].get_pixels())
+
+        with self.assertRaises(pyTGA.ImageError) as context:
+            image.load("test_frame_0.tga", out=bytearray(10))
+        self.assertEqual(context.exception.errno, -26)
+        with self.assertRaises(pyTGA.ImageError) as context:
+            image.load("test_frame_0.tga", out=bytes(len(out)))
+        self.assertEqual(context.exception.errno, -26)
+
+        for num in range(3):
+            os.remove("test_frame_{0}.tga".format(num))
+
+    def test_sequence(self):
+        import pyTGA
+        from pyTGA import sequence
+
+        frames = [
+            pyTGA.Image(data=[[(num, row, col) for col in range(3)]
+                              for row in range(2)])
+            for num in range(6)
+        ]
+
+        with sequence.SequenceWriter("test_seq_{0:02d}.tga", start=1,
+                                     queue=2, compress=True) as writer:
+            for frame in frames:
+                writer.write(frame)
+        self.assertEqual(writer.names[0], "test_seq_01.tga")
+        self.assertEqual(len(writer.names), 6)
+
+        names = sequence.frame_names("test_seq_%02d.tga", start=1)
+        self.assertEqual(names, writer.names)
+        self.assertEqual(sequence.frame_names("test_seq_*.tga"), names)
+
+        with sequence.SequenceReader("test_seq_{0:02d}.tga", start=1,
+                                     prefetch=3) as reader:
+            self.assertEqual(len(reader), 6)
+            self.assertEqual(list(reader), frames)
+
+        # Stop before the end
+        with sequence.SequenceReader("test_seq_*.tga") as reader:
+            for num, frame in enumerate(reader):
+                self.assertEqual(frame, frames[num])
+                if num == 1:
+                    break
+
+        for name in names:
+            os.remove(name)
+
+    def test_header_footer_bytes(self):
+        from pyTGA.tga import TGAFooter, TGAHeader
+
+        header = TGAHeader()
+        header.image_type = 10
+        header.image_width = 300
+        header.image_height = 2
+        header.pixel_depht = 24
+        header.image_descriptor = 0b00100000
+        data = header.to_bytes()
+        self.assertEqual(len(data), 18)
+        self.assertEqual(data[12:14], b'\x2c\x01')
+
+        copy = TGAHeader().from_bytes(data)
+        for field in TGAHeader.FIELDS:
+            self.assertEqual(getattr(copy, field), getattr(header, field))
+        with self.assertRaises(AttributeError):
+            copy.unknown_field = 1
+
+        footer = TGAFooter()
+        footer.extension_area_offset = 1024
+        data = footer.to_bytes()
+        self.assertEqual(len(data), 26)
+        self.assertTrue(data.endswith(b"TRUEVISION-XFILE.\0"))
+        copy = TGAFooter()
+        self.assertTrue(copy.from_bytes(data))
+        self.assertEqual(copy.extension_area_offset, 1024)
+        self.assertFalse(copy.from_bytes(bytes(bytearray(26))))
+
+    def test_memory_limits(self):
+        import pyTGA
+        from pyTGA.tga import TGAHeader
+
+        image = pyTGA.Image(data=[[(1, 2, 3, 4)] * 10] * 5)
+        image.save("test_limits")
+        header = TGAHeader().from_bytes(image._header.to_bytes())
+        # Payload + pixel buffer
+        self.assertEqual(pyTGA.estimate_memory(header), 200 + 200)
+        self.assertEqual(pyTGA.estimate_memory("test_limits.tga"),
+                         200 + 26 + 200)
+
+        with self.assertRaises(pyTGA.ImageError) as context:
+            pyTGA.Image().load("test_limits.tga", max_pixels=49)
+        self.assertEqual(context.exception.errno, -34)
+        pyTGA.Image().load("test_limits.tga", max_pixels=50)
+
+        previous = pyTGA.set_limits(max_bytes=399)
+        try:
+            with self.assertRaises(pyTGA.ImageError) as context:
+                pyTGA.Image().load("test_limits.tga")
+            self.assertEqual(context.exception.errno, -34)
+            pyTGA.Image().load("test_limits.tga", max_bytes=1000)
+        finally:
+            pyTGA.set_limits(*previous)
+
+        # A header that claims more pixels than the file has
+        header.image_width = header.image_height = 65535
+        with open("test_limits.tga", "wb") as image_file:
+            image_file.write(header.to_bytes())
+            image_file.write(bytes(bytearray(200)))
+        self.assertGreater(pyTGA.estimate_memory("test_limits.tga"),
+                           4 * 65535 * 65535)
+        with self.assertRaises(pyTGA.ImageError) as context:
+            pyTGA.Image().load("test_limits.tga")
+        self.assertEqual(context.exception.errno, -33)
+
+        # Files that end in the header
+        for size in (0, 10):
+            with open("test_limits.tga", "wb") as image_file:
+                image_file.write(header.to_bytes()[:size])
+            with self.assertRaises(pyTGA.ImageError) as context:
+                pyTGA.Image().load("test_limits.tga")
+            self.assertEqual(context.exception.errno, -33)
+            with self.assertRaises(pyTGA.ImageError) as context:
+                pyTGA.Image.patch_file("test_limits.tga", {(0, 0): 0})
+            self.assertEqual(context.exception.errno, -33)
+
+        os.remove("test_limits.tga")
+
+    def test_load_region(self):
+        import pyTGA
+        from struct import pack
+        from pyTGA.tga import TGAFooter, TGAHeader
+
+        data = [[(row, col, row * col % 7) for col in range(9)]
+                for row in range(6)]
+        data[2][1:8] = [(0, 0, 0)] * 7
+        image = pyTGA.Image(data=data)
+
+        for compress in (False, True):
+            image.save("test_region", compress=compress)
+            region = pyTGA.Image().load("test_region.tga",
+                                        region=(2, 1, 4, 3))
+            self.assertEqual(region.get_size(), (4, 3))
+            self.assertEqual(region, pyTGA.Image(data=[
+                row[2:6] for row in data[1:4]]))
+            # All the rows
+            self.assertEqual(
+                pyTGA.Image().load("test_region.tga", region=(0, 0, 9, 6)),
+                image)
+
+        with self.assertRaises(pyTGA.ImageError) as context:
+            pyTGA.Image().load("test_region.tga", region=(5, 0, 5, 1))
+        self.assertEqual(context.exception.errno, -24)
+
+        header = TGAHeader()
+        header.image_type = 11
+        header.image_width = 10
+        header.image_height = 13
+        header.pixel_depht = 8
+
+        # A run of 128 pixels that ends in the last row
+        with open("test_region.tga", "wb") as image_file:
+            image_file.write(header.to_bytes())
+            image_file.write(bytes(bytearray([0x80 | 127, 7, 0x01, 1, 2])))
+        region = pyTGA.Image().load("test_region.tga", region=(6, 12, 4, 1))
+        self.assertEqual(region.get_pixels(), bytes(bytearray([7, 7, 1, 2])))
+
+        # One run for each row and a scan-line table in reverse order
+        header.image_width = 4
+        header.image_height = 3
+        footer = TGAFooter()
+        footer.extension_area_offset = 18 + 3 * 2
+        extension = bytearray(495)
+        extension[0:2] = pack('<H', 495)
+        extension[490:494] = pack('<I',
+                                  footer.extension_area_offset + 495)
+        with open("test_region.tga", "wb") as image_file:
+            image_file.write(header.to_bytes())
+            for row in range(3):
+                image_file.write(bytes(bytearray([0x83, row])))
+            image_file.write(bytes(extension))
+            for row in reversed(range(3)):
+                image_file.write(bytes(bytearray([18 + row * 2, 0, 0, 0])))
+            image_file.write(footer.to_bytes())
+        region = pyTGA.Image().load("test_region.tga", region=(0, 0, 4, 1))
+        self.assertEqual(region.get_pixels(), bytes(bytearray([2] * 4)))
+
+        os.remove("test_region.tga")
+
+    def test_load_subsample(self):
+        import pyTGA
+
+        data = [[(row, col, 0, 255) for col in range(7)] for row in range(5)]
+        data[1] = [(9, 9, 9, 255)] * 7
+        image = pyTGA.Image(data=data)
+
+        for compress in (False, True):
+            image.save("test_subsample", compress=compress)
+            preview = pyTGA.Image().load("test_subsample.tga", subsample=3)
+            self.assertEqual(preview.get_size(), (3, 2))
+            self.assertEqual(preview, pyTGA.Image(data=[
+                row[::3] for row in data[::3]]))
+
+            preview = pyTGA.Image().load("test_subsample.tga",
+                                         region=(1, 1, 6, 4), subsample=2)
+            self.assertEqual(preview, pyTGA.Image(data=[
+                row[1::2] for row in data[1::2]]))
+
+        with self.assertRaises(ValueError):
+            pyTGA.Image().load("test_subsample.tga", subsample=0)
+
+        os.remove("test_subsample.tga")
+
+    def test_stats_file(self):
+        import pyTGA
+
+        data = [[(0, 0, 0, 0)] * 6 for row in range(4)]
+        data[1][2] = (10, 20, 30, 255)
+        data[2][4] = (30, 20, 10, 128)
+        image = pyTGA.Image(data=data)
+
+        for compress in (False, True):
+            image.save("test_stats_file", compress=compress)
+            info = pyTGA.stats("test_stats_file.tga")
+            self.assertEqual((info['width'], info['height']), (6, 4))
+            self.assertEqual(info['channels'], ('R', 'G', 'B', 'A'))
+            self.assertEqual(info['histograms'][0][0], 22)
+            self.assertEqual(info['histograms'][0][10], 1)
+            self.assertEqual(info['histograms'][3][255], 1)
+            self.assertEqual(info['min'], (0, 0, 0, 0))
+            self.assertEqual(info['max'], (30, 20, 30, 255))
+            self.assertAlmostEqual(info['mean'][1], 40 / 24.0)
+            self.assertEqual(info['alpha_bbox'], (2, 1, 3, 2))
+        self.assertGreater(info['run_packets'], 0)
+
+        image = pyTGA.Image(data=[[1, 2], [3, 250]])
+        image.save("test_stats_file", compress=True)
+        info = pyTGA.stats("test_stats_file.tga")
+        self.assertEqual(info['channels'], ('L',))
+        self.assertEqual((info['min'], info['max']), ((1,), (250,)))
+        self.assertIsNone(info['alpha_bbox'])
+
+        os.remove("test_stats_file.tga")
+
+    def test_rle_operations(self):
+        import pyTGA
+        from pyTGA import rle
+
+        clear = (0, 0, 0, 0)
+        red = (255, 0, 0, 255)
+        data = [[clear] * 200 for row in range(4)]
+        data[1][150:170] = [red] * 20
+        data[2][10:12] = [(1, 2, 3, 255), red]
+        image = pyTGA.Image(data=data)
+        image.save("test_rle_operations", compress=True)
+
+        pixel_depht, rows = rle.read_rows("test_rle_operations.tga")
+        self.assertEqual(pixel_depht, 32)
+        self.assertEqual(rle.encode_rows(image), (pixel_depht, rows))
+        self.assertEqual(rle.opaque_count(rows, pixel_depht), 22)
+        self.assertEqual(rle.opaque_count(rows, pixel_depht, clear), 22)
+        self.assertEqual(rle.trim_bbox(rows, pixel_depht), (10, 1, 160, 2))
+        self.assertEqual(rle.trim_bbox(rows[:1], pixel_depht), None)
+        self.assertEqual([rle.row_is_uniform(row, 4) for row in rows],
+                         [True, False, False, True])
+
+        blue = (0, 0, 255, 255)
+        rows = rle.replace_color(rows, pixel_depht, red, blue)
+        data[1][150:170] = [blue] * 20
+        data[2][11] = blue
+        with open("test_rle_operations.tga", "wb") as image_file:
+            image_file.write(image._header.to_bytes())
+            image_file.write(b''.join(rows))
+        self.assertEqual(pyTGA.Image().load("test_rle_operations.tga"),
+                         pyTGA.Image(data=data))
+
+        # Packets that continue in the next row are split
+        self.assertEqual(
+            rle.split_rows(bytes(bytearray([0x80 | 5, 7, 0x01, 1, 2])),
+                           1, 4, 2),
+            [bytes(bytearray([0x83, 7])),
+             bytes(bytearray([0x81, 7, 0x01, 1, 2]))])
+
+        # Files that end in the header or in a packet
+        for size in (10, 18 + 6):
+            with open("test_rle_operations.tga", "wb") as image_file:
+                image_file.write((image._header.to_bytes() +
+                                  b''.join(rows))[:size])
+            with self.assertRaises(pyTGA.ImageError) as context:
+                rle.read_rows("test_rle_operations.tga")
+            self.assertEqual(context.exception.errno, -33)
+
+        os.remove("test_rle_operations.tga")
+
+    def test_copy_on_write(self):
+        import pyTGA
+
+        data = [[(row, col, 0) for col in range(4)] for row in range(3)]
+        image = pyTGA.Image(data=data)
+        copy = image.copy()
+        self.assertTrue(copy._pixels.shared)
+        copy.set_pixel(1, 2, (9, 9, 9))
+        self.assertEqual(image.get_pixel(1, 2), (1, 2, 0))
+        self.assertEqual(copy.get_pixel(1, 2), (9, 9, 9))
+        self.assertEqual(copy.get_pixel(2, 3), (2, 3, 0))
+        image.set_pixel(0, 0, (7, 7, 7))
+        self.assertEqual(copy.get_pixel(0, 0), (0, 0, 0))
+
+        crop = image.crop(1, 1, 2, 2)
+        self.assertEqual(crop.get_size(), (2, 2))
+        self.assertEqual(crop.get_pixel(0, 1), (1, 2, 0))
+        flipped = crop.flip('vertical').flip('horizontal')
+        self.assertEqual(flipped.get_pixel(0, 0), (2, 2, 0))
+        self.assertEqual(flipped.get_pixels(), bytes(bytearray(
+            [2, 2, 0, 2, 1, 0, 1, 2, 0, 1, 1, 0])))
+        flipped.set_pixel(0, 0, (5, 5, 5))
+        self.assertEqual(image.get_pixel(2, 2), (2, 2, 0))
+        self.assertEqual(crop.get_pixel(1, 1), (2, 2, 0))
+        self.assertEqual(flipped.get_buffer().tobytes()[:3], b"\x05" * 3)
+
+        with self.assertRaises(pyTGA.ImageError):
+            image.crop(3, 0, 2, 1)
+        with self.assertRaises(pyTGA.ImageError):
+            image.flip('diagonal')
+
+        image.set_storage('rle')
+        self.assertEqual(image.flip('horizontal'),
+                         image.copy().set_storage('flat').flip('horizontal'))
+
+    def test_copy_after_buffer_export(self):
+        import pyTGA
+
+        data = [[(row, col, 0) for col in range(4)] for row in range(3)]
+        image = pyTGA.Image(data=data)
+        view = image.get_buffer()
+        copy = image.copy()
+        crop = image.crop(1, 1, 2, 2)
+        flipped = image.flip('horizontal')
+        self.assertFalse(copy._pixels.shared)
+        view[1, 2, 0] = 9
+        image.set_pixel(2, 2, (8, 8, 8))
+        self.assertEqual(image.get_pixel(1, 2), (9, 2, 0))
+        self.assertEqual(copy, pyTGA.Image(data=data))
+        self.assertEqual(crop.get_pixel(0, 1), (1, 2, 0))
+        self.assertEqual(crop.get_pixel(1, 1), (2, 2, 0))
+        self.assertEqual(flipped.get_pixel(1, 1), (1, 2, 0))
+        copy.set_pixel(0, 0, (7, 7, 7))
+        self.assertEqual(view[0, 0, 0], 0)
+
+        buffer = bytearray(len(image.get_pixels()))
+        image.save("test_export")
+        self.addCleanup(os.remove, "test_export.tga")
+        loaded = pyTGA.Image().load("test_export.tga", out=buffer)
+        copy = loaded.copy()
+        buffer[0] = 5
+        self.assertEqual(loaded.get_pixel(0, 0), (5, 0, 0))
+        self.assertEqual(copy.get_pixel(0, 0), (0, 0, 0))
+
+    def test_map_tiles(self):
+        import pyTGA
+
+        data = [[(row, col, row + col, 255) for col in range(5)]
+                for row in range(3)]
+        expected = [[(255 - row, 255 - col, 255 - row - col, 0)
+                     for col in range(5)] for row in range(3)]
+        expected[0][0] = expected[0][0][:3] + (0,)
+        expected[0][2] = expected[0][2][:3] + (2,)
+        expected[0][4] = expected[0][4][:3] + (4,)
+        expected[2][0] = expected[2][0][:3] + (0,)
+        expected[2][2] = expected[2][2][:3] + (2,)
+        expected[2][4] = expected[2][4][:3] + (4,)
+        tiles = [(0, 0, 2, 2), (2, 0, 2, 2), (4, 0, 1, 2),
+                 (0, 2, 2, 1), (2, 2, 2, 1), (4, 2, 1, 1)]
+
+        for workers, storage in ((0, 'flat'), (2, 'flat'), (2, 'rle')):
+            image = pyTGA.Image(data=data).set_storage(storage)
+            self.assertEqual(
+                pyTGA.parallel.map_tiles(image, _invert_tile, tile=(2, 2),
+                                         workers=workers),
+                tiles)
+            self.assertEqual(image.get_storage(), storage)
+            self.assertEqual(image, pyTGA.Image(data=expected))
+            self.assertEqual(image.get_dirty_rows(), [0, 1, 2])
+
+        with self.assertRaises(ValueError):
+            pyTGA.parallel.map_tiles(image, _invert_tile, tile=(0, 2))
+
+    def test_rle_storage(self):
+        import pyTGA
+
+        data = [[(0, 0, 0, 0)] * 300 for row in range(5)]
+        data[2][100:140] = [(255, 0, 0, 255)] * 40
+        data[3][7] = (1, 2, 3, 4)
+        pyTGA.Image(data=data).save("test_rle_storage", compress=True)
+
+        flat = pyTGA.Image().load("test_rle_storage.tga")
+        image = pyTGA.Image().load("test_rle_storage.tga", storage='rle')
+        self.assertEqual(image.get_storage(), 'rle')
+        self.assertLess(image._pixels.nbytes, flat._pixels.nbytes // 10)
+        self.assertEqual(image, flat)
+        self.assertEqual(image.get_pixel(2, 139), (255, 0, 0, 255))
+        self.assertEqual(image.get_pixel(2, 140), (0, 0, 0, 0))
+        self.assertEqual(image.get_pixel(3, 7), (1, 2, 3, 4))
+
+        image.set_pixel(2, 150, (9, 9, 9, 9))
+        flat.set_pixel(2, 150, (9, 9, 9, 9))
+        self.assertEqual(image.get_pixels(), flat.get_pixels())
+        self.assertTrue(image.get_buffer().readonly)
+
+        image.save("test_rle_storage_2", compress=True)
+        self.assertEqual(pyTGA.Image().load("test_rle_storage_2.tga"), flat)
+
+        # A row above the indexed one changes size
+        rows = pyTGA.Image(data=[[1] * 4, [2] * 4, [5, 6, 7, 8]])
+        rows.save("test_rle_storage_3", compress=True)
+        rows = pyTGA.Image().load("test_rle_storage_3.tga", storage='rle')
+        self.assertEqual(rows.get_pixel(2, 3), 8)
+        rows.set_pixel(0, 1, 9)
+        self.assertEqual(rows.get_pixel(2, 3), 8)
+        self.assertEqual([rows.get_pixel(2, col) for col in range(4)],
+                         [5, 6, 7, 8])
+        os.remove("test_rle_storage_3.tga")
+
+        self.assertEqual(image.set_storage('flat').get_storage(), 'flat')
+        self.assertEqual(image, flat)
+        self.assertEqual(flat.set_storage('rle').get_storage(), 'rle')
+        self.assertEqual(image, flat)
+
+        os.remove("test_rle_storage.tga")
+        os.remove("test_rle_storage_2.tga")
+
 if __name__ == '__main__':
     unittest.main()